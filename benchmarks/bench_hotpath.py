@@ -0,0 +1,269 @@
+"""
+Micro-benchmarks of the per-frame hot path: page decoding, null
+stripping, dict conversion and message encoding, on raw page fixtures.
+Reports ops/s, per-call latency percentiles and allocations per call,
+and saves or compares against a baseline.
+
+    python -m benchmarks.bench_hotpath
+    python -m benchmarks.bench_hotpath --save baseline.json
+    python -m benchmarks.bench_hotpath --compare baseline.json
+    python -m benchmarks.bench_hotpath --capture --source tagname
+"""
+
+import argparse
+import gc
+import json
+import mmap
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from src.codec import encode_message
+from src.pyacsharedmemory import (
+    PHYSICS_PAGE_SIZE,
+    GRAPHICS_PAGE_SIZE,
+    STATIC_PAGE_SIZE,
+    decode_physics,
+    decode_graphics,
+    decode_static,
+    read_physic_map,
+    read_graphics_map,
+    read_static_map,
+)
+from src.sinks import encode_json
+from src.sources import FileSource, create_source
+from src.synthetic import SyntheticSim
+from src.utils import dataclass_to_dict, strip_nulls_from_dataclass
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+PAGE_SIZES = {
+    "physics": PHYSICS_PAGE_SIZE,
+    "graphics": GRAPHICS_PAGE_SIZE,
+    "static": STATIC_PAGE_SIZE,
+}
+
+
+def load_fixtures(directory: str = FIXTURES) -> Dict[str, bytes]:
+    pages = {}
+    for name, size in PAGE_SIZES.items():
+        with open(os.path.join(directory, f"{name}.bin"), "rb") as fp:
+            pages[name] = fp.read()
+        if len(pages[name]) != size:
+            raise ValueError(f"{name}.bin: {len(pages[name])} bytes, expected {size}")
+    return pages
+
+
+def write_fixtures(source, directory: str = FIXTURES) -> None:
+    """
+    Dumps the current pages of a page source, e.g. the game on a rig.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name, size in PAGE_SIZES.items():
+        page = source.open_page(name, size)
+        with open(os.path.join(directory, f"{name}.bin"), "wb") as fp:
+            fp.write(page[:size])
+        page.close()
+
+
+def write_synthetic_fixtures(directory: str = FIXTURES) -> None:
+    """
+    Fixtures of a synthetic session, 10 s in (live, on track).
+    """
+    pages = tempfile.mkdtemp()
+    source = FileSource(pages)
+    sim = SyntheticSim(source)
+    sim.step(10.0, 0.01)
+    write_fixtures(source, directory)
+    sim.close()
+    shutil.rmtree(pages)
+
+
+def benchmarks(pages: Dict[str, bytes]) -> Dict[str, Callable[[], Any]]:
+    # Decoding reads from mmaps, like from shared memory
+    maps = {}
+    for name, data in pages.items():
+        maps[name] = mmap.mmap(-1, len(data))
+        maps[name][:] = data
+    physics = decode_physics(pages["physics"])
+    graphics = decode_graphics(pages["graphics"])
+    statics = decode_static(pages["static"])
+
+    def telemetry_message() -> dict:
+        # As AcUdpMqttForwarder.encode builds it, without quantizing
+        return {
+            "message_type": "telemetry",
+            "frame_tag": [physics.packed_id, graphics.packet_id],
+            "graphics_info": graphics.to_dict(),
+            "physics_info": physics.to_dict(),
+        }
+
+    message = telemetry_message()
+    return {
+        "read_physic_map": lambda: read_physic_map(maps["physics"]),
+        "read_graphics_map": lambda: read_graphics_map(maps["graphics"]),
+        "read_static_map": lambda: read_static_map(maps["static"]),
+        "strip_nulls[physics]": lambda: strip_nulls_from_dataclass(physics),
+        "strip_nulls[graphics]": lambda: strip_nulls_from_dataclass(graphics),
+        "dataclass_to_dict[static]": lambda: dataclass_to_dict(statics),
+        "PhysicsMap.to_dict": physics.to_dict,
+        "GraphicsMap.to_dict": graphics.to_dict,
+        "telemetry_message": telemetry_message,
+        "json.dumps[telemetry]": lambda: encode_json(message),
+        "encode_message[telemetry]": lambda: encode_message(message),
+    }
+
+
+def _percentile(values: list, fraction: float) -> float:
+    return values[int(fraction * (len(values) - 1))]
+
+
+def measure(func: Callable[[], Any], seconds: float = 0.5) -> dict:
+    """
+    Times single calls for `seconds` (with the GC on, as in the
+    forwarder), then measures allocations with tracemalloc: the peak of
+    bytes allocated during a call and the blocks still held after it.
+    """
+    perf_counter = time.perf_counter
+    for _ in range(100):
+        func()
+    # Cost of the timer calls themselves, taken off every sample
+    overhead = min(-perf_counter() + perf_counter() for _ in range(1000))
+
+    times = []
+    end = perf_counter() + seconds
+    while perf_counter() < end:
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start - overhead)
+    times.sort()
+    mean = sum(times) / len(times)
+
+    calls = 200
+    gc.collect()
+    tracemalloc.start()
+    peak = 0
+    for _ in range(calls):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for _ in range(calls):
+        func()
+    gc.collect()
+    retained = sys.getallocatedblocks() - blocks
+
+    return {
+        "ops": 1.0 / mean,
+        "mean_us": 1e6 * mean,
+        "p50_us": 1e6 * _percentile(times, 0.5),
+        "p90_us": 1e6 * _percentile(times, 0.9),
+        "p99_us": 1e6 * _percentile(times, 0.99),
+        "alloc_bytes": peak / calls,
+        "retained_blocks": retained / calls,
+    }
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Prints the change of p50 time and allocated bytes per benchmark,
+    returns False when any grew by more than `threshold` (a fraction).
+    """
+    if baseline.get("environment") != environment():
+        print(f"note: baseline taken on {baseline.get('environment')}")
+    ok = True
+    print(f"\n{'vs baseline':<28} {'p50':>9} {'alloc':>9}")
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<28} {'new':>9}")
+            continue
+        time_change = result["p50_us"] / old["p50_us"] - 1.0
+        alloc_change = (
+            result["alloc_bytes"] / old["alloc_bytes"] - 1.0
+            if old["alloc_bytes"]
+            else 0.0
+        )
+        regressed = time_change > threshold or alloc_change > threshold
+        ok = ok and not regressed
+        print(
+            f"{name:<28} {100 * time_change:>+8.1f}% {100 * alloc_change:>+8.1f}%"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the per-frame hot path")
+    parser.add_argument("--fixtures", default=FIXTURES, help="page fixture directory")
+    parser.add_argument(
+        "--seconds", type=float, default=0.5, help="timing per benchmark"
+    )
+    parser.add_argument("--filter", help="only benchmarks containing this")
+    parser.add_argument("--save", metavar="PATH", help="save the results as baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="percent slower or more allocations counted as a regression",
+    )
+    parser.add_argument(
+        "--capture", action="store_true", help="write fixtures from --source instead"
+    )
+    parser.add_argument("--source", help="capture: page source (default: synthetic)")
+    parser.add_argument("--path", default="/dev/shm", help="capture: page directory")
+    args = parser.parse_args()
+
+    if args.capture:
+        if args.source:
+            write_fixtures(create_source(args.source, args.path), args.fixtures)
+        else:
+            write_synthetic_fixtures(args.fixtures)
+        print(f"Wrote fixtures to {args.fixtures}")
+        return
+
+    print(
+        f"{'benchmark':<28} {'ops/s':>10} {'mean':>9} {'p50':>9} {'p90':>9} "
+        f"{'p99':>9} {'alloc/call':>11} {'kept':>6}"
+    )
+    results = {}
+    for name, func in benchmarks(load_fixtures(args.fixtures)).items():
+        if args.filter and args.filter not in name:
+            continue
+        result = results[name] = measure(func, args.seconds)
+        print(
+            f"{name:<28} {result['ops']:>10.0f} {result['mean_us']:>7.2f}us "
+            f"{result['p50_us']:>7.2f}us {result['p90_us']:>7.2f}us "
+            f"{result['p99_us']:>7.2f}us {result['alloc_bytes']:>9.0f} B "
+            f"{result['retained_blocks']:>6.2f}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as fp:
+            json.dump({"environment": environment(), "results": results}, fp, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if not compare(results, baseline, args.threshold / 100.0):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compares the generated serializers with the reflective path they replace
+(strip_nulls_from_dataclass + fields() walk) on synthetic pages.
+
+    python -m benchmarks.bench_serializers
+"""
+
+import tempfile
+import timeit
+
+from src.pyacsharedmemory import decode_physics, decode_graphics, decode_static
+from src.sources import FileSource
+from src.synthetic import SyntheticSim
+from src.utils import reflective_dataclass_to_dict, strip_nulls_from_dataclass
+
+
+def synthetic_maps() -> dict:
+    sim = SyntheticSim(FileSource(tempfile.mkdtemp()))
+    sim.step(10.0, 0.01)
+    maps = {
+        "PhysicsMap": decode_physics(sim.physicSM),
+        "GraphicsMap": decode_graphics(sim.graphicSM),
+        "StaticsMap": decode_static(sim.staticSM),
+    }
+    sim.close()
+    return maps
+
+
+def reflective(obj) -> dict:
+    strip_nulls_from_dataclass(obj)
+    return reflective_dataclass_to_dict(obj)
+
+
+def main(number: int = 20000) -> None:
+    print(f"{'map':<12} {'reflective':>12} {'generated':>12} {'speedup':>8}")
+    for name, obj in synthetic_maps().items():
+        assert reflective(obj) == obj.to_dict()
+        old = timeit.timeit(lambda: reflective(obj), number=number) / number
+        new = timeit.timeit(obj.to_dict, number=number) / number
+        print(
+            f"{name:<12} {old * 1e6:>10.2f}us {new * 1e6:>10.2f}us {old / new:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
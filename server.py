@@ -1,183 +1,489 @@
-import time
-import json
-import copy
-import socket
+import argparse
 import logging
+import time
+from typing import List, Optional, Tuple
 from src.mqtt import MqttPublisher
 from src.pyacsharedmemory import (
     acSharedMemory,
     AC_STATUS,
-    PhysicsMap,
-    read_physic_map,
-    read_graphics_map,
+    STATIC_STRUCT,
     read_static_map,
 )
+from src.codec import DeltaEncoder, compile_quantizer
+from src.metrics import Metrics
 from src.schemas import AC_EVENTS
-from src.utils import strip_nulls_from_dataclass, Config
+from src.scheduler import TickScheduler
+from src.sources import FrameSource, create_source
+from src.spool import Spool
+from src.topics import TopicGroups
+from src.sinks import Fanout, UdpSink, MqttSink, Batcher
+from src.pipeline import Pipeline
+from src.profiling import add_arguments, create_profiler, finish
+from src.recorder import Recorder, PHYSICS, GRAPHICS, STATIC
+from src.utils import Config
 
 logging.getLogger().setLevel(logging.INFO)
 
 
 class AcUdpMqttForwarder:
-    def __init__(self):
+    def __init__(self, source: Optional[FrameSource] = None):
         cfg = Config()
-        self.physics_interval = 0.01
-        self.static_interval = 1.0
         self.mqtt_enabled = cfg.get("mqtt.enabled")
         self.udp_enabled = cfg.get("udp.enabled")
         self.save_output = cfg.get("output.save", True)
 
+        # Per-stage latency histograms, counters and gauges
+        self.metrics = Metrics()
+        self.metrics_port = cfg.get("metrics.port")
+        self.metrics_host = cfg.get("metrics.host", "127.0.0.1")
+        self.metrics_log = cfg.get("metrics.log", True)
+
         # UDP setup
         self.udp_host = cfg.get("udp.host", "127.0.0.1")
         self.udp_port = cfg.get("udp.port", 9002)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-        # Shared memory
-        self.asm = acSharedMemory()
+        # Shared memory (a replay passes its own source)
+        if source is None:
+            source = create_source(
+                cfg.get("shared_memory.source", "tagname"),
+                cfg.get("shared_memory.path", "/dev/shm"),
+            )
+        self.asm = acSharedMemory(
+            source,
+            consistent_reads=cfg.get("shared_memory.consistent_reads", False),
+            read_retries=cfg.get("shared_memory.read_retries", 3),
+            physics_channels=cfg.get("telemetry.physics_channels"),
+            graphics_channels=cfg.get("telemetry.graphics_channels"),
+        )
         self.status = AC_STATUS.AC_OFF
         self.event = AC_EVENTS.AC_IDLE
+        self.physics = None
+        self.graphics = None
+        self.statics = None
+        # (physics, graphics) packet IDs of the last telemetry frame
+        self.frame_tag = (0, 0)
+
+        # Fixed-rate sampling per page on absolute deadlines
+        self.scheduler = TickScheduler(cfg.get("scheduler.spin", 0.0002))
+        self.scheduler.add("static", cfg.get("scheduler.static_rate", 1))
+        # Sample physics slower after a second without new frames
+        self.physics_rate = cfg.get("scheduler.physics_rate", 333)
+        self.idle_physics_rate = cfg.get("scheduler.idle_physics_rate", 20)
+        self.physics_idle_ticks = 0
+        self.scheduler.add("physics", self.physics_rate)
+        self.scheduler.add("graphics", cfg.get("scheduler.graphics_rate", 60))
+        stats_interval = cfg.get("scheduler.stats_interval", 10)
+        if stats_interval:
+            self.scheduler.add("stats", 1.0 / stats_interval)
 
         # MQTT setup
         mqtt_host = cfg.get("mqtt.host", "127.0.0.1")
         mqtt_port = cfg.get("mqtt.port", 9001)
         event_topic = cfg.get("mqtt.event_topic", "ac/events")
         telemetry_topic = cfg.get("mqtt.telemetry_topic", "ac/telemetry")
+        keyframe_topic = cfg.get("mqtt.keyframe_topic", "ac/keyframe_request")
+        session_topic = cfg.get("mqtt.session_topic", "ac/session")
+
+        # Messages published while the broker is unreachable
+        spool = None
+        if self.mqtt_enabled and cfg.get("mqtt.spool.enabled", True):
+            spool = Spool(
+                cfg.get("mqtt.spool.path", "mqtt_spool.bin"),
+                int(cfg.get("mqtt.spool.max_mb", 64) * 1024 * 1024),
+                cfg.get("mqtt.spool.telemetry_every", 10),
+            )
 
         self.mqtt_pub = MqttPublisher(
             host=mqtt_host,
             port=mqtt_port,
             event_topic=event_topic,
             telemetry_topic=telemetry_topic,
+            keyframe_topic=keyframe_topic,
+            session_topic=session_topic,
+            spool=spool,
+            backoff_min=cfg.get("mqtt.backoff_min", 1.0),
+            backoff_max=cfg.get("mqtt.backoff_max", 60.0),
+            drain_rate=cfg.get("mqtt.spool.drain_rate", 200),
+        )
+
+        # Per-channel rounding of published floats
+        self.quantize = None
+        if cfg.get("precision.enabled", False):
+            self.quantize = compile_quantizer(
+                cfg.get("precision.default"),
+                cfg.get("precision.physics"),
+                cfg.get("precision.graphics"),
+            )
+
+        # Per-group MQTT subtopics, each at its own rate
+        self.topic_groups = None
+        if self.mqtt_enabled and cfg.get("mqtt.topic_groups.enabled", False):
+            self.topic_groups = TopicGroups(cfg.get("mqtt.topic_groups.groups") or {})
+        self.session = None
+
+        # Telemetry deltas for the network sinks, with periodic keyframes
+        delta = cfg.get("delta.enabled", False)
+        self.delta_encoder = None
+        if delta:
+            self.delta_encoder = DeltaEncoder(cfg.get("delta.keyframe_interval", 100))
+            self.mqtt_pub.on_keyframe_request = self.delta_encoder.request_keyframe
+
+        # Every message is encoded once per wire format and fanned out
+        sinks = []
+        if self.udp_enabled:
+            sinks.append(
+                UdpSink(
+                    self.udp_host,
+                    self.udp_port,
+                    cfg.get("udp.format", "json"),
+                    delta=delta,
+                )
+            )
+        if self.mqtt_enabled:
+            mqtt_format = cfg.get("mqtt.format", "json")
+            batcher = None
+            if cfg.get("mqtt.batch.enabled", False):
+                max_ms = cfg.get("mqtt.batch.max_ms", 100)
+                batcher = Batcher(
+                    mqtt_format,
+                    max_frames=cfg.get("mqtt.batch.max_frames", 10),
+                    window=max_ms / 1000.0 if max_ms else None,
+                )
+            sinks.append(
+                MqttSink(
+                    self.mqtt_pub,
+                    mqtt_format,
+                    delta=delta,
+                    full_telemetry=cfg.get("mqtt.topic_groups.full_telemetry", True)
+                    or self.topic_groups is None,
+                    batcher=batcher,
+                )
+            )
+        self.pipeline = Pipeline(
+            Fanout(sinks, self.metrics),
+            self.encode,
+            queue_size=cfg.get("pipeline.queue_size", 64),
+            policy=cfg.get("pipeline.policy", "drop_oldest"),
+            sink_queue_size=cfg.get("pipeline.sink_queue_size", 256),
+            sink_policy=cfg.get("pipeline.sink_policy", "drop_oldest"),
+            metrics=self.metrics,
         )
+        self.register_metrics()
 
-    def run(self):
+        # Full-rate session recording of the raw pages
+        self.recorder = None
+        if self.save_output:
+            self.recorder = Recorder(
+                cfg.get("output.directory", "recordings"),
+                max_bytes=cfg.get("output.max_mb", 256) * 1024 * 1024,
+                chunk_bytes=cfg.get("output.chunk_kb", 256) * 1024,
+                chunk_seconds=cfg.get("output.chunk_seconds", 1.0),
+                compress=cfg.get("output.compress", True),
+                fsync_interval=cfg.get("output.fsync_interval", 5.0),
+            )
+
+    def register_metrics(self):
         """
-        Main loop that handles:
-          - Reading shared memory
-          - Sending UDP messages (event + telemetry)
-          - Attempting MQTT connections + publishing
+        Creates the metrics of the reader and encoder stages, and exports
+        the counters kept by the shared memory reader and MQTT publisher.
         """
-        try:
-            last_physics_read = 0.0
-            last_static_read = 0.0
-
-            while True:
-                # Attempt connection
-                if self.mqtt_enabled:
-                    self.mqtt_pub.try_connect()
-
-                prev_status = self.status
-                now = time.time()
-
-                if (now - last_physics_read) >= self.physics_interval:
-                    physics = read_physic_map(self.asm.physicSM)
-                    graphics = read_graphics_map(self.asm.graphicSM)
-
-                if (now - last_static_read) >= self.static_interval:
-                    statics = read_static_map(self.asm.staticSM)
-
-                if physics.packed_id == self.asm.last_physicsID or (
-                    self.asm.physics_old is not None
-                    and PhysicsMap.is_equal(self.asm.physics_old, physics)
-                ):
-                    physics = None
-
-                else:
-                    self.asm.physics_old = copy.deepcopy(physics)
-
-                # When no game is played, switch to idle mode
-                if physics is None:
-                    self.event = AC_EVENTS.AC_IDLE
-                else:
-                    # Keep track of status changes
-                    self.status = graphics.status
-                    if self.status != prev_status:
-                        self.event = AC_EVENTS.AC_IDLE
-                        if self.status == AC_STATUS.AC_OFF:
-                            self.event = AC_EVENTS.AC_STOP_RACE
-                        elif self.status == AC_STATUS.AC_LIVE:
-                            if prev_status == AC_STATUS.AC_OFF:
-                                self.event = AC_EVENTS.AC_START_RACE
-                            elif prev_status == AC_STATUS.AC_PAUSE:
-                                self.event = AC_EVENTS.AC_RESUME_RACE
-                        elif self.status == AC_STATUS.AC_PAUSE:
-                            self.event = AC_EVENTS.AC_PAUSE_RACE
-                        elif self.status == AC_STATUS.AC_REPLAY:
-                            self.event = AC_EVENTS.AC_REPLAY_EVENT
-                        else:
-                            logging.warning(f"unk status: {prev_status}-{self.status}")
-                            self.event = AC_EVENTS.AC_UNKNOWN
-
-                    # Shared memory has some empty bits allocated
-                    strip_nulls_from_dataclass(statics)
-                    strip_nulls_from_dataclass(graphics)
-                    strip_nulls_from_dataclass(physics)
-                    physics_info = physics.to_dict()
-                    graphics_info = graphics.to_dict()
-                    static_info = statics.to_dict()
-
-                    # If status changed, send an event message (UDP and/or MQTT)
-                    if self.status != prev_status and physics is not None:
-                        logging.info(f"Status change {self.status}")
-                        static_info["air_temp"] = physics_info.get("air_temp")
-                        static_info["road_temp"] = physics_info.get("road_temp")
-                        static_info["water_temp"] = physics_info.get("water_temp")
-                        static_info["tyre_compound"] = graphics_info.get(
-                            "tyre_compound"
-                        )
-
-                        data = {
-                            "message_type": "event_change",
-                            "event": str(self.event),
-                            "static_info": static_info,
-                        }
-
-                        if self.udp_enabled:
-                            # Send via UDP
-                            msg_bytes = json.dumps(data).encode("utf-8")
-                            self.sock.sendto(msg_bytes, (self.udp_host, self.udp_port))
-                        if self.mqtt_enabled:
-                            # Send via MQTT
-                            self.mqtt_pub.publish_event(data)
-
-                    # If live, send telemetry (UDP and/or MQTT)
-                    if graphics.status == AC_STATUS.AC_LIVE:
-                        data = {
-                            "message_type": "telemetry",
-                            "graphics_info": graphics_info,
-                            "physics_info": physics_info,
-                        }
-                        if self.udp_enabled:
-                            # Send via UDP
-                            msg_bytes = json.dumps(data).encode("utf-8")
-                            self.sock.sendto(msg_bytes, (self.udp_host, self.udp_port))
-
-                        if self.mqtt_enabled:
-                            # Send via MQTT
-                            self.mqtt_pub.publish_telemetry(data)
-
-                        if self.save_output:
-                            with open("telemetry.json", "w") as fp:
-                                json.dump(data, fp, indent=4)
-
-                # Sleep to avoid busy-wait
-                time.sleep(0.001)
+        metrics = self.metrics
+        self.read_physics_time = metrics.stage("read_physics")
+        self.read_graphics_time = metrics.stage("read_graphics")
+        self.to_dict_time = metrics.stage("to_dict")
+        self.quantize_time = metrics.stage("quantize")
+        self.delta_time = metrics.stage("delta")
+        self.topic_groups_time = metrics.stage("topic_groups")
+        self.frames_read = metrics.counter(
+            "frames_read_total", "New physics frames read from shared memory"
+        )
+        self.frames_published = metrics.counter(
+            "frames_submitted_total", "Telemetry frames handed to the pipeline"
+        )
+        metrics.counter(
+            "duplicate_frames_total",
+            "Physics packet ID changes without new data",
+            lambda: self.asm.physics_buffer.duplicates,
+        )
+        for page, buffer in (
+            ("physics", self.asm.physics_buffer),
+            ("graphics", self.asm.graphics_buffer),
+        ):
+            metrics.counter(
+                "torn_reads_total",
+                "Page copies retried because the page changed mid-copy",
+                lambda buffer=buffer: buffer.torn_reads,
+                page=page,
+            )
+        metrics.counter(
+            "mqtt_disconnects_total",
+            "Lost MQTT broker connections",
+            lambda: self.mqtt_pub.disconnects,
+        )
+        metrics.gauge(
+            "mqtt_connected",
+            "1 while connected to the MQTT broker",
+            lambda: int(self.mqtt_pub.is_connected),
+        )
+        for index, page in enumerate(("physics", "graphics")):
+            metrics.gauge(
+                "frame_tag_packet_id",
+                "Packet ID per page of the last telemetry frame submitted",
+                lambda index=index: self.frame_tag[index],
+                page=page,
+            )
+        self.jitter_gauges = {
+            name: metrics.gauge(
+                "tick_jitter_p99_seconds",
+                "p99 tick lateness over the last stats interval",
+                stream=name,
+            )
+            for name in self.scheduler.streams
+            if name != "stats"
+        }
 
+    def run(self, ticks: Optional[int] = None, seconds: Optional[float] = None):
+        """
+        Runs the pipeline: this thread samples shared memory (sample), an
+        encoder thread builds and encodes the messages (encode) and every
+        sink sends from its own thread, behind bounded queues.
+        """
+        self.start()
+        try:
+            self.sample(ticks, seconds)
         except KeyboardInterrupt:
             pass
         finally:
             self.cleanup()
 
+    def start(self):
+        """
+        Starts the encoder, sink, recorder and MQTT threads, and the
+        metrics endpoint.
+        """
+        if self.metrics_port:
+            self.metrics.serve(self.metrics_host, self.metrics_port)
+        self.pipeline.start()
+        if self.recorder is not None:
+            self.recorder.start()
+        if self.mqtt_enabled:
+            self.mqtt_pub.start()
+
+    def sample(self, ticks: Optional[int] = None, seconds: Optional[float] = None):
+        """
+        Reader loop, driven by the tick scheduler. Stops after `ticks`
+        ticks or `seconds` seconds, when given.
+        """
+        end = time.monotonic() + seconds if seconds else None
+        count = 0
+        while ticks is None or count < ticks:
+            self.tick(self.scheduler.wait())
+            count += 1
+            if end is not None and time.monotonic() >= end:
+                return
+
+    def tick(self, due: List[str]):
+        """
+        Handles the due streams:
+          - static ticks: re-read the static page
+          - physics ticks: read new physics frames
+          - graphics ticks, and new physics frames when the graphics page
+            changed: track the session status, queue events on changes
+          - telemetry for every new physics frame while live
+        """
+        if "static" in due:
+            self.statics = read_static_map(self.asm.staticSM)
+            if self.recorder is not None:
+                self.recorder.record(STATIC, self.asm.staticSM[: STATIC_STRUCT.size])
+            if self.graphics is not None:
+                self.pipeline.submit("session", (self.statics, self.graphics))
+
+        # Only decode when the raw physics page changed
+        new_physics = None
+        if "physics" in due:
+            start = time.perf_counter()
+            new_physics = self.asm.read_physics()
+            self.track_physics_rate(new_physics is not None)
+            if new_physics is not None:
+                self.read_physics_time.observe(time.perf_counter() - start)
+                self.frames_read.inc()
+                self.physics = new_physics
+                if self.recorder is not None:
+                    self.recorder.record(PHYSICS, self.asm.physics_buffer.data)
+
+        # Every new physics frame goes out with the graphics page as it is
+        # now, not as it was at the last graphics tick
+        graphics = None
+        start = time.perf_counter()
+        if "graphics" in due:
+            graphics = self.asm.read_graphics()
+        elif new_physics is not None:
+            graphics = self.asm.refresh_graphics()
+        if graphics is not None:
+            self.read_graphics_time.observe(time.perf_counter() - start)
+            self.graphics = graphics
+            if self.recorder is not None:
+                self.recorder.record(GRAPHICS, self.asm.graphics_buffer.data)
+            self.update_status()
+
+        # If live, send telemetry (UDP and/or MQTT)
+        if (
+            new_physics is not None
+            and self.graphics is not None
+            and self.graphics.status == AC_STATUS.AC_LIVE
+        ):
+            self.frame_tag = self.asm.frame_tag
+            self.pipeline.submit(
+                "telemetry", (self.graphics, self.physics, self.frame_tag)
+            )
+            self.frames_published.inc()
+
+        if "stats" in due:
+            for name, stats in self.scheduler.log_stats().items():
+                if name in self.jitter_gauges:
+                    self.jitter_gauges[name].set(stats["jitter_p99_us"] / 1e6)
+            self.pipeline.log_stats()
+            if self.metrics_log:
+                logging.info(self.metrics.summary())
+
+    def track_physics_rate(self, new_frame: bool):
+        """
+        Drops the physics rate when the page stops changing (game paused,
+        closed or in a menu) and restores it on the next new frame.
+        """
+        if new_frame:
+            if self.physics_idle_ticks >= self.physics_rate:
+                self.scheduler.set_rate("physics", self.physics_rate)
+            self.physics_idle_ticks = 0
+            return
+
+        self.physics_idle_ticks += 1
+        if self.physics_idle_ticks == self.physics_rate:
+            self.scheduler.set_rate("physics", self.idle_physics_rate)
+
+    def update_status(self):
+        """
+        Keeps track of status changes and sends an event message on each.
+        """
+        # Events carry physics values, wait for the first physics frame
+        if self.physics is None:
+            return
+
+        prev_status = self.status
+        self.status = self.graphics.status
+        if self.status == prev_status:
+            return
+
+        self.event = AC_EVENTS.AC_IDLE
+        if self.status == AC_STATUS.AC_OFF:
+            self.event = AC_EVENTS.AC_STOP_RACE
+        elif self.status == AC_STATUS.AC_LIVE:
+            if prev_status == AC_STATUS.AC_OFF:
+                self.event = AC_EVENTS.AC_START_RACE
+            elif prev_status == AC_STATUS.AC_PAUSE:
+                self.event = AC_EVENTS.AC_RESUME_RACE
+        elif self.status == AC_STATUS.AC_PAUSE:
+            self.event = AC_EVENTS.AC_PAUSE_RACE
+        elif self.status == AC_STATUS.AC_REPLAY:
+            self.event = AC_EVENTS.AC_REPLAY_EVENT
+        else:
+            logging.warning(f"unk status: {prev_status}-{self.status}")
+            self.event = AC_EVENTS.AC_UNKNOWN
+
+        logging.info(f"Status change {self.status}")
+        self.pipeline.submit(
+            "event", (self.event, self.statics, self.physics, self.graphics)
+        )
+
+    def encode(self, kind: str, item: tuple) -> List[Tuple[str, dict, Optional[dict]]]:
+        """
+        Builds the messages of a sampled frame, on the encoder thread.
+        Returns (kind, message, delta) for each, the delta is only set for
+        telemetry with delta enabled.
+        """
+        if kind == "session":
+            statics, graphics = item
+            data = {
+                "message_type": "session",
+                "session_type": graphics.session_type.name,
+                "tyre_compound": graphics.tyre_compound,
+                "static_info": statics.to_dict(),
+            }
+            # Retained, so only sent when it changed
+            if data == self.session:
+                return []
+            self.session = data
+            return [("session", data, None)]
+
+        if kind == "event":
+            event, statics, physics, graphics = item
+            static_info = statics.to_dict()
+            static_info["air_temp"] = physics.air_temp
+            static_info["road_temp"] = physics.road_temp
+            # Not in the physics page, kept as null for subscribers reading it
+            static_info["water_temp"] = getattr(physics, "water_temp", None)
+            static_info["tyre_compound"] = graphics.tyre_compound
+
+            data = {
+                "message_type": "event_change",
+                "event": str(event),
+                "static_info": static_info,
+            }
+            return [("event", data, None)]
+
+        graphics, physics, frame_tag = item
+        start = time.perf_counter()
+        data = {
+            "message_type": "telemetry",
+            # Packet IDs of the physics and graphics pages of this frame
+            "frame_tag": list(frame_tag),
+            "graphics_info": graphics.to_dict(),
+            "physics_info": physics.to_dict(),
+        }
+        done = time.perf_counter()
+        self.to_dict_time.observe(done - start)
+        if self.quantize is not None:
+            start = done
+            self.quantize(data)
+            done = time.perf_counter()
+            self.quantize_time.observe(done - start)
+        delta = None
+        if self.delta_encoder is not None:
+            start = done
+            delta = self.delta_encoder.encode(data)
+            done = time.perf_counter()
+            self.delta_time.observe(done - start)
+        messages = [("telemetry", data, delta)]
+        if self.topic_groups is not None:
+            start = done
+            for group, partial in self.topic_groups.split(data):
+                messages.append((f"telemetry/{group}", partial, None))
+            self.topic_groups_time.observe(time.perf_counter() - start)
+        return messages
+
     def cleanup(self):
         """
         Cleanly shuts down resources on exit.
         """
+        self.pipeline.close()
+        if self.recorder is not None:
+            self.recorder.close()
         self.asm.close()
-        self.sock.close()
         self.mqtt_pub.close()
+        self.metrics.close()
         logging.info("Exiting cleanly...")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward AC telemetry")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    profiler = create_profiler(args)
     forwarder = AcUdpMqttForwarder()
-    forwarder.run()
+    if profiler is not None:
+        # Before the pipeline threads start, so they are profiled too
+        profiler.start()
+    forwarder.run(args.profile_ticks, args.profile_seconds)
+    if profiler is not None:
+        finish(profiler, args.profile_out)
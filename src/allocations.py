@@ -0,0 +1,317 @@
+import argparse
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from src.recorder import PAGE_NAMES, PHYSICS, GRAPHICS, STATIC
+from src.replay import Frame, dump_frames, recording_frames
+from src.sinks import Fanout, Sink
+from src.sources import MemorySource
+from src.synthetic import SyntheticSim, STATUS_CYCLE
+from src.utils import Config
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Hot path stages, in order: reading and decoding the pages (tick, with
+# the null stripping of strings), building the messages, encoding them
+STAGES = ("decode", "dict", "encode")
+
+# The measured forwarder sends, spools, records and serves nothing
+MEASUREMENT_SETTINGS = {
+    "mqtt.enabled": False,
+    "mqtt.spool.enabled": False,
+    "udp.enabled": False,
+    "output.save": False,
+    "metrics.port": None,
+}
+
+
+def synthetic_frames(count: int, rate: float = 333.0) -> Iterator[Frame]:
+    """
+    `count` live frames of the synthetic sim, from the start of its first
+    live period.
+    """
+    sim = SyntheticSim(MemorySource(), rate=rate)
+    start = STATUS_CYCLE[0][1]
+    period = 1.0 / rate
+    for index in range(count):
+        t = start + index * period
+        sim.step(t, period)
+        yield t, [
+            (PHYSICS, sim.physicSM[:]),
+            (GRAPHICS, sim.graphicSM[:]),
+            (STATIC, sim.staticSM[:]),
+        ]
+
+
+class EncodeOnlySink(Sink):
+    """
+    Takes every kind of message in one wire format and drops it, so the
+    Fanout still encodes what the configured sinks would get.
+    """
+
+    def __init__(self, wire_format: str, delta: bool = False):
+        self.wire_format = wire_format
+        self.delta = delta
+
+    def accepts(self, kind: str) -> bool:
+        return True
+
+    def send(self, kind: str, payload: bytes, stamp=None) -> None:
+        pass
+
+
+def create_forwarder(source: MemorySource):
+    """
+    An AcUdpMqttForwarder over `source` with MEASUREMENT_SETTINGS, whose
+    Fanout encodes in the wire formats of the enabled MQTT/UDP sinks
+    (JSON when there are none).
+    """
+    # The forwarder lives in server.py, at the top of the repo
+    from server import AcUdpMqttForwarder
+
+    cfg = Config()
+    formats = [
+        cfg.get(f"{name}.format", "json")
+        for name in ("mqtt", "udp")
+        if cfg.get(f"{name}.enabled")
+    ]
+    delta = bool(cfg.get("delta.enabled", False))
+    with cfg.override(MEASUREMENT_SETTINGS):
+        forwarder = AcUdpMqttForwarder(source)
+    sinks = [
+        EncodeOnlySink(wire_format, delta)
+        for wire_format in dict.fromkeys(formats or ["json"])
+    ]
+    forwarder.pipeline.fanout = Fanout(sinks)
+    return forwarder
+
+
+class AllocationReport:
+    """
+    Runs frames through an AcUdpMqttForwarder on this thread, stage by
+    stage, with tracemalloc on. Per frame and stage it takes the peak of
+    memory allocated during the stage (the churn the GC and allocator
+    see) and what the stage left allocated (its output); for one frame
+    it lists the lines that allocated that output. GC collections and
+    pauses are counted through gc.callbacks. Sending is not included:
+    its allocations are the sink libraries'.
+    """
+
+    def __init__(self, forwarder, source: MemorySource, warmup: int = 100):
+        self.forwarder = forwarder
+        self.pages = [source.pages[name] for name in PAGE_NAMES]
+        self.warmup = warmup
+
+        self.frames = 0
+        self.peaks: Dict[str, List[int]] = {stage: [] for stage in STAGES}
+        self.output: Dict[str, int] = dict.fromkeys(STAGES, 0)
+        self.top_lines: Dict[str, list] = {}
+        self.kept_blocks = 0
+        self.gc_pauses: Dict[int, List[float]] = {0: [], 1: [], 2: []}
+        self._gc_start = 0.0
+        self._sample_frame = None
+        # Leave out what the snapshots themselves allocate
+        self._filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+    def _gc_callback(self, phase: str, info: dict) -> None:
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self.frames > self.warmup:
+            pause = time.perf_counter() - self._gc_start
+            self.gc_pauses[info["generation"]].append(pause)
+
+    def measure(self, stage: str, func, *args):
+        snapshot = self.frames == self._sample_frame
+        if snapshot:
+            before_snapshot = tracemalloc.take_snapshot().filter_traces(self._filters)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = func(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        if self.frames > self.warmup:
+            self.peaks[stage][-1] += peak - before
+            self.output[stage] += current - before
+        if snapshot:
+            after = tracemalloc.take_snapshot().filter_traces(self._filters)
+            stats = after.compare_to(before_snapshot, "lineno")
+            self.top_lines.setdefault(stage, []).extend(
+                stat for stat in stats if stat.size_diff > 0
+            )
+        return result
+
+    def run(self, frames: Iterable[Frame], count: int) -> None:
+        forwarder = self.forwarder
+        pipeline = forwarder.pipeline
+        streams = forwarder.scheduler.streams
+        periods = {name: streams[name].period for name in ("static", "graphics")}
+        deadlines = None
+        self._sample_frame = self.warmup + count // 2
+
+        gc.callbacks.append(self._gc_callback)
+        tracemalloc.start()
+        try:
+            for timestamp, records in frames:
+                if deadlines is None:
+                    deadlines = dict.fromkeys(periods, timestamp)
+                due = []
+                for page, data in records:
+                    self.pages[page][: len(data)] = data
+                    if page == PHYSICS:
+                        due.append("physics")
+                for name, period in periods.items():
+                    if timestamp >= deadlines[name]:
+                        due.append(name)
+                        deadlines[name] = max(deadlines[name] + period, timestamp)
+                if "physics" not in due:
+                    continue
+
+                self.frames += 1
+                if self.frames == self.warmup + 1:
+                    gc.collect()
+                    blocks = sys.getallocatedblocks()
+                for stage in STAGES:
+                    self.peaks[stage].append(0)
+                self.measure("decode", forwarder.tick, due)
+                while len(pipeline.queue):
+                    kind, item, _ = pipeline.queue.get(0)
+                    messages = self.measure("dict", forwarder.encode, kind, item)
+                    for message in messages:
+                        self.measure("encode", pipeline.fanout.encode, *message)
+                    del messages
+                if self.frames >= self.warmup + count:
+                    break
+        finally:
+            tracemalloc.stop()
+            gc.callbacks.remove(self._gc_callback)
+        if self.frames > self.warmup:
+            gc.collect()
+            self.kept_blocks = sys.getallocatedblocks() - blocks
+        # Only the measured frames
+        for stage in STAGES:
+            self.peaks[stage] = self.peaks[stage][self.warmup :]
+
+    def per_frame(self) -> Dict[str, float]:
+        """
+        Mean bytes allocated per frame, per stage and in total ("frame").
+        """
+        measured = len(self.peaks["decode"]) or 1
+        result = {stage: sum(self.peaks[stage]) / measured for stage in STAGES}
+        result["frame"] = sum(result.values())
+        return result
+
+    def report(self, top: int = 5) -> List[str]:
+        measured = len(self.peaks["decode"])
+        if not measured:
+            return ["[Allocs] No frames measured"]
+        means = self.per_frame()
+        lines = [
+            f"[Allocs] {measured} frames (after {self.warmup} warm-up): "
+            f"{means['frame'] / 1024:.1f} KiB allocated per frame, "
+            f"{self.kept_blocks / measured:.2f} blocks kept per frame"
+        ]
+        for stage in STAGES:
+            peaks = sorted(self.peaks[stage])
+            lines.append(
+                f"[Allocs] {stage}: mean {means[stage] / 1024:.1f} KiB, "
+                f"p99 {peaks[int(0.99 * (len(peaks) - 1))] / 1024:.1f} KiB per frame, "
+                f"output {self.output[stage] / measured / 1024:.1f} KiB"
+            )
+            stats = sorted(self.top_lines.get(stage, []), key=lambda s: -s.size_diff)
+            for stat in stats[:top]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"[Allocs]     {os.path.basename(frame.filename)}:{frame.lineno}: "
+                    f"{stat.size_diff} B in {stat.count_diff} blocks"
+                )
+        for generation, pauses in self.gc_pauses.items():
+            if not pauses:
+                continue
+            pauses = sorted(pauses)
+            lines.append(
+                f"[Allocs] GC gen{generation}: "
+                f"{1000 * len(pauses) / measured:.1f} collections per 1000 frames, "
+                f"pause p50 {1e6 * pauses[len(pauses) // 2]:.0f}us "
+                f"max {1e6 * pauses[-1]:.0f}us"
+            )
+        return lines
+
+
+def measure_frames(
+    frames: Iterable[Frame], count: int, warmup: int = 100
+) -> AllocationReport:
+    """
+    Runs `count` frames after `warmup` through a measurement forwarder
+    and returns the report.
+    """
+    source = MemorySource()
+    forwarder = create_forwarder(source)
+    try:
+        report = AllocationReport(forwarder, source, warmup)
+        report.run(frames, count)
+    finally:
+        forwarder.cleanup()
+    return report
+
+
+def check_budget(per_frame: Dict[str, float], budget: dict) -> List[str]:
+    """
+    Stages (and "frame") over their budget in KiB per frame.
+    """
+    over = []
+    for name, limit in (budget or {}).items():
+        if limit is None or name not in per_frame:
+            continue
+        if per_frame[name] > limit * 1024:
+            over.append(
+                f"{name} {per_frame[name] / 1024:.1f} KiB > {limit} KiB per frame"
+            )
+    return over
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Allocations per frame and stage of the forwarder hot path"
+    )
+    parser.add_argument(
+        "--frames", type=int, default=2000, help="frames to measure after warm-up"
+    )
+    parser.add_argument("--warmup", type=int, default=100, help="frames not measured")
+    parser.add_argument(
+        "--replay", nargs="+", help="recordings (.acrec) or a page dump instead"
+    )
+    parser.add_argument("--dump-rate", type=float, default=333.0)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with status 1 when over the allocations budget in config.yaml",
+    )
+    args = parser.parse_args()
+
+    count = args.warmup + args.frames
+    if not args.replay:
+        frames = synthetic_frames(count)
+    elif os.path.splitext(args.replay[0])[1] == ".acrec":
+        frames = recording_frames(args.replay)
+    else:
+        frames = dump_frames(args.replay[0], args.dump_rate)
+
+    report = measure_frames(frames, args.frames, args.warmup)
+    for line in report.report():
+        logging.info(line)
+
+    if args.check:
+        over = check_budget(report.per_frame(), Config().get("allocations.budget"))
+        for line in over:
+            logging.error(f"[Allocs] Over budget: {line}")
+        if over:
+            sys.exit(1)
+        logging.info("[Allocs] Within budget")
+
+
+if __name__ == "__main__":
+    main()
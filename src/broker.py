@@ -0,0 +1,377 @@
+import argparse
+import base64
+import hashlib
+import logging
+import socket
+import socketserver
+import struct
+import threading
+from typing import Dict, Optional, Set
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Minimal MQTT 3.1.1 broker, over websockets (like the forwarder and the
+# client use) or plain TCP. QoS 0 only (QoS 1 publishes are acknowledged
+# and forwarded as QoS 0), retained messages, + and # wildcards.
+# Meant for local testing, not for production use.
+CONNECT = 1
+PUBLISH = 3
+SUBSCRIBE = 8
+UNSUBSCRIBE = 10
+PINGREQ = 12
+DISCONNECT = 14
+
+CONNACK = b"\x20\x02\x00\x00"
+PINGRESP = b"\xd0\x00"
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+UINT16 = struct.Struct("!H")
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def encode_packet(first_byte: int, body: bytes) -> bytes:
+    """
+    Fixed header (type/flags, variable length remaining length) + body.
+    """
+    header = bytearray([first_byte])
+    length = len(body)
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(header) + body
+
+
+def encode_string(value: bytes) -> bytes:
+    return UINT16.pack(len(value)) + value
+
+
+class Connection(socketserver.BaseRequestHandler):
+    """
+    One client connection. Websocket clients are recognised by their
+    HTTP upgrade request, anything else is treated as plain MQTT.
+    """
+
+    def setup(self) -> None:
+        self.broker: StandInBroker = self.server.broker
+        # Changed by this connection's thread, read by publishing threads
+        self.subscriptions: Set[str] = set()
+        self.subscriptions_lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.websocket = False
+        self.buffer = bytearray()
+
+    def handle(self) -> None:
+        self.broker.add_connection(self)
+        try:
+            first = self.request.recv(4096)
+            if first.startswith(b"GET "):
+                self.websocket_handshake(bytes(first))
+            else:
+                self.buffer += first
+            while self.read_packets():
+                data = self.recv_websocket() if self.websocket else self.recv_raw()
+                if data is None:
+                    return
+                self.buffer += data
+        except OSError:
+            pass
+        finally:
+            self.broker.remove_connection(self)
+
+    # Transport
+
+    def recv_exact(self, size: int) -> Optional[bytes]:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return bytes(data)
+
+    def recv_raw(self) -> Optional[bytes]:
+        return self.request.recv(65536) or None
+
+    def websocket_handshake(self, request: bytes) -> None:
+        while b"\r\n\r\n" not in request:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                raise OSError("Connection closed during handshake")
+            request += chunk
+        head, _, rest = request.partition(b"\r\n\r\n")
+        headers = {}
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip()
+
+        accept = base64.b64encode(
+            hashlib.sha1(headers[b"sec-websocket-key"] + WS_GUID).digest()
+        )
+        response = (
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n"
+        )
+        if b"sec-websocket-protocol" in headers:
+            response += b"Sec-WebSocket-Protocol: mqtt\r\n"
+        self.request.sendall(response + b"\r\n")
+        self.websocket = True
+        if rest:
+            # Bytes that arrived with the handshake start the first frame
+            self.request = _Prefixed(self.request, rest)
+
+    def recv_websocket(self) -> Optional[bytes]:
+        """
+        Reads one websocket frame and returns its (unmasked) payload.
+        """
+        header = self.recv_exact(2)
+        if header is None:
+            return None
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = UINT16.unpack(self.recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self.recv_exact(8))[0]
+        mask = self.recv_exact(4) if header[1] & 0x80 else None
+        payload = self.recv_exact(length) if length else b""
+        if payload is None:
+            return None
+        if mask:
+            full_mask = (mask * (length // 4 + 1))[:length]
+            payload = (
+                int.from_bytes(payload, "little") ^ int.from_bytes(full_mask, "little")
+            ).to_bytes(length, "little")
+
+        if opcode == 0x8:
+            return None
+        if opcode == 0x9:
+            self.send_frame(payload, opcode=0xA)
+            return b""
+        if opcode == 0xA:
+            return b""
+        return payload
+
+    def send_frame(self, data: bytes, opcode: int = 0x2) -> None:
+        length = len(data)
+        if length < 126:
+            header = bytes([0x80 | opcode, length])
+        elif length < 65536:
+            header = bytes([0x80 | opcode, 126]) + UINT16.pack(length)
+        else:
+            header = bytes([0x80 | opcode, 127]) + struct.pack("!Q", length)
+        self.request.sendall(header + data)
+
+    def send(self, packet: bytes) -> None:
+        with self.send_lock:
+            try:
+                if self.websocket:
+                    self.send_frame(packet)
+                else:
+                    self.request.sendall(packet)
+            except OSError:
+                pass
+
+    # MQTT
+
+    def read_packets(self) -> bool:
+        """
+        Handles every complete packet in the buffer, returns False when
+        the client disconnected.
+        """
+        buffer = self.buffer
+        while len(buffer) >= 2:
+            length = 0
+            multiplier = 1
+            index = 1
+            while True:
+                if index >= len(buffer):
+                    return True
+                byte = buffer[index]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                index += 1
+                if not byte & 0x80:
+                    break
+            if len(buffer) < index + length:
+                return True
+            first = buffer[0]
+            body = bytes(buffer[index : index + length])
+            del buffer[: index + length]
+            if not self.handle_packet(first >> 4, first & 0x0F, body):
+                return False
+        return True
+
+    def handle_packet(self, packet_type: int, flags: int, body: bytes) -> bool:
+        if packet_type == CONNECT:
+            self.send(CONNACK)
+        elif packet_type == PUBLISH:
+            topic_length = UINT16.unpack_from(body)[0]
+            topic = body[2 : 2 + topic_length].decode("utf-8")
+            offset = 2 + topic_length
+            qos = (flags >> 1) & 0x03
+            if qos:
+                packet_id = body[offset : offset + 2]
+                offset += 2
+                self.send(encode_packet(0x40 if qos == 1 else 0x50, packet_id))
+            self.broker.publish(topic, body[offset:], retain=bool(flags & 0x01))
+        elif packet_type == SUBSCRIBE:
+            packet_id = body[:2]
+            offset = 2
+            filters = []
+            while offset < len(body):
+                length = UINT16.unpack_from(body, offset)[0]
+                filters.append(body[offset + 2 : offset + 2 + length].decode("utf-8"))
+                offset += 2 + length + 1
+            with self.subscriptions_lock:
+                self.subscriptions.update(filters)
+            self.send(encode_packet(0x90, packet_id + b"\x00" * len(filters)))
+            for topic, payload in self.broker.retained_for(filters):
+                self.send_publish(topic, payload, retain=True)
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                length = UINT16.unpack_from(body, offset)[0]
+                with self.subscriptions_lock:
+                    self.subscriptions.discard(
+                        body[offset + 2 : offset + 2 + length].decode("utf-8")
+                    )
+                offset += 2 + length
+            self.send(encode_packet(0xB0, body[:2]))
+        elif packet_type == PINGREQ:
+            self.send(PINGRESP)
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def subscribed(self, topic: str) -> bool:
+        with self.subscriptions_lock:
+            return any(topic_matches(f, topic) for f in self.subscriptions)
+
+    def send_publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        body = encode_string(topic.encode("utf-8")) + payload
+        self.send(encode_packet(0x30 | int(retain), body))
+
+
+class _Prefixed:
+    """
+    Socket wrapper that returns `data` before reading from the socket.
+    """
+
+    def __init__(self, sock: socket.socket, data: bytes):
+        self._sock = sock
+        self._data = data
+
+    def recv(self, size: int) -> bytes:
+        if self._data:
+            chunk, self._data = self._data[:size], self._data[size:]
+            return chunk
+        return self._sock.recv(size)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class StandInBroker:
+    """
+    Local MQTT broker for tests and soak runs. stop() drops every client
+    and closes the port, start() brings it back, to simulate outages.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9001):
+        self.host = host
+        self.port = port
+        self.retained: Dict[str, bytes] = {}
+        self.connections: Set[Connection] = set()
+        self.lock = threading.Lock()
+        self.server: Optional[_Server] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.server = _Server((self.host, self.port), Connection)
+        self.server.broker = self
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info(f"[Broker] Listening on {self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.server = None
+        logging.info("[Broker] Stopped")
+
+    def add_connection(self, connection: Connection) -> None:
+        with self.lock:
+            self.connections.add(connection)
+
+    def remove_connection(self, connection: Connection) -> None:
+        with self.lock:
+            self.connections.discard(connection)
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        if retain:
+            with self.lock:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            if connection.subscribed(topic):
+                connection.send_publish(topic, payload)
+
+    def retained_for(self, filters: list) -> list:
+        with self.lock:
+            return [
+                (topic, payload)
+                for topic, payload in self.retained.items()
+                if any(topic_matches(f, topic) for f in filters)
+            ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in MQTT broker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    args = parser.parse_args()
+
+    broker = StandInBroker(args.host, args.port)
+    broker.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import json
 import csv
 import time
 import threading
@@ -6,6 +5,7 @@ import logging
 import os
 import matplotlib.pyplot as plt
 import paho.mqtt.client as mqtt
+from src.codec import FrameReconstructor, batch_messages, decode_message
 from src.utils import Config
 
 cfg = Config()
@@ -51,25 +51,45 @@ def on_connect(client, userdata, flags, rc, properties=None):
 
     if cfg.get("client.subscribe_events", False):
         client.subscribe(event_topic)
+        client.subscribe(cfg.get("mqtt.session_topic", "ac/session"))
 
     if cfg.get("client.subscribe_telemetry", False):
         client.subscribe(telemetry_topic)
 
 
+def request_keyframe():
+    logging.warning(f"Telemetry gap, requesting a keyframe ({reconstructor.gaps}).")
+    mqttc.publish(cfg.get("mqtt.keyframe_topic", "ac/keyframe_request"), b"")
+
+
+# Rebuilds full telemetry frames when the forwarder sends deltas
+reconstructor = FrameReconstructor(on_gap=request_keyframe)
+
+
 def on_message(client, userdata, msg):
-    payload_str = msg.payload.decode()
+    # Messages are JSON or the binary wire format, decoded to the same dict
+    try:
+        data = decode_message(msg.payload)
+    except ValueError:
+        logging.error(f"Error decoding message on {msg.topic}.")
+        return
 
-    if "event" in msg.topic:
-        print(f"{msg.topic} {payload_str}\n")
+    # Batches are handled frame by frame, like single messages
+    for message in batch_messages(data):
+        handle_message(msg.topic, message)
 
-    # If we are plotting, parse telemetry from 'acc/telemetry'
-    if "telemetry" in msg.topic:
-        try:
-            data = json.loads(payload_str)
-        except json.JSONDecodeError:
-            logging.error("Error decoding telemetry JSON.")
-            return
 
+def handle_message(topic, data):
+    # Deltas before the first keyframe, or after a gap, are skipped
+    data = reconstructor.apply(data)
+    if data is None:
+        return
+
+    if "event" in topic or data.get("message_type") == "session":
+        print(f"{topic} {data}\n")
+
+    # If we are plotting, parse telemetry from 'acc/telemetry'
+    if "telemetry" in topic:
         graphics_info = data.get("graphics_info", {})
         physics_info = data.get("physics_info", {})
 
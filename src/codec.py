@@ -0,0 +1,700 @@
+import enum
+import json
+import math
+import struct
+import typing
+from dataclasses import fields, is_dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.pyacsharedmemory import PhysicsMap, GraphicsMap, StaticsMap
+from src.schemas import AC_SESSION_TYPE
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, quantizing falls back to per-value rounding
+    np = None
+
+# Binary message layout (little endian):
+#   header: magic "AC", schema version, message type, flags, sequence, field count
+#   (sequence and FLAG_KEYFRAME are only used by telemetry_delta messages)
+#   FLAG_TAGGED set: FRAME_TAG (physics and graphics packet ID: int32)
+#     follows the header, the "frame_tag" of telemetry(_delta) messages
+#   FLAG_FULL set: every schema field in schema order, fixed-size fields
+#     first (one precompiled struct), then strings and lists
+#   otherwise: `field count` times (field ID: uint16, value)
+# Values: f float32, F nullable float32 (NaN is None), i int32, ? bool,
+# e enum (int8), s string (uint16 length + UTF-8), l float list
+# (uint8 count + float32 values). A field ID is the index of the field in
+# its message schema; adding or reordering fields needs a version bump.
+#
+# Batches (message type 5) hold several encoded messages: the header's
+# sequence is that of the first frame and its field count the number of
+# frames, then per frame BATCH_FRAME (sequence: uint32, timestamp:
+# float64, length: uint32) and the encoded message.
+MAGIC = b"AC"
+SCHEMA_VERSION = 1
+HEADER = struct.Struct("<2sBBBIH")
+FRAME_TAG = struct.Struct("<ii")
+
+FLAG_FULL = 0x01
+FLAG_KEYFRAME = 0x02
+FLAG_TAGGED = 0x04
+
+BATCH_CODE = 5
+BATCH_FRAME = struct.Struct("<IdI")
+
+FIXED_FORMATS = {"f": "f", "F": "f", "i": "i", "?": "?", "e": "b"}
+FIELD_ID = struct.Struct("<H")
+STRING_LENGTH = struct.Struct("<H")
+LIST_LENGTH = struct.Struct("<B")
+FIXED_STRUCTS = {kind: struct.Struct("<" + fmt) for kind, fmt in FIXED_FORMATS.items()}
+
+
+def schema_leaves(cls: type, prefix: tuple) -> list:
+    """
+    Lists the (path, kind, enum class) leaves of a map dataclass, in the
+    shape produced by its to_dict().
+    """
+    hints = typing.get_type_hints(cls)
+    leaves = []
+    for f in fields(cls):
+        field_type = hints[f.name]
+        path = prefix + (f.name,)
+        if is_dataclass(field_type):
+            leaves += schema_leaves(field_type, path)
+        elif isinstance(field_type, type) and issubclass(field_type, enum.Enum):
+            leaves.append((path, "e", field_type))
+        elif field_type is bool:
+            leaves.append((path, "?", None))
+        elif field_type is int:
+            leaves.append((path, "i", None))
+        elif field_type is float:
+            leaves.append((path, "f", None))
+        elif field_type is str:
+            leaves.append((path, "s", None))
+        else:
+            leaves.append((path, "l", None))
+    return leaves
+
+
+_MISSING = object()
+
+
+def _access(path: tuple) -> str:
+    return "m" + "".join(f"[{key!r}]" for key in path)
+
+
+class Schema:
+    """
+    Field list of one message type, with the generated flatten/build
+    functions used for full messages.
+    """
+
+    def __init__(
+        self, message_type: str, code: int, leaves: list, sequenced: bool = False
+    ):
+        self.message_type = message_type
+        self.code = code
+        self.leaves = leaves
+        # Sequenced messages carry "seq" and "keyframe" in the header
+        self.sequenced = sequenced
+
+        self.fixed = [leaf for leaf in leaves if leaf[1] in FIXED_FORMATS]
+        self.variable = [leaf for leaf in leaves if leaf[1] not in FIXED_FORMATS]
+        self.fixed_struct = struct.Struct(
+            "<" + "".join(FIXED_FORMATS[kind] for _, kind, _ in self.fixed)
+        )
+        self.enum_values = {
+            path: {member.name: member.value for member in enum_class}
+            for path, kind, enum_class in leaves
+            if kind == "e"
+        }
+        self.enum_names = {
+            path: {member.value: member.name for member in enum_class}
+            for path, kind, enum_class in leaves
+            if kind == "e"
+        }
+        self.flatten = self._compile_flatten()
+        self.build = self._compile_build()
+        self.values = self._compile_values()
+
+    def _compile_flatten(self):
+        namespace = {"nan": math.nan}
+        fixed = []
+        for index, (path, kind, _) in enumerate(self.fixed):
+            value = _access(path)
+            if kind == "e":
+                namespace[f"E{index}"] = self.enum_values[path]
+                value = f"E{index}[{value}]"
+            elif kind == "F":
+                value = f"(nan if {value} is None else {value})"
+            fixed.append(value)
+        variable = [_access(path) for path, _, _ in self.variable]
+        source = (
+            "def flatten(m):\n"
+            f"    return ({', '.join(fixed)},), ({', '.join(variable)},)\n"
+        )
+        exec(compile(source, f"<flatten {self.message_type}>", "exec"), namespace)
+        return namespace["flatten"]
+
+    def _compile_build(self):
+        namespace = {}
+        values = {}
+        for index, (path, kind, _) in enumerate(self.fixed):
+            value = f"f[{index}]"
+            if kind == "e":
+                namespace[f"N{index}"] = self.enum_names[path]
+                value = f"N{index}[{value}]"
+            elif kind == "F":
+                value = f"(None if {value} != {value} else {value})"
+            values[path] = value
+        for index, (path, _, _) in enumerate(self.variable):
+            values[path] = f"v[{index}]"
+
+        tree = {"message_type": repr(self.message_type)}
+        for path, _, _ in self.leaves:
+            node = tree
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            node[path[-1]] = values[path]
+
+        source = f"def build(f, v):\n    return {_literal(tree)}\n"
+        exec(compile(source, f"<build {self.message_type}>", "exec"), namespace)
+        return namespace["build"]
+
+    def _compile_values(self):
+        """
+        Generates values(message): the raw leaf values in schema order,
+        MISSING for the leaves the message does not have.
+        """
+        namespace = {"E": {}, "M": _MISSING}
+        values = []
+        for path, _, _ in self.leaves:
+            value = "m" + "".join(f".get({key!r}, E)" for key in path[:-1])
+            values.append(f"{value}.get({path[-1]!r}, M)")
+        source = f"def values(m):\n    return ({', '.join(values)},)\n"
+        exec(compile(source, f"<values {self.message_type}>", "exec"), namespace)
+        return namespace["values"]
+
+
+def _literal(tree: Any) -> str:
+    if isinstance(tree, dict):
+        items = ", ".join(f"{key!r}: {_literal(value)}" for key, value in tree.items())
+        return "{" + items + "}"
+    return tree
+
+
+TELEMETRY_SCHEMA = Schema(
+    "telemetry",
+    1,
+    schema_leaves(GraphicsMap, ("graphics_info",))
+    + schema_leaves(PhysicsMap, ("physics_info",)),
+)
+
+EVENT_SCHEMA = Schema(
+    "event_change",
+    2,
+    [(("event",), "s", None)]
+    + schema_leaves(StaticsMap, ("static_info",))
+    + [
+        (("static_info", "air_temp"), "F", None),
+        (("static_info", "road_temp"), "F", None),
+        (("static_info", "water_temp"), "F", None),
+        (("static_info", "tyre_compound"), "s", None),
+    ],
+)
+
+# Retained static/session info, see TopicGroups
+SESSION_SCHEMA = Schema(
+    "session",
+    4,
+    [
+        (("session_type",), "e", AC_SESSION_TYPE),
+        (("tyre_compound",), "s", None),
+    ]
+    + schema_leaves(StaticsMap, ("static_info",)),
+)
+
+# Telemetry deltas share the telemetry fields, see DeltaEncoder
+DELTA_SCHEMA = Schema("telemetry_delta", 3, TELEMETRY_SCHEMA.leaves, sequenced=True)
+
+SCHEMAS = {
+    schema.message_type: schema
+    for schema in (TELEMETRY_SCHEMA, EVENT_SCHEMA, DELTA_SCHEMA, SESSION_SCHEMA)
+}
+SCHEMA_CODES = {schema.code: schema for schema in SCHEMAS.values()}
+
+
+def _pack_variable(kind: str, value: Any) -> bytes:
+    if kind == "s":
+        raw = value.encode("utf-8")
+        return STRING_LENGTH.pack(len(raw)) + raw
+    return LIST_LENGTH.pack(len(value)) + struct.pack(f"<{len(value)}f", *value)
+
+
+def _unpack_variable(kind: str, payload: bytes, offset: int) -> Tuple[Any, int]:
+    if kind == "s":
+        (length,) = STRING_LENGTH.unpack_from(payload, offset)
+        offset += STRING_LENGTH.size
+        return payload[offset : offset + length].decode("utf-8"), offset + length
+    (count,) = LIST_LENGTH.unpack_from(payload, offset)
+    offset += LIST_LENGTH.size
+    value = list(struct.unpack_from(f"<{count}f", payload, offset))
+    return value, offset + 4 * count
+
+
+def _pack_value(schema: Schema, path: tuple, kind: str, value: Any) -> bytes:
+    if kind == "e":
+        value = schema.enum_values[path][value]
+    elif kind == "F" and value is None:
+        value = math.nan
+    fixed = FIXED_STRUCTS.get(kind)
+    if fixed is not None:
+        return fixed.pack(value)
+    return _pack_variable(kind, value)
+
+
+def _lookup(message: dict, path: tuple) -> Any:
+    value = message
+    for key in path:
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(key, _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def encode_message(message: dict) -> bytes:
+    """
+    Encodes a telemetry, event_change or telemetry_delta message. Complete
+    messages take the fixed-layout fast path, partial ones (channel
+    projections, deltas) are written as (field ID, value) pairs. Keys
+    outside the schema, other than the frame tag, are dropped.
+    """
+    schema = SCHEMAS[message["message_type"]]
+    sequence = 0
+    flags = 0
+    if schema.sequenced:
+        sequence = message["seq"]
+        if message["keyframe"]:
+            flags |= FLAG_KEYFRAME
+    tag = b""
+    frame_tag = message.get("frame_tag")
+    if frame_tag is not None:
+        flags |= FLAG_TAGGED
+        tag = FRAME_TAG.pack(*frame_tag)
+    try:
+        fixed, variable = schema.flatten(message)
+    except (KeyError, TypeError):
+        fixed = None
+
+    if fixed is not None:
+        parts = [
+            HEADER.pack(
+                MAGIC,
+                SCHEMA_VERSION,
+                schema.code,
+                flags | FLAG_FULL,
+                sequence,
+                len(schema.leaves),
+            ),
+            tag,
+            schema.fixed_struct.pack(*fixed),
+        ]
+        for (_, kind, _), value in zip(schema.variable, variable):
+            parts.append(_pack_variable(kind, value))
+        return b"".join(parts)
+
+    parts = [b"", tag]
+    for field_id, (path, kind, _) in enumerate(schema.leaves):
+        value = _lookup(message, path)
+        if value is _MISSING:
+            continue
+        parts.append(FIELD_ID.pack(field_id))
+        parts.append(_pack_value(schema, path, kind, value))
+
+    parts[0] = HEADER.pack(
+        MAGIC, SCHEMA_VERSION, schema.code, flags, sequence, (len(parts) - 2) // 2
+    )
+    return b"".join(parts)
+
+
+def decode_header(payload: bytes) -> Tuple[Schema, int, int, int]:
+    """
+    Returns (schema, flags, sequence, field count) of a binary message.
+    """
+    magic, version, code, flags, sequence, count = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("Not a binary telemetry message")
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported schema version {version}")
+    return SCHEMA_CODES[code], flags, sequence, count
+
+
+def decode_binary(payload: bytes) -> dict:
+    """
+    Decodes a binary message back into the dict shape of the JSON messages.
+    """
+    if payload[3] == BATCH_CODE:
+        return decode_batch(payload)
+    schema, flags, sequence, count = decode_header(payload)
+    offset = HEADER.size
+    frame_tag = None
+    if flags & FLAG_TAGGED:
+        frame_tag = list(FRAME_TAG.unpack_from(payload, offset))
+        offset += FRAME_TAG.size
+
+    if flags & FLAG_FULL:
+        fixed = schema.fixed_struct.unpack_from(payload, offset)
+        offset += schema.fixed_struct.size
+        variable = []
+        for _, kind, _ in schema.variable:
+            value, offset = _unpack_variable(kind, payload, offset)
+            variable.append(value)
+        message = schema.build(fixed, variable)
+        if schema.sequenced:
+            message["seq"] = sequence
+            message["keyframe"] = bool(flags & FLAG_KEYFRAME)
+        if frame_tag is not None:
+            message["frame_tag"] = frame_tag
+        return message
+
+    message: Dict[str, Any] = {"message_type": schema.message_type}
+    if schema.sequenced:
+        message["seq"] = sequence
+        message["keyframe"] = bool(flags & FLAG_KEYFRAME)
+    if frame_tag is not None:
+        message["frame_tag"] = frame_tag
+    for _ in range(count):
+        (field_id,) = FIELD_ID.unpack_from(payload, offset)
+        offset += FIELD_ID.size
+        path, kind, _ = schema.leaves[field_id]
+
+        fixed_struct = FIXED_STRUCTS.get(kind)
+        if fixed_struct is not None:
+            (value,) = fixed_struct.unpack_from(payload, offset)
+            offset += fixed_struct.size
+            if kind == "e":
+                value = schema.enum_names[path][value]
+            elif kind == "F" and value != value:
+                value = None
+        else:
+            value, offset = _unpack_variable(kind, payload, offset)
+
+        node = message
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return message
+
+
+def encode_batch(frames: List[Tuple[int, float, bytes]]) -> bytes:
+    """
+    Packs (sequence, timestamp, binary message) frames into one message.
+    """
+    parts = [
+        HEADER.pack(
+            MAGIC,
+            SCHEMA_VERSION,
+            BATCH_CODE,
+            0,
+            frames[0][0] if frames else 0,
+            len(frames),
+        )
+    ]
+    for sequence, timestamp, payload in frames:
+        parts.append(BATCH_FRAME.pack(sequence, timestamp, len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def decode_batch(payload: bytes) -> dict:
+    """
+    Decodes a binary batch into the dict shape of a JSON batch:
+    {"message_type": "telemetry_batch", "frames": [{"seq", "timestamp",
+    "message"}, ...]}.
+    """
+    _, version, _, _, _, count = HEADER.unpack_from(payload)
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported schema version {version}")
+    offset = HEADER.size
+    frames = []
+    for _ in range(count):
+        sequence, timestamp, length = BATCH_FRAME.unpack_from(payload, offset)
+        offset += BATCH_FRAME.size
+        frame = payload[offset : offset + length]
+        if len(frame) != length:
+            raise ValueError("Truncated batch frame")
+        offset += length
+        frames.append(
+            {"seq": sequence, "timestamp": timestamp, "message": decode_binary(frame)}
+        )
+    return {"message_type": "telemetry_batch", "frames": frames}
+
+
+def batch_messages(message: dict) -> List[dict]:
+    """
+    Returns the messages of a telemetry_batch in order, or [message] for
+    any other message.
+    """
+    if message.get("message_type") != "telemetry_batch":
+        return [message]
+    return [frame["message"] for frame in message["frames"]]
+
+
+def decode_message(payload: bytes) -> dict:
+    """
+    Decodes a message in either wire format (binary or JSON).
+    """
+    if payload[:2] != MAGIC:
+        return json.loads(payload)
+    try:
+        return decode_binary(payload)
+    except (struct.error, KeyError, IndexError) as e:
+        raise ValueError(f"Malformed binary message: {e}") from e
+
+
+def _set_leaf(message: dict, path: tuple, value: Any) -> None:
+    node = message
+    for key in path[:-1]:
+        node = node.setdefault(key, {})
+    node[path[-1]] = value
+
+
+def _merge(base: dict, changes: dict) -> dict:
+    """
+    Returns base updated with changes, copying only the changed branches.
+    """
+    merged = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict):
+            merged[key] = _merge(base.get(key, {}), value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class DeltaEncoder:
+    """
+    Turns telemetry messages into telemetry_delta messages that only hold
+    the fields that changed since the previous one. Every
+    `keyframe_interval` messages, and after request_keyframe(), a keyframe
+    with all fields is sent so subscribers can join mid-session. With an
+    interval of 0 or None keyframes are only sent first and on request.
+    """
+
+    def __init__(self, keyframe_interval: Optional[int] = 100):
+        keyframe_interval = keyframe_interval or 0
+        if keyframe_interval < 0:
+            raise ValueError(f"Invalid keyframe interval: {keyframe_interval}")
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self._previous = None
+        self._keyframe_requested = False
+
+    def request_keyframe(self) -> None:
+        self._keyframe_requested = True
+
+    def encode(self, message: dict) -> dict:
+        values = DELTA_SCHEMA.values(message)
+        previous = self._previous
+        keyframe = (
+            previous is None
+            or self._keyframe_requested
+            or (self.keyframe_interval and self.seq % self.keyframe_interval == 0)
+        )
+        self._keyframe_requested = False
+
+        delta = {
+            "message_type": "telemetry_delta",
+            "seq": self.seq,
+            "keyframe": keyframe,
+        }
+        if "frame_tag" in message:
+            delta["frame_tag"] = message["frame_tag"]
+        for index, (path, _, _) in enumerate(DELTA_SCHEMA.leaves):
+            value = values[index]
+            if value is _MISSING:
+                continue
+            if keyframe or value != previous[index]:
+                _set_leaf(delta, path, value)
+
+        self._previous = values
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        return delta
+
+
+class FrameReconstructor:
+    """
+    Client side of DeltaEncoder: rebuilds full telemetry messages from
+    telemetry_delta messages. A missing sequence number is counted as a
+    gap and frames are withheld until the next keyframe; `on_gap` can be
+    used to ask the forwarder for one. Other messages pass through.
+    """
+
+    def __init__(self, on_gap=None):
+        self.on_gap = on_gap
+        self.gaps = 0
+        self._state = None
+        self._expected = None
+
+    def apply(self, message: dict) -> Optional[dict]:
+        if message.get("message_type") != "telemetry_delta":
+            return message
+
+        seq = message["seq"]
+        changes = {
+            key: value
+            for key, value in message.items()
+            if key not in ("message_type", "seq", "keyframe")
+        }
+        if message["keyframe"]:
+            self._state = changes
+        elif self._state is None or seq != self._expected:
+            if self._state is not None:
+                self.gaps += 1
+                if self.on_gap is not None:
+                    self.on_gap()
+            self._state = None
+            return None
+        else:
+            self._state = _merge(self._state, changes)
+
+        self._expected = (seq + 1) & 0xFFFFFFFF
+        return {"message_type": "telemetry", **self._state}
+
+
+# Below this many {"decimals": n} channels numpy's per-call overhead costs
+# more than rounding value by value
+VECTOR_ROUNDING_MIN = 32
+
+
+def _rounding_expression(rule: dict) -> str:
+    """
+    Returns the expression that rounds the float `v` as described by a
+    precision rule, {"decimals": n} or {"significant": n}.
+    """
+    if "decimals" in rule:
+        # round(v * 10**n) / 10**n is the nearest float to the decimal, so
+        # it prints short, and avoids the slower round(v, n)
+        scale = 10.0 ** rule["decimals"]
+        limit = 2.0**52 / scale
+        return f"round(v * {scale!r}) / {scale!r} if -{limit!r} < v < {limit!r} else v"
+    if "significant" in rule:
+        return f"float(format(v, '.{int(rule['significant'])}g'))"
+    raise ValueError(f"Unknown precision rule: {rule}")
+
+
+def compile_quantizer(
+    default: Optional[dict] = None,
+    physics: Optional[dict] = None,
+    graphics: Optional[dict] = None,
+):
+    """
+    Generates quantize(message), which rounds the float channels of a
+    telemetry message in place: `physics` and `graphics` map channel
+    names to precision rules, `default` applies to all other floats.
+    Returns None when there is nothing to round.
+    """
+    rules = {}
+    for group, channels in (("physics_info", physics), ("graphics_info", graphics)):
+        names = {path[1] for path, _, _ in TELEMETRY_SCHEMA.leaves if path[0] == group}
+        unknown = [name for name in channels or () if name not in names]
+        if unknown:
+            raise ValueError(f"Unknown {group} precision channels: {unknown}")
+        for name, rule in (channels or {}).items():
+            rules[(group, name)] = rule
+
+    leaves = []
+    for path, kind, _ in TELEMETRY_SCHEMA.leaves:
+        rule = rules.get(path[:2], default)
+        if kind in ("f", "F") and rule:
+            leaves.append((path, rule))
+    if not leaves:
+        return None
+
+    quantize = _compile_rounding(leaves)
+    vectorized = sum("decimals" in rule for _, rule in leaves)
+    if np is not None and vectorized >= VECTOR_ROUNDING_MIN:
+        quantize = _compile_vector_rounding(leaves, quantize)
+    return quantize
+
+
+def _compile_rounding(leaves: list):
+    """
+    Generates quantize(m) rounding one value at a time, for messages
+    that lack some of the channels (projections) and without numpy.
+    """
+    # Leaves grouped by their parent dict, so each dict is looked up once
+    parents = {}
+    for path, rule in leaves:
+        parents.setdefault(path[:-1], []).append((path[-1], rule))
+
+    lines = []
+    for parent, children in parents.items():
+        lines.append("    n = m" + "".join(f".get({key!r}, E)" for key in parent))
+        for key, rule in children:
+            lines.append(f"    v = n.get({key!r})")
+            lines.append(f"    if v is not None:")
+            lines.append(f"        n[{key!r}] = {_rounding_expression(rule)}")
+    source = "def quantize(m):\n" + "\n".join(lines) + "\n    return m\n"
+
+    namespace = {"E": {}}
+    exec(compile(source, "<quantize telemetry>", "exec"), namespace)
+    return namespace["quantize"]
+
+
+def _compile_vector_rounding(leaves: list, per_value):
+    """
+    Generates quantize(m) rounding all {"decimals": n} channels with one
+    numpy pass: the values are gathered into an array, rounded with the
+    same multiply, rint and divide as the per-value expression (so the
+    results are identical) and written back. {"significant": n} rules
+    are still rounded one value at a time. Falls back to `per_value`
+    when the message lacks a channel.
+    """
+    decimals = [(path, rule["decimals"]) for path, rule in leaves if "decimals" in rule]
+    significant = [(path, rule) for path, rule in leaves if "decimals" not in rule]
+
+    # Every parent dict on the way gets a local, so each is looked up once
+    names = {(): "m"}
+    lines = ["    try:"]
+    for path, _ in decimals:
+        for depth in range(1, len(path)):
+            parent = path[:depth]
+            if parent not in names:
+                names[parent] = f"n{len(names)}"
+                lines.append(
+                    f"        {names[parent]} = {names[parent[:-1]]}[{parent[-1]!r}]"
+                )
+    targets = ", ".join(f"{names[path[:-1]]}[{path[-1]!r}]" for path, _ in decimals)
+    lines += [
+        f"        a = array(({targets},), float64)",
+        "    except (KeyError, TypeError):",
+        "        return per_value(m)",
+        # + 0.0 turns -0.0 into 0.0, like round() returning the int 0
+        "    r = where(absolute(a) < L, rint(a * S) / S + 0.0, a)",
+        f"    {targets}, = r.tolist()",
+    ]
+    for path, rule in significant:
+        lines.append("    n = m" + "".join(f".get({key!r}, E)" for key in path[:-1]))
+        lines.append(f"    v = n.get({path[-1]!r})")
+        lines.append(f"    if v is not None:")
+        lines.append(f"        n[{path[-1]!r}] = {_rounding_expression(rule)}")
+    source = "def quantize(m):\n" + "\n".join(lines) + "\n    return m\n"
+
+    scales = np.array([10.0**n for _, n in decimals])
+    namespace = {
+        "E": {},
+        "per_value": per_value,
+        "array": np.array,
+        "float64": np.float64,
+        "where": np.where,
+        "absolute": np.absolute,
+        "rint": np.rint,
+        "S": scales,
+        "L": 2.0**52 / scales,
+    }
+    exec(compile(source, "<quantize telemetry>", "exec"), namespace)
+    return namespace["quantize"]
@@ -0,0 +1,225 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets, 5us to 250ms
+LATENCY_BUCKETS = (
+    5e-6,
+    1e-5,
+    2.5e-5,
+    5e-5,
+    1e-4,
+    2.5e-4,
+    5e-4,
+    1e-3,
+    2.5e-3,
+    5e-3,
+    1e-2,
+    2.5e-2,
+    5e-2,
+    0.1,
+    0.25,
+)
+
+PREFIX = "forwarder_"
+
+
+class Histogram:
+    """
+    Counts observations per bucket (upper bounds in `buckets`, plus +Inf),
+    with their sum. Not locked: every histogram has one writer thread.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile (the last bound
+        for observations beyond it).
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+            lines.append(f"{name}_bucket{_labels(labels, le)} {total}")
+        lines.append(f"{name}_sum{_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {self.count}")
+        return lines
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, read: Optional[Callable[[], float]] = None):
+        self.value = 0
+        # Counters kept elsewhere (e.g. queue drops) are read on export
+        self.read = read
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def get(self) -> float:
+        return self.read() if self.read is not None else self.value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        return [f"{name}{_labels(labels)} {self.get()}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+def _labels(*parts: str) -> str:
+    joined = ",".join(part for part in parts if part)
+    return "{" + joined + "}" if joined else ""
+
+
+class Metrics:
+    """
+    Registry of the forwarder's histograms, counters and gauges. Metrics
+    are created on first use and identified by name and labels, e.g.
+    metrics.histogram("stage_seconds", "...", stage="to_dict"). render()
+    returns them in the Prometheus text format, serve() exposes that on
+    http://host:port/metrics.
+    """
+
+    def __init__(self):
+        # name -> (help, {label key -> (labels, metric)})
+        self._metrics: Dict[str, Tuple[str, Dict[str, tuple]]] = {}
+        self._lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def _get(self, factory, name: str, help: str, labels: dict, *args):
+        key = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        with self._lock:
+            family = self._metrics.setdefault(PREFIX + name, (help, {}))[1]
+            entry = family.get(key)
+            if entry is None:
+                entry = family[key] = (labels, factory(*args))
+            return entry[1]
+
+    def histogram(
+        self, name: str, help: str, buckets=LATENCY_BUCKETS, **labels
+    ) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def counter(self, name: str, help: str, read=None, **labels) -> Counter:
+        return self._get(Counter, name, help, labels, read)
+
+    def gauge(self, name: str, help: str, read=None, **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels, read)
+
+    def get(self, name: str, **labels):
+        """
+        An existing metric, or None.
+        """
+        key = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        entry = self._metrics.get(PREFIX + name, (None, {}))[1].get(key)
+        return entry[1] if entry else None
+
+    def stage(self, stage: str) -> Histogram:
+        """
+        Latency histogram of one stage of the forwarder.
+        """
+        return self.histogram(
+            "stage_seconds", "Time spent per call, per forwarder stage", stage=stage
+        )
+
+    def _families(self) -> list:
+        with self._lock:
+            return [
+                (name, help, list(family.items()))
+                for name, (help, family) in self._metrics.items()
+            ]
+
+    def render(self) -> str:
+        lines = []
+        for name, help, family in self._families():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {family[0][1][1].kind}")
+            for key, (_, metric) in family:
+                lines += metric.samples(name, key)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        One line with every counter and gauge, and the p50/p99 of every
+        histogram.
+        """
+        parts = []
+        for name, _, family in self._families():
+            name = name[len(PREFIX) :]
+            for _, (labels, metric) in family:
+                label = "/".join(str(value) for value in labels.values()) or name
+                if isinstance(metric, Histogram):
+                    if metric.count:
+                        parts.append(
+                            f"{label} p50 {1e6 * metric.quantile(0.5):.0f}us "
+                            f"p99 {1e6 * metric.quantile(0.99):.0f}us"
+                        )
+                elif labels:
+                    parts.append(f"{name}[{label}] {metric.get():g}")
+                else:
+                    parts.append(f"{name} {metric.get():g}")
+        return "[Metrics] " + ", ".join(parts)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9100) -> None:
+        """
+        Serves render() on a daemon thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        ).start()
+        logging.info(f"[Metrics] Serving http://{host}:{port}/metrics")
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
@@ -1,11 +1,28 @@
 import logging
 import json
+import random
+import threading
 import time
+from typing import Callable, Optional, Union
 import paho.mqtt.client as mqtt
 
+from src.spool import Spool
+
 
 class MqttPublisher:
-    def __init__(self, host: str, port: int, event_topic: str, telemetry_topic: str):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        event_topic: str,
+        telemetry_topic: str,
+        keyframe_topic: Optional[str] = None,
+        session_topic: Optional[str] = None,
+        spool: Optional[Spool] = None,
+        backoff_min: float = 1.0,
+        backoff_max: float = 60.0,
+        drain_rate: float = 200.0,
+    ):
         """
         Manages MQTT connections
         """
@@ -14,89 +31,232 @@ class MqttPublisher:
         self.port = port
         self.event_topic = event_topic
         self.telemetry_topic = telemetry_topic
+        # Subscribers ask for a telemetry keyframe here, see DeltaEncoder
+        self.keyframe_topic = keyframe_topic
+        self.on_keyframe_request: Optional[Callable[[], None]] = None
+        # Retained static/session info, sent again after every reconnect
+        self.session_topic = session_topic
+        self._session_payload: Optional[bytes] = None
+
+        # Messages published while offline, sent at drain_rate per second
+        self.spool = spool
+        self.drain_rate = drain_rate
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._drain_time = time.monotonic()
+        self._drain_credit = 0.0
 
         self._connected = False
+        self.disconnects = 0
+        self._stop = threading.Event()
+        self._link_down = threading.Event()
+        self._thread: Optional[threading.Thread] = None
 
         # Note: I use websocket MQTT connections, in line with previous activations
+        # Reconnects are handled by _run, with backoff and jitter
         self.client = mqtt.Client(
-            mqtt.CallbackAPIVersion.VERSION2, transport="websockets"
+            mqtt.CallbackAPIVersion.VERSION2,
+            transport="websockets",
+            reconnect_on_failure=False,
         )
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
 
     def _on_connect(self, client, userdata, flags, rc, properties=None):
         """
         Callback for when the client receives a CONNACK response
         """
         if rc == 0:
+            # Telemetry deltas are not spooled, so start again from a keyframe
+            if self.on_keyframe_request:
+                self.on_keyframe_request()
             self._connected = True
             logging.info("[MQTT] Connected successfully.")
+            if self.keyframe_topic:
+                client.subscribe(self.keyframe_topic)
+            # The broker may have restarted and lost its retained messages
+            if self._session_payload is not None:
+                client.publish(self.session_topic, self._session_payload, retain=True)
         else:
             self._connected = False
             logging.info(f"[MQTT] Connection failed with code {rc}.")
+            client.disconnect()
 
     def _on_disconnect(self, client, userdata, flags, rc, properties=None):
         """
         Callback or when the client disconnects from the broker.
         """
         self._connected = False
+        self.disconnects += 1
+        self._link_down.set()
         logging.info("[MQTT] Disconnected. Will retry...")
 
+    def _on_message(self, client, userdata, msg):
+        """
+        Callback for keyframe requests from subscribers.
+        """
+        if msg.topic == self.keyframe_topic and self.on_keyframe_request:
+            logging.info("[MQTT] Keyframe requested.")
+            self.on_keyframe_request()
+
     @property
     def is_connected(self):
         return self._connected
 
-    def try_connect(self):
+    def start(self):
         """
-        Attempts to connect to the MQTT broker
+        Connects and keeps reconnecting in a background thread, so a
+        broker outage never blocks the caller.
         """
-        if not self._connected:
+        self._thread = threading.Thread(target=self._run, name="mqtt", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """
+        Connection manager: (re)connects with exponential backoff and
+        jitter, then drains the spool while the connection lasts. Network
+        traffic runs on paho's own thread (loop_start), one per connection.
+        """
+        delay = self.backoff_min
+        first = True
+        while not self._stop.is_set():
+            if not first:
+                # Half the delay plus up to the other half, so clients that
+                # lost the same broker do not retry in lockstep
+                wait = delay / 2 + random.uniform(0, delay / 2)
+                logging.info(f"[MQTT] Retrying in {wait:.1f}s")
+                if self._stop.wait(wait):
+                    return
+                delay = min(delay * 2, self.backoff_max)
+            first = False
+
             try:
-                self.client.connect(self.host, self.port, 60)
-                self.client.loop_start()
                 logging.info("[MQTT] Attempting connection...")
+                self._link_down.clear()
+                self.client.connect(self.host, self.port, 60)
             except Exception as e:
                 logging.info(f"[MQTT] MQTT connection failed: {e}")
-                time.sleep(10)
+                continue
+
+            self.client.loop_start()
+            while not self._stop.is_set() and not self._link_down.is_set():
+                if self._connected:
+                    delay = self.backoff_min
+                    if self.spool is not None and self.spool.pending:
+                        self._drain()
+                        self._link_down.wait(0.01)
+                        continue
+                self._link_down.wait(0.1)
+            # The network thread ends by itself once the connection is lost
+            self.client.loop_stop()
+
+    def _drain(self):
+        """
+        Sends spooled messages, at most drain_rate per second.
+        """
+        now = time.monotonic()
+        elapsed = now - self._drain_time
+        self._drain_time = now
+        self._drain_credit = min(
+            self._drain_credit + elapsed * self.drain_rate,
+            max(1.0, self.drain_rate / 10),
+        )
+        while self._drain_credit >= 1.0 and self._connected:
+            record = self.spool.peek()
+            if record is None:
+                logging.info("[MQTT] Spool drained.")
+                return
+            topic, payload = record
+            if self.client.publish(topic, payload).rc != mqtt.MQTT_ERR_SUCCESS:
+                return
+            self.spool.commit()
+            self._drain_credit -= 1.0
 
-    def publish_event(self, data: dict):
+    def _publish(
+        self,
+        topic: str,
+        data: Union[dict, bytes],
+        critical: bool,
+        spooled: bool = True,
+    ):
+        """
+        Publishes now when connected, else spools the message (events stay
+        behind earlier spooled events to keep their order). Messages with
+        `spooled` False are dropped while offline.
+        """
+        payload = data if isinstance(data, bytes) else json.dumps(data).encode()
+        spool = self.spool
+        live = self._connected and not (critical and spool and spool.pending)
+        if live:
+            try:
+                if self.client.publish(topic, payload).rc == mqtt.MQTT_ERR_SUCCESS:
+                    return
+            except Exception as e:
+                logging.info(f"[MQTT] Publish to {topic} failed: {e}")
+                self._force_reconnect()
+        if spool is not None and spooled:
+            spool.append(topic, payload, critical)
+
+    def publish_event(self, data: Union[dict, bytes]):
         """
         Publishes an event message to the MQTT broker.
+        Accepts a dict or an already encoded payload.
         """
-        if not self._connected:
+        self._publish(self.event_topic, data, critical=True)
+
+    def publish_telemetry(self, data: Union[dict, bytes], spooled: bool = True):
+        """
+        Publishes a telemetry message to the MQTT broker.
+        Accepts a dict or an already encoded payload. Telemetry deltas are
+        passed with `spooled` False: a downsampled, late delta stream cannot
+        be rebuilt by subscribers.
+        """
+        self._publish(self.telemetry_topic, data, critical=False, spooled=spooled)
+
+    def publish_session(self, data: Union[dict, bytes]):
+        """
+        Publishes static/session info as a retained message, so
+        subscribers get it as soon as they subscribe.
+        """
+        payload = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self._session_payload = payload
+        if not self._connected or not self.session_topic:
             return
         try:
-            payload = json.dumps(data)
-            print("Publishing: ", self.event_topic)
-            self.client.publish(self.event_topic, payload)
+            self.client.publish(self.session_topic, payload, retain=True)
         except Exception as e:
-            logging.info(f"[MQTT] Event publish failed: {e}")
+            logging.info(f"[MQTT] Session publish failed: {e}")
             self._force_reconnect()
 
-    def publish_telemetry(self, data: dict):
+    def publish_group(self, group: str, data: Union[dict, bytes]):
         """
-        Publishes a telemetry message to the MQTT broker.
+        Publishes a telemetry group on its subtopic, e.g.
+        ac/telemetry/physics/wheels. Not spooled while offline.
         """
         if not self._connected:
             return
         try:
-            payload = json.dumps(data)
-            self.client.publish(self.telemetry_topic, payload)
+            payload = data if isinstance(data, bytes) else json.dumps(data)
+            self.client.publish(f"{self.telemetry_topic}/{group}", payload)
         except Exception as e:
-            logging.info(f"[MQTT] Telemetry publish failed: {e}")
+            logging.info(f"[MQTT] Telemetry group publish failed: {e}")
             self._force_reconnect()
 
     def _force_reconnect(self):
         """
-        Force a reconnect
+        Force a reconnect, the connection manager connects again
         """
-        self.client.loop_stop()
-        self.client.disconnect()
         self._connected = False
+        self.client.disconnect()
 
     def close(self):
         """
         Cleanly stop and disconnect
         """
-        self.client.loop_stop()
+        self._stop.set()
         self.client.disconnect()
+        if self._thread is not None:
+            self._thread.join(2.0)
+        if self.spool is not None:
+            self.spool.close()
@@ -0,0 +1,302 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, List, Optional, Tuple
+
+from src.metrics import Metrics
+from src.sinks import Fanout, Sink
+
+# Overflow policies of a BoundedQueue
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class BoundedQueue:
+    """
+    FIFO between two pipeline stages. When full, `policy` decides: drop
+    the oldest queued item, drop the new one, or block the producer.
+    Critical items (events) are never dropped; with the drop policies
+    they may take the queue over its size.
+    """
+
+    def __init__(self, maxsize: int, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self.closed = False
+
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, item: Any, critical: bool = False) -> bool:
+        """
+        Queues item, returns False when it was dropped.
+        """
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                if self.policy == BLOCK:
+                    while len(self._items) >= self.maxsize and not self.closed:
+                        self._not_full.wait()
+                elif critical:
+                    pass
+                elif self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                else:
+                    self._drop_oldest()
+            if self.closed:
+                return False
+
+            self._items.append((item, critical))
+            self.high_water = max(self.high_water, len(self._items))
+            self._not_empty.notify()
+            return True
+
+    def _drop_oldest(self) -> None:
+        for index, (_, critical) in enumerate(self._items):
+            if not critical:
+                del self._items[index]
+                self.dropped += 1
+                return
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """
+        Returns the oldest item. Returns None on timeout, or once the queue
+        is closed and drained.
+        """
+        with self._lock:
+            if not self._items and not self.closed:
+                self._not_empty.wait(timeout)
+            if not self._items:
+                return None
+            item, _ = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def close(self) -> None:
+        """
+        Wakes up everyone; get() keeps returning what is left, then None.
+        """
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+
+class SinkWorker:
+    """
+    Thread that sends queued (kind, payload, stamp) items to one sink, so
+    a stalling sink only delays itself. Also flushes sinks that hold
+    messages back once they are due.
+    """
+
+    def __init__(
+        self, sink: Sink, queue: BoundedQueue, metrics: Optional[Metrics] = None
+    ):
+        self.sink = sink
+        self.queue = queue
+        self.name = type(sink).__name__
+        # Seconds spent sending, payloads sent and failed sends or flushes
+        self.busy = 0.0
+        self.processed = 0
+        self.failures = 0
+        self.send_time = None
+        if metrics is not None:
+            self.send_time = metrics.stage(f"send_{self.name}")
+        self.thread = threading.Thread(
+            target=self.run, name=f"sink-{self.name}", daemon=True
+        )
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get(self.sink.flush_timeout())
+            if item is None and self.queue.closed:
+                return
+            start = time.perf_counter()
+            try:
+                if item is not None:
+                    self.sink.send(*item)
+                else:
+                    self.sink.flush()
+            except OSError as e:
+                self.failures += 1
+                logging.info(f"[{self.name}] Send failed: {e}")
+            except Exception:
+                # A broken sink must not stop the worker, the next item may work
+                self.failures += 1
+                logging.exception(f"[{self.name}] Send failed")
+            elapsed = time.perf_counter() - start
+            self.busy += elapsed
+            self.processed += item is not None
+            if self.send_time is not None:
+                self.send_time.observe(elapsed)
+
+
+# Kinds of messages that are never dropped
+CRITICAL_KINDS = ("event", "session")
+
+
+class Pipeline:
+    """
+    Reader -> encoder -> sinks. The reader submits sampled frames,
+    the encoder thread turns them into messages with `prepare(kind, item)`
+    (returning a list of (kind, message, optional delta)), encodes them
+    once per wire format and queues the payloads for every sink worker.
+    Event and session messages are never dropped on the way.
+
+    Payloads are stamped with the sample time and the number of the
+    telemetry frame they came from (see Batcher).
+    """
+
+    def __init__(
+        self,
+        fanout: Fanout,
+        prepare: Callable[[str, Any], List[Tuple[str, dict, Optional[dict]]]],
+        queue_size: int = 64,
+        policy: str = DROP_OLDEST,
+        sink_queue_size: int = 256,
+        sink_policy: str = DROP_OLDEST,
+        metrics: Optional[Metrics] = None,
+    ):
+        self.fanout = fanout
+        self.prepare = prepare
+        self.queue = BoundedQueue(queue_size, policy)
+        self.workers: List[SinkWorker] = [
+            SinkWorker(sink, BoundedQueue(sink_queue_size, sink_policy), metrics)
+            for sink in fanout.sinks
+        ]
+        if metrics is not None:
+            self.register(metrics)
+        self.encoder = threading.Thread(target=self.encode, name="encoder", daemon=True)
+        self.frame_seq = 0
+        self.busy = 0.0
+        self.processed = 0
+
+    def start(self) -> None:
+        self.encoder.start()
+        for worker in self.workers:
+            worker.thread.start()
+
+    def submit(self, kind: str, item: Any) -> bool:
+        """
+        Hands a sampled frame to the encoder, returns False when dropped.
+        """
+        return self.queue.put(
+            (kind, item, time.time()), critical=kind in CRITICAL_KINDS
+        )
+
+    def encode(self) -> None:
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            start = time.perf_counter()
+            self.encode_entry(*entry)
+            self.busy += time.perf_counter() - start
+            self.processed += 1
+
+    def encode_entry(self, kind: str, item: Any, timestamp: float) -> None:
+        if kind == "telemetry":
+            self.frame_seq = (self.frame_seq + 1) & 0xFFFFFFFF
+        stamp = (self.frame_seq, timestamp)
+        try:
+            messages = self.prepare(kind, item)
+        except Exception:
+            logging.exception(f"[Pipeline] Failed to encode a {kind} message")
+            return
+        for kind, message, delta in messages:
+            try:
+                payloads = self.fanout.encode(kind, message, delta)
+            except Exception:
+                logging.exception(f"[Pipeline] Failed to encode a {kind} message")
+                continue
+            critical = kind in CRITICAL_KINDS
+            for worker, payload in zip(self.workers, payloads):
+                if payload is not None:
+                    worker.queue.put((kind, payload, stamp), critical=critical)
+
+    def register(self, metrics: Metrics) -> None:
+        """
+        Exports the queue counters: depth, drops and items processed, and
+        the failed sends per sink.
+        """
+        stages = [("encoder", self.queue, self)] + [
+            (worker.name, worker.queue, worker) for worker in self.workers
+        ]
+        for name, queue, stage in stages:
+            metrics.gauge(
+                "queue_depth",
+                "Items waiting per pipeline queue",
+                queue.__len__,
+                queue=name,
+            )
+            metrics.counter(
+                "dropped_total",
+                "Items dropped by full pipeline queues",
+                lambda queue=queue: queue.dropped,
+                queue=name,
+            )
+            metrics.counter(
+                "processed_total",
+                "Items encoded or sent per pipeline stage",
+                lambda stage=stage: stage.processed,
+                stage=name,
+            )
+        for worker in self.workers:
+            metrics.counter(
+                "send_failures_total",
+                "Failed sends and flushes per sink",
+                lambda worker=worker: worker.failures,
+                sink=worker.name,
+            )
+
+    def stats(self) -> dict:
+        """
+        Queue depth, high water mark and drops per stage, and the seconds
+        the stage spent on the items it processed.
+        """
+        stages = [("encoder", self.queue, self)] + [
+            (worker.name, worker.queue, worker) for worker in self.workers
+        ]
+        return {
+            name: {
+                "depth": len(queue),
+                "high_water": queue.high_water,
+                "dropped": queue.dropped,
+                "processed": stage.processed,
+                "busy": stage.busy,
+            }
+            for name, queue, stage in stages
+        }
+
+    def log_stats(self) -> None:
+        for name, stats in self.stats().items():
+            logging.info(
+                f"[Pipeline] {name}: depth {stats['depth']}, "
+                f"high water {stats['high_water']}, dropped {stats['dropped']}"
+            )
+
+    def close(self, timeout: float = 2.0) -> None:
+        """
+        Lets the stages drain what is queued (up to `timeout` seconds per
+        stage), then closes the sinks.
+        """
+        self.queue.close()
+        if self.encoder.is_alive():
+            self.encoder.join(timeout)
+        for worker in self.workers:
+            worker.queue.close()
+            if worker.thread.is_alive():
+                worker.thread.join(timeout)
+        self.fanout.close()
@@ -0,0 +1,308 @@
+import argparse
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# (file name, function name) -> stage of the forwarder. Functions without
+# a rule count towards the stages of their callers.
+STAGE_RULES = {
+    ("pyacsharedmemory.py", "read_frame"): "decode",
+    ("pyacsharedmemory.py", "read_physics"): "decode",
+    ("pyacsharedmemory.py", "read_graphics"): "decode",
+    ("pyacsharedmemory.py", "read_physic_map"): "decode",
+    ("pyacsharedmemory.py", "read_graphics_map"): "decode",
+    ("pyacsharedmemory.py", "read_static_map"): "decode",
+    ("pyacsharedmemory.py", "decode_physics"): "decode",
+    ("pyacsharedmemory.py", "decode_graphics"): "decode",
+    ("pyacsharedmemory.py", "decode_static"): "decode",
+    ("pyacsharedmemory.py", "refresh"): "decode",
+    ("pyacsharedmemory.py", "snapshot"): "decode",
+    ("pyacsharedmemory.py", "get"): "decode",
+    ("pyacsharedmemory.py", "_string"): "strip",
+    ("utils.py", "strip_nulls_from_dataclass"): "strip",
+    ("pyacsharedmemory.py", "to_dict"): "dict",
+    ("utils.py", "dataclass_to_dict"): "dict",
+    ("server.py", "encode"): "dict",
+    ("codec.py", "encode"): "dict",
+    ("topics.py", "split"): "dict",
+    ("sinks.py", "encode"): "encode",
+    ("sinks.py", "encode_json"): "encode",
+    ("sinks.py", "encode_json_batch"): "encode",
+    ("codec.py", "encode_message"): "encode",
+    ("codec.py", "encode_batch"): "encode",
+    ("sinks.py", "send"): "send",
+    ("sinks.py", "flush"): "send",
+    ("recorder.py", "record"): "record",
+    ("recorder.py", "write"): "record",
+    # Waiting, not working: the scheduler (including its spin), queues,
+    # sockets
+    ("scheduler.py", "wait"): "idle",
+    ("threading.py", "wait"): "idle",
+    ("selectors.py", "select"): "idle",
+    ("client.py", "_loop"): "idle",
+    ("~", "<method 'acquire' of '_thread.lock' objects>"): "idle",
+    ("~", "<built-in method time.sleep>"): "idle",
+    ("~", "<built-in method select.select>"): "idle",
+}
+
+STAGES = ("decode", "strip", "dict", "encode", "send", "record", "other", "idle")
+
+
+def classify(filename: str, name: str) -> Optional[str]:
+    return STAGE_RULES.get((os.path.basename(filename), name))
+
+
+def _label(filename: str, line: int, name: str) -> str:
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class CallProfiler:
+    """
+    cProfile over every thread. Up to Python 3.11 a profiler only sees
+    the thread that enabled it, so threads started after start() enable
+    their own; from 3.12 one profiler records all threads.
+    """
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self.stats: Optional[pstats.Stats] = None
+
+    def _thread_hook(self, frame, event, arg) -> None:
+        # Replaced by the C profiler of the thread on its first event
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        profile.enable()
+
+    def start(self) -> None:
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._thread_hook)
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        profile.enable()
+
+    def stop(self) -> None:
+        self.profiles[0].disable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)
+        self.stats = pstats.Stats(*self.profiles)
+
+    def stage_times(self) -> Dict[str, Dict[tuple, float]]:
+        """
+        Own time of every function, split over stages: by its rule, or
+        in proportion to the time of its calls from each caller.
+        """
+        stats = self.stats.stats
+        shares: Dict[tuple, Dict[str, float]] = {}
+
+        def share(func: tuple, seen: frozenset) -> Dict[str, float]:
+            if func in shares:
+                return shares[func]
+            stage = classify(func[0], func[2])
+            if stage is not None:
+                result = {stage: 1.0}
+            else:
+                weights = {
+                    caller: edge[3] or edge[1]
+                    for caller, edge in stats[func][4].items()
+                    if caller in stats and caller not in seen
+                }
+                total = sum(weights.values())
+                result = {} if total else {"other": 1.0}
+                for caller, weight in weights.items():
+                    for name, fraction in share(caller, seen | {func}).items():
+                        result[name] = result.get(name, 0.0) + fraction * weight / total
+            shares[func] = result
+            return result
+
+        times: Dict[str, Dict[tuple, float]] = {stage: {} for stage in STAGES}
+        for func, (_, _, own, _, _) in stats.items():
+            for stage, fraction in share(func, frozenset()).items():
+                times[stage][func] = times[stage].get(func, 0.0) + own * fraction
+        return times
+
+    def report(self, top: int = 8) -> List[str]:
+        stats = self.stats.stats
+        times = self.stage_times()
+        totals = {stage: sum(funcs.values()) for stage, funcs in times.items()}
+        busy = sum(totals.values()) - totals["idle"]
+        lines = [
+            f"[Profile] {len(self.profiles)} threads, {self.stats.total_calls} calls, "
+            f"{busy:.3f}s busy, {totals['idle']:.3f}s idle"
+        ]
+        for stage in STAGES:
+            funcs = times[stage]
+            if not totals[stage]:
+                continue
+            share = "" if stage == "idle" else f" ({100 * totals[stage] / busy:.1f}%)"
+            lines.append(f"[Profile] {stage}: {totals[stage]:.3f}s{share}")
+            for func, seconds in sorted(funcs.items(), key=lambda f: -f[1])[:top]:
+                calls = stats[func][1]
+                lines.append(
+                    f"[Profile]     {_label(*func)}: {calls} calls, {seconds:.3f}s, "
+                    f"{1e6 * stats[func][2] / calls if calls else 0.0:.1f}us/call"
+                )
+        return lines
+
+    def save(self, prefix: str) -> List[str]:
+        self.stats.dump_stats(prefix + ".pstats")
+        return [prefix + ".pstats"]
+
+
+class SamplingProfiler:
+    """
+    Takes the stack of every thread each `interval` seconds from a
+    background thread. Cheap enough to leave running during a session:
+    the profiled threads are not instrumented at all.
+
+    The sampler needs the GIL to look at the other threads; by default a
+    running thread only gives it up after 5 ms or when it blocks, which
+    would put nearly every sample on a blocking call. While sampling, the
+    switch interval is lowered to `switch_interval`.
+    """
+
+    def __init__(self, interval: float = 0.005, switch_interval: float = 0.0001):
+        self.interval = interval
+        self.switch_interval = switch_interval
+        self._previous_switch_interval = sys.getswitchinterval()
+        # (thread name, code objects from the outermost frame) -> samples
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name="sampler", daemon=True)
+
+    def start(self) -> None:
+        self._previous_switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self.switch_interval, self._previous_switch_interval))
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._previous_switch_interval)
+
+    def run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self.stacks[(names.get(ident, str(ident)), tuple(codes))] += 1
+            self.samples += 1
+
+    def stage_samples(self) -> Dict[str, Counter]:
+        """
+        Samples per stage (the innermost frame with a rule decides) and
+        function they were taken in.
+        """
+        stages = {stage: Counter() for stage in STAGES}
+        for (_, codes), count in self.stacks.items():
+            stage = "other"
+            for code in reversed(codes):
+                stage = classify(code.co_filename, code.co_name) or stage
+                if stage != "other":
+                    break
+            leaf = codes[-1]
+            stages[stage][
+                (leaf.co_filename, leaf.co_firstlineno, leaf.co_name)
+            ] += count
+        return stages
+
+    def report(self, top: int = 8) -> List[str]:
+        stages = self.stage_samples()
+        totals = {stage: sum(funcs.values()) for stage, funcs in stages.items()}
+        busy = sum(totals.values()) - totals["idle"] or 1
+        lines = [
+            f"[Profile] {self.samples} samples every {1e3 * self.interval:g}ms, "
+            f"{busy} busy and {totals['idle']} idle thread stacks"
+        ]
+        for stage in STAGES:
+            funcs = stages[stage]
+            if not totals[stage] or stage == "idle":
+                continue
+            lines.append(
+                f"[Profile] {stage}: {totals[stage]} samples "
+                f"({100 * totals[stage] / busy:.1f}%)"
+            )
+            for func, count in funcs.most_common(top):
+                lines.append(
+                    f"[Profile]     {_label(*func)}: {count} samples "
+                    f"({100 * count / busy:.1f}%)"
+                )
+        return lines
+
+    def save(self, prefix: str) -> List[str]:
+        """
+        Writes the stacks in the folded format of flamegraph.pl and
+        speedscope.
+        """
+        with open(prefix + ".folded", "w") as fp:
+            for (thread, codes), count in sorted(
+                self.stacks.items(), key=lambda item: item[0][0]
+            ):
+                frames = ";".join(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:"
+                    f"{code.co_firstlineno})"
+                    for code in codes
+                )
+                fp.write(f"{thread};{frames} {count}\n")
+        return [prefix + ".folded"]
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        choices=("cprofile", "sample"),
+        help="profile the run: cProfile, or low-overhead stack sampling",
+    )
+    parser.add_argument("--profile-ticks", type=int, help="stop after this many ticks")
+    parser.add_argument(
+        "--profile-seconds", type=float, help="stop after this many seconds"
+    )
+    parser.add_argument("--profile-out", default="profile", help="output path prefix")
+    parser.add_argument(
+        "--sample-interval",
+        type=float,
+        default=5.0,
+        help="milliseconds between stack samples",
+    )
+
+
+def create_profiler(args: argparse.Namespace):
+    """
+    The profiler selected by add_arguments() options, or None.
+    """
+    if args.profile == "cprofile":
+        return CallProfiler()
+    if args.profile == "sample":
+        return SamplingProfiler(args.sample_interval / 1000.0)
+    return None
+
+
+def finish(profiler, prefix: str) -> None:
+    """
+    Stops the profiler, logs the per-stage report and writes it, with
+    the raw profile, next to `prefix`.
+    """
+    profiler.stop()
+    lines = profiler.report()
+    paths = profiler.save(prefix)
+    with open(prefix + ".txt", "w") as fp:
+        fp.write("\n".join(lines) + "\n")
+    for line in lines:
+        logging.info(line)
+    logging.info(f"[Profile] Wrote {', '.join(paths + [prefix + '.txt'])}")
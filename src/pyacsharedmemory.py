@@ -1,15 +1,21 @@
 from __future__ import annotations
 
-import copy
+import enum
 import mmap
 import struct
-from dataclasses import dataclass
-from typing import Any, List, Optional
+from dataclasses import dataclass, fields as dataclass_fields
+from typing import Any, List, Optional, Tuple
 from src.utils import dataclass_to_dict
+from src.sources import FrameSource, TagnameSource
 from src.schemas import SharedMemoryTimeout, AC_STATUS, AC_SESSION_TYPE, AC_FLAG_TYPE
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only needed for the structured views
+    np = None
 
-@dataclass
+
+@dataclass(slots=True)
 class Vector3f:
     x: float
     y: float
@@ -19,7 +25,7 @@ class Vector3f:
         return f"x: {self.x}, y: {self.y}, z: {self.z}"
 
 
-@dataclass
+@dataclass(slots=True)
 class Wheels:
     front_left: float
     front_right: float
@@ -31,7 +37,7 @@ class Wheels:
             \nRL: {self.rear_left}\nRR: {self.rear_right}"
 
 
-@dataclass
+@dataclass(slots=True)
 class ContactPoint:
     front_left: Vector3f
     front_right: Vector3f
@@ -47,12 +53,21 @@ class ContactPoint:
 
         return ContactPoint(fl, fr, rl, rr)
 
+    @staticmethod
+    def from_flat(values: tuple) -> Any:
+        return ContactPoint(
+            Vector3f(*values[0:3]),
+            Vector3f(*values[3:6]),
+            Vector3f(*values[6:9]),
+            Vector3f(*values[9:12]),
+        )
+
     def __str__(self) -> str:
         return f"FL: {self.front_left},\nFR: {self.front_right},\
             \nRL: {self.rear_left},\nRR: {self.rear_right}"
 
 
-@dataclass
+@dataclass(slots=True)
 class CarDamage:
     front: float
     rear: float
@@ -61,7 +76,7 @@ class CarDamage:
     center: float
 
 
-@dataclass
+@dataclass(slots=True)
 class PhysicsMap:
 
     packed_id: int
@@ -132,7 +147,7 @@ class PhysicsMap:
         return dataclass_to_dict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class GraphicsMap:
     packet_id: int
     status: AC_STATUS
@@ -177,7 +192,7 @@ class GraphicsMap:
         return dataclass_to_dict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class StaticsMap:
 
     sm_version: str
@@ -232,13 +247,16 @@ class StaticsMap:
         return dataclass_to_dict(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class AC_map:
 
     Physics: PhysicsMap
     Graphics: GraphicsMap
     Static: StaticsMap
 
+    # (physics packet ID, graphics packet ID) the frame was built from
+    tag: Tuple[int, int] = (0, 0)
+
     def to_dict(self) -> dict:
         return dataclass_to_dict(self)
 
@@ -276,306 +294,974 @@ class acSM(mmap.mmap):
         return string_bytes.decode("utf-16", errors="ignore")
 
 
-def read_physic_map(physic_map: acSM) -> PhysicsMap:
-    physic_map.seek(0)
-    temp = {
-        "packetID": physic_map.unpack_value("i"),
-        "gas": physic_map.unpack_value("f"),
-        "brake": physic_map.unpack_value("f"),
-        "fuel": physic_map.unpack_value("f"),
-        "gear": physic_map.unpack_value("i"),
-        "rpm": physic_map.unpack_value("i"),
-        "steerAngle": physic_map.unpack_value("f"),
-        "speedKmh": physic_map.unpack_value("f"),
-        "velocity": physic_map.unpack_array("f", 3),
-        "accG": physic_map.unpack_array("f", 3),
-        "wheelSlip": physic_map.unpack_array("f", 4),
-        "wheelLoad": physic_map.unpack_array("f", 4),
-        "wheelsPressure": physic_map.unpack_array("f", 4),
-        "wheelAngularSpeed": physic_map.unpack_array("f", 4),
-        "tyreWear": physic_map.unpack_array("f", 4),
-        "tyreDirtyLevel": physic_map.unpack_array("f", 4),
-        "tyreCoreTemperature": physic_map.unpack_array("f", 4),
-        "camberRAD": physic_map.unpack_array("f", 4),
-        "suspensionTravel": physic_map.unpack_array("f", 4),
-        "drs": physic_map.unpack_value("f"),
-        "tc": physic_map.unpack_value("f"),
-        "heading": physic_map.unpack_value("f"),
-        "pitch": physic_map.unpack_value("f"),
-        "roll": physic_map.unpack_value("f"),
-        "cgHeight": physic_map.unpack_value("f"),
-        "carDamage": physic_map.unpack_array("f", 5),
-        "numberOfTyresOut": physic_map.unpack_value("i"),
-        "pitLimiterOn": physic_map.unpack_value("i"),
-        "abs": physic_map.unpack_value("f"),
-        "kersCharge": physic_map.unpack_value("f"),
-        "kersInput": physic_map.unpack_value("f"),
-        "autoshifterOn": physic_map.unpack_value("i"),
-        "rideHeight": physic_map.unpack_array("f", 2),
-        "turboBoost": physic_map.unpack_value("f"),
-        "ballast": physic_map.unpack_value("f"),
-        "airDensity": physic_map.unpack_value("f"),
-        "airTemp": physic_map.unpack_value("f"),
-        "roadTemp": physic_map.unpack_value("f"),
-        "localAngularVel": physic_map.unpack_array("f", 3),
-        "FinalFF": physic_map.unpack_value("f"),
-        "performanceMeter": physic_map.unpack_value("f"),
-        "engineBrake": physic_map.unpack_value("i"),
-        "ersRecoveryLevel": physic_map.unpack_value("i"),
-        "ersPowerLevel": physic_map.unpack_value("i"),
-        "ersHeatCharging": physic_map.unpack_value("i"),
-        "ersIsCharging": physic_map.unpack_value("i"),
-        "kersCurrentKJ": physic_map.unpack_value("f"),
-        "drsAvailable": physic_map.unpack_value("i"),
-        "drsEnabled": physic_map.unpack_value("i"),
-        "brakeTemp": physic_map.unpack_array("f", 4),
-        "clutch": physic_map.unpack_value("f"),
-        "tyreTempI": physic_map.unpack_array("f", 4),
-        "tyreTempM": physic_map.unpack_array("f", 4),
-        "tyreTempO": physic_map.unpack_array("f", 4),
-        "isAIControlled": physic_map.unpack_value("i"),
-        "tyreContactPoint": physic_map.unpack_array2D("f", 4, 3),
-        "tyreContactNormal": physic_map.unpack_array2D("f", 4, 3),
-        "tyreContactHeading": physic_map.unpack_array2D("f", 4, 3),
-        "brakeBias": physic_map.unpack_value("f"),
-        "localVelocity": physic_map.unpack_array("f", 3),
-    }
+# Page layouts, in SPageFile order. Every entry is (name, type, shape):
+#   "i" / "f": int32 / float32, shape () for a scalar
+#   "s": wchar string, shape (n,) with n the number of UTF-16 code units
+#   "x": padding bytes, shape (n,)
+# Strings that are followed by alignment padding include that padding,
+# since it has always been decoded together with the string.
+PHYSICS_LAYOUT = (
+    ("packetID", "i", ()),
+    ("gas", "f", ()),
+    ("brake", "f", ()),
+    ("fuel", "f", ()),
+    ("gear", "i", ()),
+    ("rpm", "i", ()),
+    ("steerAngle", "f", ()),
+    ("speedKmh", "f", ()),
+    ("velocity", "f", (3,)),
+    ("accG", "f", (3,)),
+    ("wheelSlip", "f", (4,)),
+    ("wheelLoad", "f", (4,)),
+    ("wheelsPressure", "f", (4,)),
+    ("wheelAngularSpeed", "f", (4,)),
+    ("tyreWear", "f", (4,)),
+    ("tyreDirtyLevel", "f", (4,)),
+    ("tyreCoreTemperature", "f", (4,)),
+    ("camberRAD", "f", (4,)),
+    ("suspensionTravel", "f", (4,)),
+    ("drs", "f", ()),
+    ("tc", "f", ()),
+    ("heading", "f", ()),
+    ("pitch", "f", ()),
+    ("roll", "f", ()),
+    ("cgHeight", "f", ()),
+    ("carDamage", "f", (5,)),
+    ("numberOfTyresOut", "i", ()),
+    ("pitLimiterOn", "i", ()),
+    ("abs", "f", ()),
+    ("kersCharge", "f", ()),
+    ("kersInput", "f", ()),
+    ("autoshifterOn", "i", ()),
+    ("rideHeight", "f", (2,)),
+    ("turboBoost", "f", ()),
+    ("ballast", "f", ()),
+    ("airDensity", "f", ()),
+    ("airTemp", "f", ()),
+    ("roadTemp", "f", ()),
+    ("localAngularVel", "f", (3,)),
+    ("FinalFF", "f", ()),
+    ("performanceMeter", "f", ()),
+    ("engineBrake", "i", ()),
+    ("ersRecoveryLevel", "i", ()),
+    ("ersPowerLevel", "i", ()),
+    ("ersHeatCharging", "i", ()),
+    ("ersIsCharging", "i", ()),
+    ("kersCurrentKJ", "f", ()),
+    ("drsAvailable", "i", ()),
+    ("drsEnabled", "i", ()),
+    ("brakeTemp", "f", (4,)),
+    ("clutch", "f", ()),
+    ("tyreTempI", "f", (4,)),
+    ("tyreTempM", "f", (4,)),
+    ("tyreTempO", "f", (4,)),
+    ("isAIControlled", "i", ()),
+    ("tyreContactPoint", "f", (4, 3)),
+    ("tyreContactNormal", "f", (4, 3)),
+    ("tyreContactHeading", "f", (4, 3)),
+    ("brakeBias", "f", ()),
+    ("localVelocity", "f", (3,)),
+)
+
+GRAPHICS_LAYOUT = (
+    ("packetID", "i", ()),
+    ("status", "i", ()),
+    ("session", "i", ()),
+    ("currentTime", "s", (15,)),
+    ("lastTime", "s", (15,)),
+    ("bestTime", "s", (15,)),
+    ("split", "s", (15,)),
+    ("completedLaps", "i", ()),
+    ("position", "i", ()),
+    ("iCurrentTime", "i", ()),
+    ("iLastTime", "i", ()),
+    ("iBestTime", "i", ()),
+    ("sessionTimeLeft", "f", ()),
+    ("distanceTraveled", "f", ()),
+    ("isInPit", "i", ()),
+    ("currentSectorIndex", "i", ()),
+    ("lastSectorTime", "i", ()),
+    ("numberOfLaps", "i", ()),
+    # TyreCompound (33 chars) + 2 bytes padding
+    ("tyreCompound", "s", (34,)),
+    ("replayTimeMultiplier", "f", ()),
+    ("normalizedCarPosition", "f", ()),
+    ("carCoordinates", "f", (3,)),
+    ("penaltyTime", "f", ()),
+    ("flag", "i", ()),
+    ("idealLineOn", "i", ()),
+    # (since 1.5)
+    ("isInPitLane", "i", ()),
+    ("surfaceGrip", "f", ()),
+    # (since 1.13)
+    ("mandatoryPitDone", "i", ()),
+)
+
+STATIC_LAYOUT = (
+    ("smVersion", "s", (15,)),
+    ("acVersion", "s", (15,)),
+    ("numberOfSessions", "i", ()),
+    ("numCars", "i", ()),
+    ("carModel", "s", (33,)),
+    ("track", "s", (33,)),
+    ("playerName", "s", (33,)),
+    ("playerSurname", "s", (33,)),
+    # PlayerNick (33 chars) + 2 bytes padding
+    ("playerNick", "s", (34,)),
+    ("sectorCount", "i", ()),
+    ("maxTorque", "f", ()),
+    ("maxPower", "f", ()),
+    ("maxRpm", "i", ()),
+    ("maxFuel", "f", ()),
+    ("suspensionMaxTravel", "f", (4,)),
+    ("tyreRadius", "f", (4,)),
+    ("maxTurboBoost", "f", ()),
+    ("deprecated_1", "f", ()),
+    ("deprecated_2", "f", ()),
+    ("penaltiesEnabled", "i", ()),
+    ("aidFuelRate", "f", ()),
+    ("aidTireRate", "f", ()),
+    ("aidMechanicalDamage", "f", ()),
+    ("AllowTyreBlankets", "i", ()),
+    ("aidStability", "f", ()),
+    ("aidAutoClutch", "i", ()),
+    ("aidAutoBlip", "i", ()),
+    ("hasDRS", "i", ()),
+    ("hasERS", "i", ()),
+    ("hasKERS", "i", ()),
+    ("kersMaxJ", "f", ()),
+    ("engineBrakeSettingsCount", "i", ()),
+    ("ersPowerControllerCount", "i", ()),
+    # (since 1.7.1)
+    ("trackSplineLength", "f", ()),
+    # TrackConfiguration (15 chars) + 2 bytes padding
+    ("trackConfiguration", "s", (16,)),
+    # (since 1.10.2)
+    ("ersMaxJ", "f", ()),
+    # (since 1.13)
+    ("isTimedRace", "i", ()),
+    ("hasExtraLap", "i", ()),
+    # CarSkin (33 chars) + 2 bytes padding
+    ("carSkin", "s", (34,)),
+    ("reversedGridPositions", "i", ()),
+    ("PitWindowStart", "i", ()),
+    ("PitWindowEnd", "i", ()),
+)
+
+PHYSICS_PAGE_SIZE = 800
+GRAPHICS_PAGE_SIZE = 1588
+STATIC_PAGE_SIZE = 784
+
+
+def field_count(shape: tuple) -> int:
+    count = 1
+    for dim in shape:
+        count *= dim
+    return count
+
+
+def compile_layout(layout: tuple) -> tuple:
+    """
+    Builds the struct.Struct for a page layout, together with a map from
+    field name to the index (or slice, for arrays) in the unpacked tuple.
+    """
+    format = "="
+    index = {}
+    position = 0
+    for name, value_type, shape in layout:
+        count = field_count(shape)
+        if value_type == "s":
+            format += f"{2 * count}s"
+            index[name] = position
+            position += 1
+        elif value_type == "x":
+            format += f"{count}x"
+        elif shape:
+            format += f"{count}{value_type}"
+            index[name] = slice(position, position + count)
+            position += count
+        else:
+            format += value_type
+            index[name] = position
+            position += 1
+    return struct.Struct(format), index
+
+
+PHYSICS_STRUCT, PHYSICS_INDEX = compile_layout(PHYSICS_LAYOUT)
+GRAPHICS_STRUCT, GRAPHICS_INDEX = compile_layout(GRAPHICS_LAYOUT)
+STATIC_STRUCT, STATIC_INDEX = compile_layout(STATIC_LAYOUT)
+
+
+def layout_dtype(layout: tuple, page_size: int) -> Any:
+    """
+    Builds a NumPy structured dtype for a page layout. Field names mirror
+    the SPageFile names, strings are exposed as raw wchar (uint16) arrays
+    and the itemsize spans the whole page.
+    """
+    if np is None:
+        raise ImportError("numpy is required for the structured page views")
+
+    names, formats, offsets = [], [], []
+    offset = 0
+    for name, value_type, shape in layout:
+        count = field_count(shape)
+        if value_type == "s":
+            names.append(name)
+            formats.append(("<u2", shape))
+            offsets.append(offset)
+            offset += 2 * count
+        elif value_type == "x":
+            offset += count
+        else:
+            names.append(name)
+            formats.append((f"<{value_type}4", shape) if shape else f"<{value_type}4")
+            offsets.append(offset)
+            offset += 4 * count
 
-    return PhysicsMap(
-        temp["packetID"],
-        temp["gas"],
-        temp["brake"],
-        temp["fuel"],
-        temp["gear"],
-        temp["rpm"],
-        temp["steerAngle"],
-        temp["speedKmh"],
-        Vector3f(*temp["velocity"]),
-        Vector3f(*temp["accG"]),
-        Wheels(*temp["wheelSlip"]),
-        Wheels(*temp["wheelsPressure"]),
-        Wheels(*temp["wheelAngularSpeed"]),
-        Wheels(*temp["tyreCoreTemperature"]),
-        Wheels(*temp["suspensionTravel"]),
-        temp["drs"],
-        temp["tc"],
-        temp["heading"],
-        temp["pitch"],
-        temp["roll"],
-        CarDamage(*temp["carDamage"]),
-        bool(temp["pitLimiterOn"]),
-        temp["abs"],
-        bool(temp["autoshifterOn"]),
-        temp["turboBoost"],
-        temp["airTemp"],
-        temp["roadTemp"],
-        Vector3f(*temp["localAngularVel"]),
-        temp["FinalFF"],
-        Wheels(*temp["brakeTemp"]),
-        temp["clutch"],
-        bool(temp["isAIControlled"]),
-        ContactPoint.from_list(temp["tyreContactPoint"]),
-        ContactPoint.from_list(temp["tyreContactNormal"]),
-        ContactPoint.from_list(temp["tyreContactHeading"]),
-        temp["brakeBias"],
-        Vector3f(*temp["localVelocity"]),
+    return np.dtype(
+        {"names": names, "formats": formats, "offsets": offsets, "itemsize": page_size}
     )
 
 
-def read_graphics_map(graphic_map: acSM) -> GraphicsMap:
-    graphic_map.seek(0)
-    temp = {
-        "packetID": graphic_map.unpack_value("i"),
-        "status": AC_STATUS(graphic_map.unpack_value("i")),
-        "session": AC_SESSION_TYPE(graphic_map.unpack_value("i")),
-        "currentTime": graphic_map.unpack_string(15),
-        "lastTime": graphic_map.unpack_string(15),
-        "bestTime": graphic_map.unpack_string(15),
-        "split": graphic_map.unpack_string(15),
-        "completedLaps": graphic_map.unpack_value("i"),
-        "position": graphic_map.unpack_value("i"),
-        "iCurrentTime": graphic_map.unpack_value("i"),
-        "iLastTime": graphic_map.unpack_value("i"),
-        "iBestTime": graphic_map.unpack_value("i"),
-        "sessionTimeLeft": graphic_map.unpack_value("f"),
-        "distanceTraveled": graphic_map.unpack_value("f"),
-        "isInPit": graphic_map.unpack_value("i"),
-        "currentSectorIndex": graphic_map.unpack_value("i"),
-        "lastSectorTime": graphic_map.unpack_value("i"),
-        "numberOfLaps": graphic_map.unpack_value("i"),
-        # TyreCompound (33 chars). Usually need padding=2 if it's UTF-16
-        "tyreCompound": graphic_map.unpack_string(33, padding=2),
-        "replayTimeMultiplier": graphic_map.unpack_value("f"),
-        "normalizedCarPosition": graphic_map.unpack_value("f"),
-        # CarCoordinates (3 floats)
-        "carCoordinates": graphic_map.unpack_array("f", 3),
-        "penaltyTime": graphic_map.unpack_value("f"),
-        "flag": AC_FLAG_TYPE(graphic_map.unpack_value("i")),
-        "idealLineOn": graphic_map.unpack_value("i"),
-        # (since 1.5) IsInPitLane, SurfaceGrip
-        "isInPitLane": graphic_map.unpack_value("i"),
-        "surfaceGrip": graphic_map.unpack_value("f"),
-        # (since 1.13) MandatoryPitDone
-        "mandatoryPitDone": graphic_map.unpack_value("i"),
-    }
+if np is not None:
+    PHYSICS_DTYPE = layout_dtype(PHYSICS_LAYOUT, PHYSICS_PAGE_SIZE)
+    GRAPHICS_DTYPE = layout_dtype(GRAPHICS_LAYOUT, GRAPHICS_PAGE_SIZE)
+    STATIC_DTYPE = layout_dtype(STATIC_LAYOUT, STATIC_PAGE_SIZE)
+else:
+    PHYSICS_DTYPE = GRAPHICS_DTYPE = STATIC_DTYPE = None
 
-    return GraphicsMap(
-        packet_id=temp["packetID"],
-        status=temp["status"],
-        session_type=temp["session"],
-        current_time_str=temp["currentTime"],
-        last_time_str=temp["lastTime"],
-        best_time_str=temp["bestTime"],
-        split_str=temp["split"],
-        completed_laps=temp["completedLaps"],
-        position=temp["position"],
-        i_current_time=temp["iCurrentTime"],
-        i_last_time=temp["iLastTime"],
-        i_best_time=temp["iBestTime"],
-        session_time_left=temp["sessionTimeLeft"],
-        distance_traveled=temp["distanceTraveled"],
-        is_in_pit=bool(temp["isInPit"]),
-        current_sector_index=temp["currentSectorIndex"],
-        last_sector_time=temp["lastSectorTime"],
-        number_of_laps=temp["numberOfLaps"],
-        tyre_compound=temp["tyreCompound"],
-        replay_time_multiplier=temp["replayTimeMultiplier"],
-        normalized_car_position=temp["normalizedCarPosition"],
-        car_coordinates=Vector3f(*temp["carCoordinates"]),
-        penalty_time=temp["penaltyTime"],
-        flag=temp["flag"],
-        ideal_line_on=bool(temp["idealLineOn"]),
-        is_in_pit_lane=bool(temp["isInPitLane"]),
-        surface_grip=temp["surfaceGrip"],
-        mandatory_pit_done=bool(temp["mandatoryPitDone"]),
-    )
+
+def allocate_frames(dtype: Any, count: int) -> Any:
+    """
+    Preallocates a frame buffer for `count` pages of the given dtype.
+    Copy a page into it with `frames[i] = asm.physicNP[0]` (one memcpy).
+    """
+    if np is None:
+        raise ImportError("numpy is required for the structured page views")
+    return np.zeros(count, dtype=dtype)
+
+
+def _string(raw: bytes) -> str:
+    # Shared memory has some empty bits allocated, strip them right away
+    return raw.decode("utf-16", errors="ignore").replace("\x00", "")
+
+
+def read_physic_map(physic_map: acSM) -> PhysicsMap:
+    return decode_physics(physic_map)
+
+
+def read_graphics_map(graphic_map: acSM) -> GraphicsMap:
+    return decode_graphics(graphic_map)
 
 
 def read_static_map(static_map: acSM) -> StaticsMap:
-    static_map.seek(0)
-
-    temp = {
-        "smVersion": static_map.unpack_string(15),
-        "acVersion": static_map.unpack_string(15),
-        "numberOfSessions": static_map.unpack_value("i"),
-        "numCars": static_map.unpack_value("i"),
-        "carModel": static_map.unpack_string(33),
-        "track": static_map.unpack_string(33),
-        "playerName": static_map.unpack_string(33),
-        "playerSurname": static_map.unpack_string(33),
-        "playerNick": static_map.unpack_string(33, 2),
-        "sectorCount": static_map.unpack_value("i"),
-        "maxTorque": static_map.unpack_value("f"),
-        "maxPower": static_map.unpack_value("f"),
-        "maxRpm": static_map.unpack_value("i"),
-        "maxFuel": static_map.unpack_value("f"),
-        "suspensionMaxTravel": static_map.unpack_array("f", 4),
-        "tyreRadius": static_map.unpack_array("f", 4),
-        "maxTurboBoost": static_map.unpack_value("f"),
-        "deprecated_1": static_map.unpack_value("f"),
-        "deprecated_2": static_map.unpack_value("f"),
-        "penaltiesEnabled": static_map.unpack_value("i"),
-        "aidFuelRate": static_map.unpack_value("f"),
-        "aidTireRate": static_map.unpack_value("f"),
-        "aidMechanicalDamage": static_map.unpack_value("f"),
-        "AllowTyreBlankets": static_map.unpack_value("i"),
-        "aidStability": static_map.unpack_value("f"),
-        "aidAutoClutch": static_map.unpack_value("i"),
-        "aidAutoBlip": static_map.unpack_value("i"),
-        "hasDRS": static_map.unpack_value("i"),
-        "hasERS": static_map.unpack_value("i"),
-        "hasKERS": static_map.unpack_value("i"),
-        "kersMaxJ": static_map.unpack_value("f"),
-        "engineBrakeSettingsCount": static_map.unpack_value("i"),
-        "ersPowerControllerCount": static_map.unpack_value("i"),
-        "trackSplineLength": static_map.unpack_value("f"),
-        "trackConfiguration": static_map.unpack_string(15, 2),
-        "ersMaxJ": static_map.unpack_value("f"),
-        "isTimedRace": static_map.unpack_value("i"),
-        "hasExtraLap": static_map.unpack_value("i"),
-        "carSkin": static_map.unpack_string(33, 2),
-        "reversedGridPositions": static_map.unpack_value("i"),
-        "PitWindowStart": static_map.unpack_value("i"),
-        "PitWindowEnd": static_map.unpack_value("i"),
+    return decode_static(static_map)
+
+
+def compile_fields(layout: tuple) -> dict:
+    """
+    Maps every field of a page layout to its own (struct.Struct, offset),
+    so a single field can be decoded without touching the rest of the page.
+    """
+    fields = {}
+    offset = 0
+    for name, value_type, shape in layout:
+        count = field_count(shape)
+        if value_type == "s":
+            size, format = 2 * count, f"={2 * count}s"
+        elif value_type == "x":
+            offset += count
+            continue
+        else:
+            size, format = 4 * count, f"={count}{value_type}"
+        is_array = bool(shape) and value_type != "s"
+        fields[name] = (struct.Struct(format), offset, is_array)
+        offset += size
+    return fields
+
+
+def _vector3f(values: tuple) -> Vector3f:
+    return Vector3f(*values)
+
+
+def _wheels(values: tuple) -> Wheels:
+    return Wheels(*values)
+
+
+def _car_damage(values: tuple) -> CarDamage:
+    return CarDamage(*values)
+
+
+# Map field -> (page field, converter), in map field order
+PHYSICS_FIELDS = (
+    ("packed_id", "packetID", None),
+    ("gas", "gas", None),
+    ("brake", "brake", None),
+    ("fuel", "fuel", None),
+    ("gear", "gear", None),
+    ("rpm", "rpm", None),
+    ("steer_angle", "steerAngle", None),
+    ("speed_kmh", "speedKmh", None),
+    ("velocity", "velocity", _vector3f),
+    ("g_force", "accG", _vector3f),
+    ("wheel_slip", "wheelSlip", _wheels),
+    ("wheel_pressure", "wheelsPressure", _wheels),
+    ("wheel_angular_s", "wheelAngularSpeed", _wheels),
+    ("tyre_core_temp", "tyreCoreTemperature", _wheels),
+    ("suspension_travel", "suspensionTravel", _wheels),
+    ("drs", "drs", None),
+    ("tc", "tc", None),
+    ("heading", "heading", None),
+    ("pitch", "pitch", None),
+    ("roll", "roll", None),
+    ("car_damage", "carDamage", _car_damage),
+    ("pit_limiter_on", "pitLimiterOn", bool),
+    ("abs", "abs", None),
+    ("autoshifter_on", "autoshifterOn", bool),
+    ("turbo_boost", "turboBoost", None),
+    ("air_temp", "airTemp", None),
+    ("road_temp", "roadTemp", None),
+    ("local_angular_vel", "localAngularVel", _vector3f),
+    ("final_ff", "FinalFF", None),
+    ("brake_temp", "brakeTemp", _wheels),
+    ("clutch", "clutch", None),
+    ("is_ai_controlled", "isAIControlled", bool),
+    ("tyre_contact_point", "tyreContactPoint", ContactPoint.from_flat),
+    ("tyre_contact_normal", "tyreContactNormal", ContactPoint.from_flat),
+    ("tyre_contact_heading", "tyreContactHeading", ContactPoint.from_flat),
+    ("brake_bias", "brakeBias", None),
+    ("local_velocity", "localVelocity", _vector3f),
+)
+
+GRAPHICS_FIELDS = (
+    ("packet_id", "packetID", None),
+    ("status", "status", AC_STATUS),
+    ("session_type", "session", AC_SESSION_TYPE),
+    ("current_time_str", "currentTime", _string),
+    ("last_time_str", "lastTime", _string),
+    ("best_time_str", "bestTime", _string),
+    ("split_str", "split", _string),
+    ("completed_laps", "completedLaps", None),
+    ("position", "position", None),
+    ("i_current_time", "iCurrentTime", None),
+    ("i_last_time", "iLastTime", None),
+    ("i_best_time", "iBestTime", None),
+    ("session_time_left", "sessionTimeLeft", None),
+    ("distance_traveled", "distanceTraveled", None),
+    ("is_in_pit", "isInPit", bool),
+    ("current_sector_index", "currentSectorIndex", None),
+    ("last_sector_time", "lastSectorTime", None),
+    ("number_of_laps", "numberOfLaps", None),
+    ("tyre_compound", "tyreCompound", _string),
+    ("replay_time_multiplier", "replayTimeMultiplier", None),
+    ("normalized_car_position", "normalizedCarPosition", None),
+    ("car_coordinates", "carCoordinates", _vector3f),
+    ("penalty_time", "penaltyTime", None),
+    ("flag", "flag", AC_FLAG_TYPE),
+    ("ideal_line_on", "idealLineOn", bool),
+    ("is_in_pit_lane", "isInPitLane", bool),
+    ("surface_grip", "surfaceGrip", None),
+    ("mandatory_pit_done", "mandatoryPitDone", bool),
+)
+
+
+STATIC_FIELDS = (
+    ("sm_version", "smVersion", _string),
+    ("ac_version", "acVersion", _string),
+    ("number_of_session", "numberOfSessions", None),
+    ("num_cars", "numCars", None),
+    ("car_model", "carModel", _string),
+    ("track", "track", _string),
+    ("player_name", "playerName", _string),
+    ("player_surname", "playerSurname", _string),
+    ("player_nick", "playerNick", _string),
+    ("sector_count", "sectorCount", None),
+    ("max_torque", "maxTorque", None),
+    ("max_power", "maxPower", None),
+    ("max_rpm", "maxRpm", None),
+    ("max_fuel", "maxFuel", None),
+    ("suspension_max_travel", "suspensionMaxTravel", None),
+    ("tyre_radius", "tyreRadius", None),
+    ("max_turbo_boost", "maxTurboBoost", None),
+    ("penalty_enabled", "penaltiesEnabled", bool),
+    ("aid_fuel_rate", "aidFuelRate", None),
+    ("aid_tyre_rate", "aidTireRate", None),
+    ("aid_mechanical_damage", "aidMechanicalDamage", None),
+    ("allow_tyre_blankets", "AllowTyreBlankets", None),
+    ("aid_stability", "aidStability", None),
+    ("aid_auto_clutch", "aidAutoClutch", bool),
+    ("aid_auto_blip", "aidAutoBlip", None),
+    ("has_drs", "hasDRS", None),
+    ("has_ers", "hasERS", None),
+    ("has_kers", "hasKERS", None),
+    ("ker_max_joules", "kersMaxJ", None),
+    ("engine_brake_settings_count", "engineBrakeSettingsCount", None),
+    ("ers_power_controller_count", "ersPowerControllerCount", None),
+    ("track_sp_line_length", "trackSplineLength", None),
+    ("track_configuration", "trackConfiguration", _string),
+    ("ers_max_j", "ersMaxJ", None),
+    ("is_timed_race", "isTimedRace", None),
+    ("has_extra_lap", "hasExtraLap", None),
+    ("car_skin", "carSkin", _string),
+    ("reversed_grid_positions", "reversedGridPositions", None),
+    ("pit_window_start", "PitWindowStart", None),
+    ("pit_window_end", "PitWindowEnd", None),
+)
+
+# Converters of grouped fields -> the dataclass built from their values
+_GROUP_CLASSES = {_vector3f: Vector3f, _wheels: Wheels, _car_damage: CarDamage}
+
+
+def _value_statements(
+    target: str, index: Any, converter: Any, namespace: dict
+) -> List[str]:
+    """
+    Returns the statements that convert the unpacked value(s) at `index`
+    (locals v0, v1, ...) and store them in `target`, with the converter
+    inlined where possible. Nested dataclasses are created with
+    object.__new__ and filled slot by slot, about twice as fast as
+    calling their __init__.
+    """
+    if isinstance(index, slice):
+        values = [f"v{position}" for position in range(index.start, index.stop)]
+        if converter in _GROUP_CLASSES:
+            return _group_statements(target, _GROUP_CLASSES[converter], values)
+        if converter is ContactPoint.from_flat:
+            lines = ["p = new(ContactPoint)"]
+            for point, start in zip(_CONTACT_POINTS, range(0, len(values), 3)):
+                lines += _group_statements(
+                    f"p.{point}", Vector3f, values[start : start + 3]
+                )
+            return lines + [f"{target} = p"]
+        value = f"({', '.join(values)},)"
+    else:
+        value = f"v{index}"
+        if converter is bool:
+            return [f"{target} = {value} != 0"]
+        if isinstance(converter, type) and issubclass(converter, enum.Enum):
+            # A dict lookup instead of the slow Enum call, which still
+            # handles (and rejects) unknown values
+            members = f"_{converter.__name__}"
+            namespace[members] = {member.value: member for member in converter}
+            namespace[converter.__name__] = converter
+            return [
+                f"{target} = {members}.get({value}) or {converter.__name__}({value})"
+            ]
+    if converter is None:
+        return [f"{target} = {value}"]
+    if converter is _string:
+        return [f"{target} = {value}.decode('utf-16', 'ignore').replace('\\x00', '')"]
+    name = f"_convert{len(namespace)}"
+    namespace[name] = converter
+    return [f"{target} = {name}({value})"]
+
+
+def _group_statements(target: str, cls: type, values: List[str]) -> List[str]:
+    lines = [f"g = new({cls.__name__})"]
+    for f, value in zip(dataclass_fields(cls), values):
+        lines.append(f"g.{f.name} = {value}")
+    return lines + [f"{target} = g"]
+
+
+_CONTACT_POINTS = tuple(f.name for f in dataclass_fields(ContactPoint))
+
+
+def compile_decoder(cls: type, page_struct: struct.Struct, index: dict, fields: tuple):
+    """
+    Generates the decoder of a page: a single unpack_from into locals,
+    then the map filled with its nested dataclasses inlined, without
+    per-field lookups, slices, converter or __init__ calls.
+    """
+    names = [name for name, _, _ in fields]
+    if names != [f.name for f in dataclass_fields(cls)]:
+        raise ValueError(f"{cls.__name__}: fields out of order")
+    namespace = {
+        "unpack_from": page_struct.unpack_from,
+        "new": object.__new__,
+        "Vector3f": Vector3f,
+        "Wheels": Wheels,
+        "CarDamage": CarDamage,
+        "ContactPoint": ContactPoint,
+        cls.__name__: cls,
     }
-    return StaticsMap(
-        sm_version=temp["smVersion"],
-        ac_version=temp["acVersion"],
-        number_of_session=temp["numberOfSessions"],
-        num_cars=temp["numCars"],
-        car_model=temp["carModel"],
-        track=temp["track"],
-        player_name=temp["playerName"],
-        player_surname=temp["playerSurname"],
-        player_nick=temp["playerNick"],
-        sector_count=temp["sectorCount"],
-        max_torque=temp["maxTorque"],
-        max_power=temp["maxPower"],
-        max_rpm=temp["maxRpm"],
-        max_fuel=temp["maxFuel"],
-        # For these two, consider updating your dataclass if you want them as lists
-        suspension_max_travel=temp["suspensionMaxTravel"],
-        tyre_radius=temp["tyreRadius"],
-        max_turbo_boost=temp["maxTurboBoost"],
-        penalty_enabled=bool(temp["penaltiesEnabled"]),
-        aid_fuel_rate=temp["aidFuelRate"],
-        aid_tyre_rate=temp["aidTireRate"],
-        aid_mechanical_damage=temp["aidMechanicalDamage"],
-        allow_tyre_blankets=temp["AllowTyreBlankets"],
-        aid_stability=temp["aidStability"],
-        aid_auto_clutch=bool(temp["aidAutoClutch"]),
-        aid_auto_blip=temp["aidAutoBlip"],
-        has_drs=temp["hasDRS"],
-        has_ers=temp["hasERS"],
-        has_kers=temp["hasKERS"],
-        ker_max_joules=temp["kersMaxJ"],
-        engine_brake_settings_count=temp["engineBrakeSettingsCount"],
-        ers_power_controller_count=temp["ersPowerControllerCount"],
-        # track_sp_line_length in the dataclass is an int; cast if you want to preserve that type
-        track_sp_line_length=temp["trackSplineLength"],
-        track_configuration=temp["trackConfiguration"],
-        ers_max_j=temp["ersMaxJ"],
-        is_timed_race=temp["isTimedRace"],
-        has_extra_lap=temp["hasExtraLap"],
-        car_skin=temp["carSkin"],
-        reversed_grid_positions=temp["reversedGridPositions"],
-        pit_window_start=temp["PitWindowStart"],
-        pit_window_end=temp["PitWindowEnd"],
+    count = len(page_struct.unpack(bytes(page_struct.size)))
+    unpacked = ", ".join(f"v{position}" for position in range(count))
+    lines = [f"{unpacked}, = unpack_from(buffer, offset)", f"m = new({cls.__name__})"]
+    for name, page_name, converter in fields:
+        lines += _value_statements(f"m.{name}", index[page_name], converter, namespace)
+    source = (
+        "def decode(buffer, offset=0):\n    "
+        + "\n    ".join(lines)
+        + "\n    return m\n"
     )
+    exec(compile(source, f"<decoder {cls.__name__}>", "exec"), namespace)
+    return namespace["decode"]
 
 
-class acSharedMemory:
+_decode_physics = compile_decoder(
+    PhysicsMap, PHYSICS_STRUCT, PHYSICS_INDEX, PHYSICS_FIELDS
+)
+_decode_graphics = compile_decoder(
+    GraphicsMap, GRAPHICS_STRUCT, GRAPHICS_INDEX, GRAPHICS_FIELDS
+)
+_decode_static = compile_decoder(StaticsMap, STATIC_STRUCT, STATIC_INDEX, STATIC_FIELDS)
+
+
+def decode_physics(buffer: Any, offset: int = 0) -> PhysicsMap:
+    """
+    Decodes a physics page from any buffer (mmap, bytes, bytearray,
+    memoryview) with a single unpack_from.
+    """
+    return _decode_physics(buffer, offset)
+
+
+def decode_graphics(buffer: Any, offset: int = 0) -> GraphicsMap:
+    """
+    Decodes a graphics page from any buffer with a single unpack_from.
+    """
+    return _decode_graphics(buffer, offset)
+
+
+def decode_static(buffer: Any, offset: int = 0) -> StaticsMap:
+    """
+    Decodes a static page from any buffer with a single unpack_from.
+    """
+    return _decode_static(buffer, offset)
+
+
+def compile_lazy_fields(layout: tuple, fields: tuple) -> dict:
+    """
+    Maps field -> (struct.Struct, offset, is_array, converter).
+    """
+    page_fields = compile_fields(layout)
+    return {
+        name: page_fields[page_name] + (converter,)
+        for name, page_name, converter in fields
+    }
+
+
+class LazyFrame:
+    """
+    Keeps the raw bytes of a page and decodes a field the first time it is
+    accessed. `channels` projects to_dict() on a subset of the fields, so
+    the per-tick work scales with the channels in use, not the page size.
+    """
+
+    __slots__ = ("raw", "channels", "_cache")
+    FIELDS: dict = {}
+
+    def __init__(self, raw: bytes, channels: Optional[List[str]] = None):
+        self.raw = raw
+        self.channels = channels or list(self.FIELDS)
+        self._cache = {}
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in self.FIELDS:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def get(self, name: str) -> Any:
+        cache = self._cache
+        if name in cache:
+            return cache[name]
+
+        field_struct, offset, is_array, converter = self.FIELDS[name]
+        value = field_struct.unpack_from(self.raw, offset)
+        if not is_array:
+            value = value[0]
+        if converter is not None:
+            value = converter(value)
+        cache[name] = value
+        return value
+
+    def to_dict(self) -> dict:
+        return {name: dataclass_to_dict(self.get(name)) for name in self.channels}
+
+
+class LazyPhysics(LazyFrame):
+    __slots__ = ()
+    FIELDS = compile_lazy_fields(PHYSICS_LAYOUT, PHYSICS_FIELDS)
+
+
+class LazyGraphics(LazyFrame):
+    __slots__ = ()
+    FIELDS = compile_lazy_fields(GRAPHICS_LAYOUT, GRAPHICS_FIELDS)
+
+
+def check_channels(frame_class: type, channels: Optional[List[str]]) -> None:
+    """
+    Raises a ValueError for channels that the frame does not have.
+    """
+    unknown = [name for name in channels or () if name not in frame_class.FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown {frame_class.__name__} channels: {unknown}")
+
+
+FLOAT_STRUCT = struct.Struct("=f")
 
-    def __init__(self) -> None:
 
-        self.physicSM = acSM(
-            -1, 800, tagname="Local\\acpmf_physics", access=mmap.ACCESS_WRITE
+def _float_at(delta: int) -> property:
+    def getter(self):
+        return FLOAT_STRUCT.unpack_from(self._raw, self._offset + delta)[0]
+
+    return property(getter)
+
+
+class _View:
+    """
+    Read-only view on a group of float32 values inside a raw page buffer.
+    """
+
+    __slots__ = ("_raw", "_offset")
+    FIELD_NAMES: tuple = ()
+    # The dataclass the view stands in for, and compares equal to
+    MAP: type = None
+
+    def __init__(self, raw: bytes, offset: int):
+        self._raw = raw
+        self._offset = offset
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (type(self), self.MAP)):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.FIELD_NAMES
         )
-        self.graphicSM = acSM(
-            -1, 1588, tagname="Local\\acpmf_graphics", access=mmap.ACCESS_WRITE
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELD_NAMES}
+
+
+class Vector3fView(_View):
+    __slots__ = ()
+    FIELD_NAMES = ("x", "y", "z")
+    MAP = Vector3f
+    x = _float_at(0)
+    y = _float_at(4)
+    z = _float_at(8)
+    __str__ = Vector3f.__str__
+
+
+class WheelsView(_View):
+    __slots__ = ()
+    FIELD_NAMES = ("front_left", "front_right", "rear_left", "rear_right")
+    MAP = Wheels
+    front_left = _float_at(0)
+    front_right = _float_at(4)
+    rear_left = _float_at(8)
+    rear_right = _float_at(12)
+    __str__ = Wheels.__str__
+
+
+class CarDamageView(_View):
+    __slots__ = ()
+    FIELD_NAMES = ("front", "rear", "left", "right", "center")
+    MAP = CarDamage
+    front = _float_at(0)
+    rear = _float_at(4)
+    left = _float_at(8)
+    right = _float_at(12)
+    center = _float_at(16)
+
+
+class ContactPointView(_View):
+    __slots__ = ()
+    FIELD_NAMES = ("front_left", "front_right", "rear_left", "rear_right")
+    MAP = ContactPoint
+
+    @property
+    def front_left(self) -> Vector3fView:
+        return Vector3fView(self._raw, self._offset)
+
+    @property
+    def front_right(self) -> Vector3fView:
+        return Vector3fView(self._raw, self._offset + 12)
+
+    @property
+    def rear_left(self) -> Vector3fView:
+        return Vector3fView(self._raw, self._offset + 24)
+
+    @property
+    def rear_right(self) -> Vector3fView:
+        return Vector3fView(self._raw, self._offset + 36)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name).to_dict() for name in self.FIELD_NAMES}
+
+    __str__ = ContactPoint.__str__
+
+
+_VIEWS = {
+    _vector3f: Vector3fView,
+    _wheels: WheelsView,
+    _car_damage: CarDamageView,
+    ContactPoint.from_flat: ContactPointView,
+}
+
+
+def _compact_property(field_struct: struct.Struct, offset: int, converter) -> property:
+    view = _VIEWS.get(converter)
+    if view is not None:
+        return property(lambda self: view(self.raw, offset))
+    if converter is None:
+        return property(lambda self: field_struct.unpack_from(self.raw, offset)[0])
+    return property(
+        lambda self: converter(field_struct.unpack_from(self.raw, offset)[0])
+    )
+
+
+class CompactPhysics:
+    """
+    PhysicsMap stored as the raw page bytes (580 bytes instead of ~4.2 KB
+    for a tree of dataclasses). Attributes decode on access and nested
+    groups are views into the same bytes, so `frame.velocity.x` and
+    to_dict() behave like PhysicsMap. Meant for buffering many frames in
+    memory.
+    """
+
+    __slots__ = ("raw",)
+    FIELD_NAMES = tuple(name for name, _, _ in PHYSICS_FIELDS)
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+    @staticmethod
+    def from_buffer(buffer: Any) -> CompactPhysics:
+        return CompactPhysics(bytes(buffer[: PHYSICS_STRUCT.size]))
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, CompactPhysics):
+            return self.raw == other.raw
+        if not isinstance(other, PhysicsMap):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.FIELD_NAMES
         )
-        self.staticSM = acSM(
-            -1, 784, tagname="Local\\acpmf_static", access=mmap.ACCESS_WRITE
+
+    def to_map(self) -> PhysicsMap:
+        return decode_physics(self.raw)
+
+    def to_dict(self) -> dict:
+        result = {}
+        for name in self.FIELD_NAMES:
+            value = getattr(self, name)
+            result[name] = value.to_dict() if isinstance(value, _View) else value
+        return result
+
+
+for _name, (_struct, _offset, _, _converter) in LazyPhysics.FIELDS.items():
+    setattr(CompactPhysics, _name, _compact_property(_struct, _offset, _converter))
+del _name, _struct, _offset, _converter
+
+
+PACKET_ID_STRUCT = struct.Struct("=i")
+
+
+class PageBuffer:
+    """
+    Reusable local copy of the decoded part of a shared memory page.
+
+    refresh() only copies the page when its packet ID moved, and only
+    accepts the copy when the bytes after the packet ID differ from the
+    last accepted frame (e.g. a paused game keeps bumping IDs on frozen
+    data). No objects are built unless the frame actually changed.
+
+    With retries > 0 every copy is checked for torn reads: the packet ID
+    must be the same before the copy, in the copy and after the copy,
+    otherwise the game wrote the page meanwhile and the copy is retried.
+    When the budget runs out the last copy is used and counted.
+    """
+
+    def __init__(self, page: mmap.mmap, size: int, retries: int = 0):
+        self._page = memoryview(page)[:size]
+        self.data = bytearray(size)
+        self._scratch = bytearray(size)
+        self.packet_id: Optional[int] = None
+        self.retries = retries
+
+        self.torn_reads = 0
+        self.torn_accepted = 0
+        # New packet IDs on unchanged data
+        self.duplicates = 0
+
+    def _copy(self, target: bytearray, packet_id: int) -> int:
+        """
+        Copies the page into target and returns the packet ID of the copy.
+        """
+        target[:] = self._page
+        copied_id = PACKET_ID_STRUCT.unpack_from(target)[0]
+
+        for _ in range(self.retries):
+            after_id = PACKET_ID_STRUCT.unpack_from(self._page)[0]
+            if packet_id == copied_id == after_id:
+                return copied_id
+
+            self.torn_reads += 1
+            packet_id = after_id
+            target[:] = self._page
+            copied_id = PACKET_ID_STRUCT.unpack_from(target)[0]
+
+        if self.retries and PACKET_ID_STRUCT.unpack_from(self._page)[0] != copied_id:
+            self.torn_accepted += 1
+        return copied_id
+
+    def snapshot(self) -> int:
+        """
+        Copies the page into data, whether it changed or not.
+        """
+        packet_id = PACKET_ID_STRUCT.unpack_from(self._page)[0]
+        self.packet_id = self._copy(self.data, packet_id)
+        return self.packet_id
+
+    def refresh(self) -> bool:
+        packet_id = PACKET_ID_STRUCT.unpack_from(self._page)[0]
+        if packet_id == self.packet_id:
+            return False
+
+        scratch = self._scratch
+        copied_id = self._copy(scratch, packet_id)
+        self.packet_id = copied_id
+
+        # Compare everything but the packet ID with one memcmp
+        PACKET_ID_STRUCT.pack_into(
+            scratch, 0, PACKET_ID_STRUCT.unpack_from(self.data)[0]
         )
+        if scratch == self.data:
+            self.duplicates += 1
+            return False
 
-        self.physics_old = None
-        self.last_physicsID = 0
+        PACKET_ID_STRUCT.pack_into(scratch, 0, copied_id)
+        self._scratch, self.data = self.data, scratch
+        return True
 
-    def read_shared_memory(self) -> Optional[AC_map]:
+    def release(self) -> None:
+        self._page.release()
 
-        physics = read_physic_map(self.physicSM)
-        graphics = read_graphics_map(self.graphicSM)
-        statics = read_static_map(self.staticSM)
 
-        if physics.packed_id == self.last_physicsID or (
-            self.physics_old is not None
-            and PhysicsMap.is_equal(self.physics_old, physics)
-        ):
+class acSharedMemory:
+
+    def __init__(
+        self,
+        source: Optional[FrameSource] = None,
+        numpy_views: bool = False,
+        consistent_reads: bool = False,
+        read_retries: int = 3,
+        physics_channels: Optional[List[str]] = None,
+        graphics_channels: Optional[List[str]] = None,
+    ) -> None:
+
+        self.source = source if source is not None else TagnameSource()
+        self.physicSM = self.source.open_page("physics", PHYSICS_PAGE_SIZE, acSM)
+        self.graphicSM = self.source.open_page("graphics", GRAPHICS_PAGE_SIZE, acSM)
+        self.staticSM = self.source.open_page("static", STATIC_PAGE_SIZE, acSM)
+
+        # Optional zero-copy views, e.g. physicNP["wheelSlip"][0]
+        self.physicNP = None
+        self.graphicNP = None
+        self.staticNP = None
+        if numpy_views:
+            self.open_numpy_views()
+
+        # Consistent reads re-check the packet ID around every page copy
+        retries = read_retries if consistent_reads else 0
+        self.physics_buffer = PageBuffer(self.physicSM, PHYSICS_STRUCT.size, retries)
+        self.graphics_buffer = PageBuffer(self.graphicSM, GRAPHICS_STRUCT.size, retries)
+        self.frame_tag = (0, 0)
+
+        # With a channel projection, read_frame() returns lazy frames
+        check_channels(LazyPhysics, physics_channels)
+        check_channels(LazyGraphics, graphics_channels)
+        self.physics_channels = physics_channels
+        self.graphics_channels = graphics_channels
+        self.lazy = bool(physics_channels or graphics_channels)
+
+    def open_numpy_views(self) -> None:
+        """
+        Exposes the three pages as one-element NumPy structured arrays that
+        share memory with the mmaps, so reading them allocates no Python objects.
+        """
+        if np is None:
+            raise ImportError("numpy is required for the structured page views")
+
+        self.physicNP = np.frombuffer(self.physicSM, dtype=PHYSICS_DTYPE, count=1)
+        self.graphicNP = np.frombuffer(self.graphicSM, dtype=GRAPHICS_DTYPE, count=1)
+        self.staticNP = np.frombuffer(self.staticSM, dtype=STATIC_DTYPE, count=1)
+
+    def read_frame(self) -> Optional[Tuple[Any, Any]]:
+        """
+        Returns the physics and graphics maps when a new physics frame is
+        available, decoded from local snapshots of both pages. frame_tag
+        holds the pair of packet IDs they were taken from.
+        With a channel projection both are lazy frames over the snapshots.
+        """
+        physics = self.read_physics()
+        if physics is None:
             return None
+        return physics, self.read_graphics()
 
-        else:
-            self.physics_old = copy.deepcopy(physics)
-            return AC_map(physics, graphics, statics)
+    def read_physics(self) -> Optional[Any]:
+        """
+        Returns the physics map when the physics page changed since the
+        previous read, else None.
+        """
+        if not self.physics_buffer.refresh():
+            return None
+
+        self.frame_tag = (self.physics_buffer.packet_id, self.frame_tag[1])
+        if self.lazy:
+            return LazyPhysics(bytes(self.physics_buffer.data), self.physics_channels)
+        return decode_physics(self.physics_buffer.data)
+
+    def read_graphics(self) -> Any:
+        """
+        Returns the graphics map, read from a fresh snapshot of the page.
+        """
+        graphics_id = self.graphics_buffer.snapshot()
+        self.frame_tag = (self.frame_tag[0], graphics_id)
+        if self.lazy:
+            return LazyGraphics(
+                bytes(self.graphics_buffer.data), self.graphics_channels
+            )
+        return decode_graphics(self.graphics_buffer.data)
+
+    def refresh_graphics(self) -> Optional[Any]:
+        """
+        Returns the graphics map when the graphics page changed since the
+        previous read, else None. Only the packet ID is read when it did
+        not, so it is cheap enough to call for every new physics frame.
+        """
+        changed = self.graphics_buffer.refresh()
+        self.frame_tag = (self.frame_tag[0], self.graphics_buffer.packet_id)
+        if not changed:
+            return None
+        if self.lazy:
+            return LazyGraphics(
+                bytes(self.graphics_buffer.data), self.graphics_channels
+            )
+        return decode_graphics(self.graphics_buffer.data)
+
+    def read_stats(self) -> dict:
+        """
+        Torn-read counters of the consistent read mode, and physics frames
+        skipped as duplicates.
+        """
+        return {
+            "physics_torn_reads": self.physics_buffer.torn_reads,
+            "physics_torn_accepted": self.physics_buffer.torn_accepted,
+            "graphics_torn_reads": self.graphics_buffer.torn_reads,
+            "graphics_torn_accepted": self.graphics_buffer.torn_accepted,
+            "physics_duplicates": self.physics_buffer.duplicates,
+        }
+
+    def read_shared_memory(self) -> Optional[AC_map]:
+
+        frame = self.read_frame()
+        if frame is None:
+            return None
+
+        physics, graphics = frame
+        statics = read_static_map(self.staticSM)
+        return AC_map(physics, graphics, statics, self.frame_tag)
 
     def get_shared_memory_data(self) -> AC_map:
 
@@ -591,6 +1277,12 @@ class acSharedMemory:
 
     def close(self) -> None:
         print("[ASM_Reader]: Closing memory maps.")
+        # Views export the mmap buffers, drop them before closing
+        self.physics_buffer.release()
+        self.graphics_buffer.release()
+        self.physicNP = None
+        self.graphicNP = None
+        self.staticNP = None
         self.physicSM.close()
         self.graphicSM.close()
         self.staticSM.close()
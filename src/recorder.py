@@ -0,0 +1,649 @@
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from src.codec import SCHEMA_VERSION
+from src.pipeline import BoundedQueue, DROP_NEWEST
+from src.pyacsharedmemory import (
+    PHYSICS_STRUCT,
+    GRAPHICS_STRUCT,
+    STATIC_STRUCT,
+    GRAPHICS_LAYOUT,
+    CompactPhysics,
+    compile_fields,
+    decode_static,
+)
+
+# Session recording layout (little endian):
+#   file header: FILE_HEADER (magic, format version, JSON length), then a
+#     JSON object: schema version, page sizes, start time, static info
+#   chunks: CHUNK (magic, record count, stored length, raw length, first
+#     and last timestamp), then the records, zlib-compressed when the
+#     stored length differs from the raw length
+#   record: RECORD (timestamp: float64, page: uint8, length: uint16), then
+#     the raw page bytes
+#   index, once the file is finished: INDEX (magic, chunk count, mark
+#     count), CHUNK_ENTRY (file offset, first and last timestamp) per
+#     chunk, MARK per lap/sector change (see Mark), and TRAILER (magic,
+#     index offset) as the last bytes of the file
+# Every file starts with a chunk holding the latest static and graphics
+# pages, so rotated files can be read on their own.
+# Pages keep their packet IDs, so replays produce the same frame tags.
+FILE_MAGIC = b"ACREC\x00"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<6sHI")
+CHUNK_MAGIC = b"CHNK"
+CHUNK = struct.Struct("<4sIIIdd")
+RECORD = struct.Struct("<dBH")
+INDEX_MAGIC = b"INDX"
+INDEX = struct.Struct("<4sII")
+CHUNK_ENTRY = struct.Struct("<Qdd")
+MARK = struct.Struct("<QIdiiif")
+TRAILER_MAGIC = b"ACIX"
+TRAILER = struct.Struct("<4sQ")
+
+PHYSICS = 0
+GRAPHICS = 1
+STATIC = 2
+PAGE_NAMES = ("physics", "graphics", "static")
+PAGE_SIZES = (PHYSICS_STRUCT.size, GRAPHICS_STRUCT.size, STATIC_STRUCT.size)
+
+# (timestamp, page, bytes)
+Record = Tuple[float, int, bytes]
+
+_GRAPHICS_FIELDS = compile_fields(GRAPHICS_LAYOUT)
+_LAP_FIELDS = [
+    _GRAPHICS_FIELDS[name][:2]
+    for name in (
+        "completedLaps",
+        "currentSectorIndex",
+        "iCurrentTime",
+        "normalizedCarPosition",
+    )
+]
+
+
+def lap_position(raw) -> Tuple[int, int, int, float]:
+    """
+    (lap, sector, lap time in ms, normalized car position) of a graphics
+    page. Laps count from 1 (completed laps + 1), sectors from 0.
+    """
+    laps, sector, lap_time, position = [
+        field_struct.unpack_from(raw, offset)[0] for field_struct, offset in _LAP_FIELDS
+    ]
+    return laps + 1, sector, lap_time, position
+
+
+class Mark(NamedTuple):
+    """
+    Where a lap/sector starts: the chunk's file offset and the record's
+    offset in the uncompressed chunk.
+    """
+
+    chunk: int
+    offset: int
+    timestamp: float
+    lap: int
+    sector: int
+    lap_time: int
+    position: float
+
+
+class Recorder:
+    """
+    Records raw physics, graphics and static page snapshots of a session
+    into a rotating, chunked binary log (see the layout above).
+
+    record() is called from the reader thread and only appends to an
+    in-memory chunk; full chunks (`chunk_bytes` or `chunk_seconds`) are
+    compressed and written by a writer thread, which fsyncs every
+    `fsync_interval` seconds and starts a new file after `max_bytes`.
+    Graphics and static pages are only recorded when they changed.
+    Lap and sector changes in the graphics pages are indexed.
+    """
+
+    def __init__(
+        self,
+        directory: str = "recordings",
+        max_bytes: int = 256 * 1024 * 1024,
+        chunk_bytes: int = 256 * 1024,
+        chunk_seconds: float = 1.0,
+        compress: bool = True,
+        fsync_interval: float = 5.0,
+        queue_size: int = 16,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.chunk_seconds = chunk_seconds
+        self.compress = compress
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+
+        self._chunk = bytearray()
+        self._count = 0
+        self._first = 0.0
+        self._last = 0.0
+        self._latest: List[Optional[Tuple[float, bytes]]] = [None, None, None]
+        self._prologue = []
+        # Lap position of the latest graphics page, and at the chunk start
+        self._position = None
+        self._start_position = None
+        self._marks = []
+        self.queue = BoundedQueue(queue_size, DROP_NEWEST)
+        self.writer = threading.Thread(target=self.write, name="recorder", daemon=True)
+
+        self.file = None
+        self.path = None
+        self.chunk_table: List[Tuple[int, float, float]] = []
+        self.marks: List[Mark] = []
+        self.files = 0
+        self.records = 0
+        self.bytes_written = 0
+
+    def start(self) -> None:
+        self.writer.start()
+
+    def record(self, page: int, data, timestamp: Optional[float] = None) -> None:
+        """
+        Appends a page snapshot to the current chunk.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if page != PHYSICS:
+            latest = self._latest[page]
+            if latest is not None and latest[1] == data:
+                return
+
+        if not self._count:
+            self._first = timestamp
+            # Pages as of the chunk start, in case it opens a new file
+            self._prologue = [
+                (kept, self._latest[kept])
+                for kept in (STATIC, GRAPHICS)
+                if self._latest[kept] is not None
+            ]
+            self._start_position = self._position
+        if page != PHYSICS:
+            self._latest[page] = (timestamp, bytes(data))
+        if page == GRAPHICS:
+            position = lap_position(data)
+            if self._position is None or position[:2] != self._position[:2]:
+                self._marks.append((len(self._chunk), timestamp) + position)
+            self._position = position
+
+        self._chunk += RECORD.pack(timestamp, page, len(data))
+        self._chunk += data
+        self._count += 1
+        self._last = timestamp
+        self.records += 1
+
+        if (
+            len(self._chunk) >= self.chunk_bytes
+            or timestamp - self._first >= self.chunk_seconds
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Hands the current chunk to the writer thread.
+        """
+        if not self._count:
+            return
+        chunk = (
+            self._prologue,
+            self._start_position,
+            self._marks,
+            self._count,
+            self._first,
+            self._last,
+            bytes(self._chunk),
+        )
+        if not self.queue.put(chunk):
+            logging.warning(f"[Recorder] Writer behind, dropped {self._count} records")
+        self._chunk = bytearray()
+        self._count = 0
+        self._marks = []
+
+    def write(self) -> None:
+        last_sync = time.monotonic()
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            prologue, start_position, marks, count, first, last, raw = chunk
+            try:
+                if self.file is None or self.file.tell() >= self.max_bytes:
+                    self._open(prologue, _find_page(raw, count, STATIC))
+                    # Seeks into this file start at its first chunk
+                    if start_position is not None and not (marks and marks[0][0] == 0):
+                        marks = [(0, first) + start_position] + marks
+                offset = self._write_chunk(count, first, last, raw)
+                self.marks += [Mark(offset, *mark) for mark in marks]
+                if time.monotonic() - last_sync >= self.fsync_interval:
+                    self._sync()
+                    last_sync = time.monotonic()
+            except OSError as e:
+                logging.error(f"[Recorder] Write failed: {e}")
+        if self.file is not None:
+            self._finish()
+
+    def _open(self, prologue: list, static: Optional[bytes]) -> None:
+        """
+        Starts a new file, with the static and graphics pages as they were
+        before the next chunk (they are only recorded when they change).
+        The header's static info comes from the first static page.
+        """
+        if self.file is not None:
+            self._finish()
+        self.files += 1
+        name = f"session-{self.session}-{self.files:03d}.acrec"
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path, "wb")
+        self.chunk_table = []
+        self.marks = []
+
+        if STATIC in dict(prologue):
+            static = dict(prologue)[STATIC][1]
+        header = {
+            "schema_version": SCHEMA_VERSION,
+            "pages": dict(zip(PAGE_NAMES, PAGE_SIZES)),
+            "created": time.time(),
+            "static_info": decode_static(static).to_dict() if static else None,
+        }
+        raw = json.dumps(header).encode("utf-8")
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, len(raw)) + raw)
+        logging.info(f"[Recorder] Recording to {self.path}")
+
+        if prologue:
+            records = b"".join(
+                RECORD.pack(timestamp, page, len(data)) + data
+                for page, (timestamp, data) in prologue
+            )
+            timestamps = [timestamp for _, (timestamp, _) in prologue]
+            self._write_chunk(len(prologue), min(timestamps), max(timestamps), records)
+
+    def _write_chunk(self, count: int, first: float, last: float, raw: bytes) -> int:
+        """
+        Appends a chunk, returns its file offset.
+        """
+        offset = self.file.tell()
+        stored = zlib.compress(raw, 1) if self.compress else raw
+        self.file.write(
+            CHUNK.pack(CHUNK_MAGIC, count, len(stored), len(raw), first, last)
+        )
+        self.file.write(stored)
+        self.chunk_table.append((offset, first, last))
+        self.bytes_written += CHUNK.size + len(stored)
+        return offset
+
+    def _finish(self) -> None:
+        """
+        Writes the index and closes the file.
+        """
+        index_offset = self.file.tell()
+        self.file.write(_pack_index(self.chunk_table, self.marks))
+        self.file.write(TRAILER.pack(TRAILER_MAGIC, index_offset))
+        self._sync()
+        self.file.close()
+
+    def _sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Writes what is left and closes the file.
+        """
+        self.flush()
+        self.queue.close()
+        if self.writer.is_alive():
+            self.writer.join(timeout)
+        logging.info(
+            f"[Recorder] {self.records} records, {self.bytes_written} bytes "
+            f"in {self.files} file(s)"
+        )
+
+
+def _pack_index(chunk_table: list, marks: List[Mark]) -> bytes:
+    return b"".join(
+        [INDEX.pack(INDEX_MAGIC, len(chunk_table), len(marks))]
+        + [CHUNK_ENTRY.pack(*entry) for entry in chunk_table]
+        + [MARK.pack(*mark) for mark in marks]
+    )
+
+
+def _records(raw: bytes, count: int) -> Iterator[Tuple[int, Record]]:
+    """
+    Yields (offset in the chunk, record) per record of a chunk.
+    """
+    offset = 0
+    for _ in range(count):
+        timestamp, page, length = RECORD.unpack_from(raw, offset)
+        start = offset
+        offset += RECORD.size
+        yield start, (timestamp, page, raw[offset : offset + length])
+        offset += length
+
+
+def _find_page(raw: bytes, count: int, wanted: int) -> Optional[bytes]:
+    for _, (_, page, data) in _records(raw, count):
+        if page == wanted:
+            return data
+    return None
+
+
+class RecordingReader:
+    """
+    Reads a session recording back as (timestamp, page, bytes) records.
+    A truncated last chunk (e.g. after a crash) ends the recording.
+
+    The lap/sector index of a finished file is read from its end; files
+    without one (not closed cleanly) are scanned once to build it. lap(),
+    sector() and between() seek straight to the chunk they need.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        magic, version, length = FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(f"Not a session recording: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version {version}")
+        self.header = json.loads(self.file.read(length))
+        self.data_offset = FILE_HEADER.size + length
+
+        self._chunk_table: Optional[List[Tuple[int, float, float]]] = None
+        self._marks: List[Mark] = []
+        # First mark of every lap and of every (lap, sector)
+        self._lap_starts: Dict[int, int] = {}
+        self._lap_marks: Dict[Tuple[int, int], int] = {}
+
+    def chunks(self, offset: Optional[int] = None) -> Iterator[Tuple[int, tuple]]:
+        """
+        Yields (file offset, (count, first, last, raw records)) per chunk.
+        """
+        self.file.seek(self.data_offset if offset is None else offset)
+        while True:
+            offset = self.file.tell()
+            head = self.file.read(CHUNK.size)
+            if len(head) < CHUNK.size or head[:4] == INDEX_MAGIC:
+                return
+            magic, count, stored_length, raw_length, first, last = CHUNK.unpack(head)
+            stored = self.file.read(stored_length)
+            if magic != CHUNK_MAGIC or len(stored) < stored_length:
+                logging.warning(
+                    f"[Recorder] Truncated chunk at {offset} in {self.path}"
+                )
+                return
+            raw = zlib.decompress(stored) if stored_length != raw_length else stored
+            yield offset, (count, first, last, raw)
+
+    def __iter__(self) -> Iterator[Record]:
+        for _, (count, _, _, raw) in self.chunks():
+            for _, record in _records(raw, count):
+                yield record
+
+    def records(
+        self, start: Tuple[int, int], end: Optional[Tuple[int, int]] = None
+    ) -> Iterator[Record]:
+        """
+        Records from position start up to end (chunk offset, offset in the
+        chunk), or to the end of the file.
+        """
+        for chunk_offset, (count, _, _, raw) in self.chunks(start[0]):
+            for offset, record in _records(raw, count):
+                position = (chunk_offset, offset)
+                if position < start:
+                    continue
+                if end is not None and position >= end:
+                    return
+                yield record
+
+    @property
+    def marks(self) -> List[Mark]:
+        self._load_index()
+        return self._marks
+
+    @property
+    def chunk_table(self) -> List[Tuple[int, float, float]]:
+        self._load_index()
+        return self._chunk_table
+
+    def _load_index(self) -> None:
+        if self._chunk_table is not None:
+            return
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        magic = b""
+        if size >= self.data_offset + TRAILER.size:
+            self.file.seek(size - TRAILER.size)
+            magic, index_offset = TRAILER.unpack(self.file.read(TRAILER.size))
+
+        if magic == TRAILER_MAGIC:
+            self.file.seek(index_offset)
+            data = self.file.read(size - TRAILER.size - index_offset)
+            _, chunk_count, mark_count = INDEX.unpack_from(data)
+            offset = INDEX.size
+            self._chunk_table = [
+                CHUNK_ENTRY.unpack_from(data, offset + i * CHUNK_ENTRY.size)
+                for i in range(chunk_count)
+            ]
+            offset += chunk_count * CHUNK_ENTRY.size
+            self._marks = [
+                Mark(*MARK.unpack_from(data, offset + i * MARK.size))
+                for i in range(mark_count)
+            ]
+        else:
+            self._scan_index()
+
+        for index, mark in enumerate(self._marks):
+            self._lap_starts.setdefault(mark.lap, index)
+            self._lap_marks.setdefault((mark.lap, mark.sector), index)
+
+    def _scan_index(self) -> None:
+        logging.info(f"[Recorder] No index in {self.path}, scanning it")
+        self._chunk_table = []
+        self._marks = []
+        previous = None
+        for chunk_offset, (count, first, last, raw) in self.chunks():
+            self._chunk_table.append((chunk_offset, first, last))
+            for offset, (timestamp, page, data) in _records(raw, count):
+                if page != GRAPHICS:
+                    continue
+                position = lap_position(data)
+                if previous is None or position[:2] != previous[:2]:
+                    self._marks.append(Mark(chunk_offset, offset, timestamp, *position))
+                previous = position
+
+    def laps(self) -> List[Tuple[int, float, float]]:
+        """
+        (lap, first timestamp, end timestamp) of every lap in the file.
+        """
+        laps = []
+        for mark in self.marks:
+            if laps and laps[-1][0] == mark.lap:
+                continue
+            if laps:
+                laps[-1][2] = mark.timestamp
+            laps.append([mark.lap, mark.timestamp, None])
+        if laps:
+            laps[-1][2] = self.chunk_table[-1][2]
+        return [tuple(lap) for lap in laps]
+
+    def _span(self, index: int, same) -> Iterator[Record]:
+        marks = self.marks
+        start = marks[index]
+        end = None
+        for mark in marks[index + 1 :]:
+            if not same(mark):
+                end = (mark.chunk, mark.offset)
+                break
+        return self.records((start.chunk, start.offset), end)
+
+    def lap(self, lap: int) -> Iterator[Record]:
+        """
+        Records of a lap (counting from 1), nothing when it is not in the file.
+        """
+        self._load_index()
+        index = self._lap_starts.get(lap)
+        if index is None:
+            return iter(())
+        return self._span(index, lambda mark: mark.lap == lap)
+
+    def sector(self, lap: int, sector: int) -> Iterator[Record]:
+        """
+        Records of one sector (counting from 0) of a lap.
+        """
+        self._load_index()
+        index = self._lap_marks.get((lap, sector))
+        if index is None:
+            return iter(())
+        return self._span(index, lambda mark: mark.lap == lap and mark.sector == sector)
+
+    def between(self, start: float, end: Optional[float] = None) -> Iterator[Record]:
+        """
+        Records with start <= timestamp < end.
+        """
+        table = self.chunk_table
+        index = bisect.bisect_left([last for _, _, last in table], start)
+        if index == len(table):
+            return
+        for timestamp, page, data in self.records((table[index][0], 0)):
+            if end is not None and timestamp >= end:
+                return
+            if timestamp >= start:
+                yield timestamp, page, data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_lap(paths: Iterable[str], lap: int, sector: Optional[int] = None):
+    """
+    Records of a lap (or one of its sectors) across the rotated files of a
+    session, in order.
+    """
+    for path in paths:
+        reader = RecordingReader(path)
+        if sector is None:
+            yield from reader.lap(lap)
+        else:
+            yield from reader.sector(lap, sector)
+        reader.close()
+
+
+def lap_physics(
+    paths: Iterable[str], lap: int, sector: Optional[int] = None
+) -> List[CompactPhysics]:
+    """
+    Physics frames of a lap (or one of its sectors), kept as raw pages so
+    a whole lap fits in memory (see CompactPhysics).
+    """
+    return [
+        CompactPhysics(data)
+        for _, page, data in read_lap(paths, lap, sector)
+        if page == PHYSICS
+    ]
+
+
+def write_recording(
+    path: str, header: dict, records: Iterable[Record], chunk_bytes: int = 256 * 1024
+) -> int:
+    """
+    Writes records to a new recording (without index), returns their count.
+    """
+    total = 0
+    with open(path, "wb") as fp:
+        raw = json.dumps(header).encode("utf-8")
+        fp.write(FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, len(raw)) + raw)
+        chunk, count, first = bytearray(), 0, 0.0
+        for timestamp, page, data in records:
+            if not count:
+                first = timestamp
+            chunk += RECORD.pack(timestamp, page, len(data)) + data
+            count += 1
+            if len(chunk) >= chunk_bytes:
+                stored = zlib.compress(bytes(chunk), 1)
+                fp.write(
+                    CHUNK.pack(
+                        CHUNK_MAGIC, count, len(stored), len(chunk), first, timestamp
+                    )
+                )
+                fp.write(stored)
+                total += count
+                chunk, count = bytearray(), 0
+        if count:
+            stored = zlib.compress(bytes(chunk), 1)
+            fp.write(
+                CHUNK.pack(
+                    CHUNK_MAGIC, count, len(stored), len(chunk), first, timestamp
+                )
+            )
+            fp.write(stored)
+            total += count
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Session recording summary")
+    parser.add_argument("paths", nargs="+", help="recording files (.acrec), in order")
+    parser.add_argument("--lap", type=int, help="extract this lap (from 1)")
+    parser.add_argument("--sector", type=int, help="only this sector of the lap")
+    parser.add_argument(
+        "--out", help="recording to extract the lap to, without: lap summary"
+    )
+    args = parser.parse_args()
+
+    if args.lap is not None and args.out is None:
+        frames = lap_physics(args.paths, args.lap, args.sector)
+        if not frames:
+            print(f"Lap {args.lap} is not in the recording")
+            return
+        top_speed = max(frame.speed_kmh for frame in frames)
+        max_rpm = max(frame.rpm for frame in frames)
+        print(
+            f"Lap {args.lap}: {len(frames)} physics frames, "
+            f"top speed {top_speed:.1f} km/h, max {max_rpm} rpm"
+        )
+        return
+
+    if args.lap is not None:
+        records = read_lap(args.paths, args.lap, args.sector)
+        start = next(records, None)
+        if start is None:
+            print(f"Lap {args.lap} is not in the recording")
+            return
+        # The static page is only recorded when it changes, carry it over
+        first = RecordingReader(args.paths[0])
+        static = next((record for record in first if record[1] == STATIC), None)
+        first.close()
+        head = [start]
+        if static is not None:
+            head.insert(0, (start[0], STATIC, static[2]))
+        count = write_recording(args.out, first.header, itertools.chain(head, records))
+        print(f"Wrote {count} records of lap {args.lap} to {args.out}")
+        return
+
+    for path in args.paths:
+        reader = RecordingReader(path)
+        static_info = reader.header.get("static_info") or {}
+        print(f"{path}: {static_info.get('car_model')} @ {static_info.get('track')}")
+        for lap, start, end in reader.laps():
+            sectors = sorted({mark.sector for mark in reader.marks if mark.lap == lap})
+            print(f"  lap {lap}: {end - start:7.2f}s, sectors {sectors}")
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
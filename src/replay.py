@@ -0,0 +1,270 @@
+import argparse
+import itertools
+import logging
+import os
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from src.pipeline import BLOCK
+from src.profiling import add_arguments, create_profiler, finish
+from src.pyacsharedmemory import (
+    PHYSICS_PAGE_SIZE,
+    GRAPHICS_PAGE_SIZE,
+    STATIC_PAGE_SIZE,
+    PACKET_ID_STRUCT,
+)
+from src.recorder import RecordingReader, PHYSICS, GRAPHICS, STATIC, PAGE_NAMES
+from src.sources import FrameSource, MemorySource, create_source
+from src.utils import Config
+
+logging.getLogger().setLevel(logging.INFO)
+
+# A page dump is a series of frames, each the three pages back to back
+DUMP_PAGE_SIZES = (PHYSICS_PAGE_SIZE, GRAPHICS_PAGE_SIZE, STATIC_PAGE_SIZE)
+DUMP_FRAME_SIZE = sum(DUMP_PAGE_SIZES)
+
+# (timestamp, [(page, bytes), ...]) of one physics frame
+Frame = Tuple[float, List[Tuple[int, bytes]]]
+
+
+def recording_frames(paths: List[str]) -> Iterator[Frame]:
+    """
+    Groups the records of session recordings (in order, e.g. the rotated
+    files of one session) into frames: a physics page and the graphics
+    and static changes recorded after it. Records before the first
+    physics page make up a frame without one.
+    """
+    timestamp, records = None, []
+    for path in paths:
+        reader = RecordingReader(path)
+        for record_time, page, data in reader:
+            if page == PHYSICS and records:
+                yield timestamp, records
+                records = []
+            if not records:
+                timestamp = record_time
+            records.append((page, data))
+        reader.close()
+    if records:
+        yield timestamp, records
+
+
+def dump_frames(path: str, rate: float = 333.0) -> Iterator[Frame]:
+    """
+    Reads a page dump (see capture()); frames are timed at `rate` Hz.
+    """
+    with open(path, "rb") as fp:
+        index = 0
+        while True:
+            frame = fp.read(DUMP_FRAME_SIZE)
+            if len(frame) < DUMP_FRAME_SIZE:
+                return
+            records, offset = [], 0
+            for page, size in enumerate(DUMP_PAGE_SIZES):
+                records.append((page, frame[offset : offset + size]))
+                offset += size
+            yield index / rate, records
+            index += 1
+
+
+def capture(
+    source: FrameSource, path: str, duration: float, rate: float = 333.0
+) -> int:
+    """
+    Writes a page dump of `source`: the three pages whenever the physics
+    packet ID changed, polled at `rate` Hz for `duration` seconds.
+    Returns the number of frames.
+    """
+    pages = [
+        source.open_page(name, size) for name, size in zip(PAGE_NAMES, DUMP_PAGE_SIZES)
+    ]
+    frames = 0
+    packet_id = None
+    period = 1.0 / rate
+    deadline = time.monotonic()
+    end = deadline + duration
+    with open(path, "wb") as fp:
+        while deadline < end:
+            current = PACKET_ID_STRUCT.unpack_from(pages[PHYSICS])[0]
+            if current != packet_id:
+                packet_id = current
+                fp.write(b"".join(page[:] for page in pages))
+                frames += 1
+            deadline += period
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+    for page in pages:
+        page.close()
+    return frames
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    return values[int(fraction * (len(values) - 1))] if values else 0.0
+
+
+def create_forwarder(source: MemorySource):
+    """
+    An AcUdpMqttForwarder over `source` with recording off: recordings
+    already are the output, a replay is not recorded again.
+    """
+    # The forwarder lives in server.py, at the top of the repo
+    from server import AcUdpMqttForwarder
+
+    with Config().override({"output.save": False}):
+        return AcUdpMqttForwarder(source)
+
+
+class Replay:
+    """
+    Feeds recorded frames through an AcUdpMqttForwarder whose pages live
+    in a MemorySource: every frame is written to the pages and the
+    forwarder ticks as if sampling live, with graphics and static ticks
+    at the configured rates of recorded time. `speed` is a multiple of
+    real time, 0 replays as fast as possible. With `lossless` the
+    pipeline blocks instead of dropping frames, so the report measures
+    the whole pipeline. Build the forwarder with create_forwarder().
+    """
+
+    def __init__(self, forwarder, source: MemorySource, speed: float = 1.0):
+        self.forwarder = forwarder
+        self.pages = [source.pages[name] for name in PAGE_NAMES]
+        self.speed = speed
+
+        self.frames = 0
+        self.elapsed = 0.0
+        self.write_times: List[float] = []
+        self.tick_times: List[float] = []
+
+    def set_lossless(self) -> None:
+        pipeline = self.forwarder.pipeline
+        pipeline.queue.policy = BLOCK
+        for worker in pipeline.workers:
+            worker.queue.policy = BLOCK
+
+    def run(self, frames: Iterable[Frame], seconds: Optional[float] = None) -> None:
+        """
+        Replays `frames`, for at most `seconds` seconds when given.
+        """
+        streams = self.forwarder.scheduler.streams
+        periods = {name: streams[name].period for name in ("static", "graphics")}
+        deadlines = {}
+
+        self.forwarder.start()
+        start = time.monotonic()
+        first = None
+        try:
+            for timestamp, records in frames:
+                if first is None:
+                    first = timestamp
+                    deadlines = dict.fromkeys(periods, timestamp)
+                if self.speed:
+                    remaining = start + (timestamp - first) / self.speed
+                    remaining -= time.monotonic()
+                    if remaining > 0:
+                        time.sleep(remaining)
+
+                begin = time.perf_counter()
+                due = []
+                for page, data in records:
+                    self.pages[page][: len(data)] = data
+                    if page == PHYSICS:
+                        due.append("physics")
+                for name, period in periods.items():
+                    if timestamp >= deadlines[name]:
+                        due.append(name)
+                        deadlines[name] = max(deadlines[name] + period, timestamp)
+                written = time.perf_counter()
+                self.forwarder.tick(due)
+                ticked = time.perf_counter()
+
+                self.write_times.append(written - begin)
+                self.tick_times.append(ticked - written)
+                self.frames += "physics" in due
+                if seconds is not None and time.monotonic() - start >= seconds:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.elapsed = time.monotonic() - start
+            # Drains the pipeline before the report
+            self.forwarder.cleanup()
+
+    def report(self) -> List[str]:
+        lines = [
+            f"[Replay] {self.frames} frames in {self.elapsed:.2f}s: "
+            f"{self.frames / self.elapsed if self.elapsed else 0.0:.0f} fps"
+        ]
+        for name, times in (
+            ("write pages", self.write_times),
+            ("read", self.tick_times),
+        ):
+            times = sorted(times)
+            mean = sum(times) / len(times) if times else 0.0
+            lines.append(
+                f"[Replay] {name}: mean {1e6 * mean:.0f}us "
+                f"p99 {1e6 * _percentile(times, 0.99):.0f}us per tick"
+            )
+        for name, stats in self.forwarder.pipeline.stats().items():
+            processed = stats["processed"]
+            mean = stats["busy"] / processed if processed else 0.0
+            lines.append(
+                f"[Replay] {name}: {processed} items, mean {1e6 * mean:.0f}us, "
+                f"busy {stats['busy']:.2f}s, dropped {stats['dropped']}"
+            )
+        return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded sessions through the forwarder"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="session recordings (.acrec) or one page dump"
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="multiple of real time, 0: max"
+    )
+    parser.add_argument(
+        "--lossless", action="store_true", help="block instead of dropping frames"
+    )
+    parser.add_argument(
+        "--dump-rate", type=float, default=333.0, help="frame rate of page dumps"
+    )
+    parser.add_argument(
+        "--capture", type=float, metavar="SECONDS", help="write a page dump instead"
+    )
+    parser.add_argument("--source", default="tagname", help="capture: page source")
+    parser.add_argument("--path", default="/dev/shm", help="capture: page directory")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.capture:
+        source = create_source(args.source, args.path)
+        frames = capture(source, args.paths[0], args.capture, args.dump_rate)
+        logging.info(f"[Replay] Captured {frames} frames to {args.paths[0]}")
+        return
+
+    if os.path.splitext(args.paths[0])[1] == ".acrec":
+        frames = recording_frames(args.paths)
+    else:
+        frames = dump_frames(args.paths[0], args.dump_rate)
+    if args.profile_ticks:
+        frames = itertools.islice(frames, args.profile_ticks)
+
+    source = MemorySource()
+    replay = Replay(create_forwarder(source), source, args.speed)
+    if args.lossless:
+        replay.set_lossless()
+    profiler = create_profiler(args)
+    if profiler is not None:
+        profiler.start()
+    replay.run(frames, args.profile_seconds)
+    if profiler is not None:
+        finish(profiler, args.profile_out)
+    for line in replay.report():
+        logging.info(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List
+
+# Jitter samples kept per stream between stats() calls, 30 s at 333 Hz.
+# Without a stats stream nothing reads them, so they must stay bounded.
+JITTER_SAMPLES = 10000
+
+
+@dataclass(slots=True)
+class Stream:
+    """
+    One fixed-rate stream of the scheduler. Jitter samples (seconds late
+    per tick) are kept until the next stats() call, at most the last
+    JITTER_SAMPLES of them.
+    """
+
+    name: str
+    period: float
+    deadline: float
+    ticks: int = 0
+    overruns: int = 0
+    missed: int = 0
+    jitter: Deque[float] = field(default_factory=lambda: deque(maxlen=JITTER_SAMPLES))
+
+
+class TickScheduler:
+    """
+    Runs named streams at fixed rates on absolute deadlines of a monotonic
+    clock, so late ticks do not shift the ones after them. wait() sleeps
+    until shortly before the next deadline and spins the last `spin`
+    seconds, which is what OS timers cannot do accurately.
+    A stream that falls more than a period behind skips the missed ticks
+    (counted as an overrun) instead of firing them in a burst.
+    """
+
+    def __init__(
+        self,
+        spin: float = 0.0002,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.spin = spin
+        self.clock = clock
+        self.sleep = sleep
+        self.streams: Dict[str, Stream] = {}
+
+    def add(self, name: str, rate: float) -> None:
+        """
+        Adds a stream ticking `rate` times per second, starting now.
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate of stream {name} must be positive: {rate}")
+        self.streams[name] = Stream(name, 1.0 / rate, self.clock())
+
+    def set_rate(self, name: str, rate: float) -> None:
+        """
+        Changes the rate of a stream; the next tick is at most one new
+        period away.
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate of stream {name} must be positive: {rate}")
+        stream = self.streams[name]
+        stream.period = 1.0 / rate
+        stream.deadline = min(stream.deadline, self.clock() + stream.period)
+
+    def wait(self) -> List[str]:
+        """
+        Blocks until the next deadline and returns the names of the
+        streams that are due.
+        """
+        deadline = min(stream.deadline for stream in self.streams.values())
+        remaining = deadline - self.clock()
+        if remaining > self.spin:
+            self.sleep(remaining - self.spin)
+        now = self.clock()
+        while now < deadline:
+            now = self.clock()
+
+        due = []
+        for stream in self.streams.values():
+            if stream.deadline > now:
+                continue
+            stream.ticks += 1
+            stream.jitter.append(now - stream.deadline)
+            stream.deadline += stream.period
+            if stream.deadline <= now:
+                missed = int((now - stream.deadline) // stream.period) + 1
+                stream.overruns += 1
+                stream.missed += missed
+                stream.deadline += missed * stream.period
+            due.append(stream.name)
+        return due
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Tick counts, overruns and jitter (mean, p99, max in microseconds)
+        per stream, for the ticks since the previous call (the last
+        JITTER_SAMPLES of them).
+        """
+        result = {}
+        for stream in self.streams.values():
+            jitter = sorted(stream.jitter)
+            stream.jitter.clear()
+            count = len(jitter)
+            result[stream.name] = {
+                "ticks": stream.ticks,
+                "overruns": stream.overruns,
+                "missed": stream.missed,
+                "jitter_mean_us": 1e6 * sum(jitter) / count if count else 0.0,
+                "jitter_p99_us": (
+                    1e6 * jitter[int(0.99 * (count - 1))] if count else 0.0
+                ),
+                "jitter_max_us": 1e6 * jitter[-1] if count else 0.0,
+            }
+        return result
+
+    def log_stats(self) -> Dict[str, dict]:
+        """
+        Logs stats() and returns it.
+        """
+        result = self.stats()
+        for name, stats in result.items():
+            logging.info(
+                f"[Scheduler] {name}: {stats['ticks']} ticks, "
+                f"{stats['overruns']} overruns ({stats['missed']} missed), jitter "
+                f"mean {stats['jitter_mean_us']:.0f}us "
+                f"p99 {stats['jitter_p99_us']:.0f}us max {stats['jitter_max_us']:.0f}us"
+            )
+        return result
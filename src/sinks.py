@@ -0,0 +1,272 @@
+import json
+import socket
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.codec import encode_message, encode_batch
+from src.metrics import Metrics
+from src.mqtt import MqttPublisher
+
+
+def encode_json(message: dict) -> bytes:
+    return json.dumps(message).encode("utf-8")
+
+
+# Wire format name -> encoder
+ENCODERS: Dict[str, Callable[[dict], bytes]] = {
+    "json": encode_json,
+    "binary": encode_message,
+}
+
+# (frame sequence, sample timestamp) of a queued payload
+Stamp = Tuple[int, float]
+
+
+def encode_json_batch(frames: List[Tuple[int, float, bytes]]) -> bytes:
+    """
+    JSON counterpart of codec.encode_batch, splicing the already encoded
+    messages instead of decoding them again.
+    """
+    parts = [
+        b'{"seq": %d, "timestamp": %.6f, "message": %s}' % frame for frame in frames
+    ]
+    return (
+        b'{"message_type": "telemetry_batch", "frames": [' + b", ".join(parts) + b"]}"
+    )
+
+
+# Wire format name -> batch encoder
+BATCH_ENCODERS = {
+    "json": encode_json_batch,
+    "binary": encode_batch,
+}
+
+
+class Batcher:
+    """
+    Collects encoded telemetry into batch messages: a batch is complete
+    after `max_frames` frames or `window` seconds after its first frame,
+    whichever comes first (None: no limit of that kind).
+    """
+
+    def __init__(
+        self,
+        wire_format: str = "json",
+        max_frames: Optional[int] = 10,
+        window: Optional[float] = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if wire_format not in BATCH_ENCODERS:
+            raise ValueError(f"Unknown wire format: {wire_format}")
+        if not max_frames and not window:
+            raise ValueError("Batching needs max_frames or a window")
+        self.encode = BATCH_ENCODERS[wire_format]
+        self.max_frames = max_frames
+        self.window = window
+        self.clock = clock
+        self.frames: List[Tuple[int, float, bytes]] = []
+        self.deadline = None
+
+    def add(self, payload: bytes, stamp: Optional[Stamp] = None) -> Optional[bytes]:
+        """
+        Adds a frame, returns the batch when it is complete.
+        """
+        if stamp is None:
+            stamp = (0, time.time())
+        if not self.frames and self.window:
+            self.deadline = self.clock() + self.window
+        self.frames.append((stamp[0], stamp[1], payload))
+        if self.max_frames and len(self.frames) >= self.max_frames:
+            return self.flush()
+        if self.deadline is not None and self.clock() >= self.deadline:
+            return self.flush()
+        return None
+
+    def timeout(self) -> Optional[float]:
+        """
+        Seconds until the pending batch is due, None when nothing is pending.
+        """
+        if not self.frames or self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self.clock())
+
+    def flush(self) -> Optional[bytes]:
+        """
+        Returns the pending frames as a batch (None when there are none).
+        """
+        if not self.frames:
+            return None
+        batch = self.encode(self.frames)
+        self.frames = []
+        self.deadline = None
+        return batch
+
+
+class Sink:
+    """
+    Destination for encoded messages. `kind` is "event", "telemetry",
+    "session" or "telemetry/<group>" (topic groups), `kinds` lists the
+    ones the sink takes. `wire_format` selects which encoding of the
+    message the sink receives, `delta` whether it gets the delta-encoded
+    telemetry stream. `stamp` is the (frame sequence, sample timestamp)
+    of the message, when known.
+
+    Sinks that hold messages back (batching) return the seconds until
+    they want flush() called from flush_timeout().
+    """
+
+    wire_format = "json"
+    delta = False
+    kinds = ("event", "telemetry")
+
+    def accepts(self, kind: str) -> bool:
+        return kind in self.kinds
+
+    def send(self, kind: str, payload: bytes, stamp: Optional[Stamp] = None) -> None:
+        raise NotImplementedError
+
+    def flush_timeout(self) -> Optional[float]:
+        return None
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class UdpSink(Sink):
+    def __init__(
+        self, host: str, port: int, wire_format: str = "json", delta: bool = False
+    ):
+        self.address = (host, port)
+        self.wire_format = wire_format
+        self.delta = delta
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, kind: str, payload: bytes, stamp: Optional[Stamp] = None) -> None:
+        self.sock.sendto(payload, self.address)
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+class MqttSink(Sink):
+    """
+    Publishes through an MqttPublisher, which stays owned by the caller.
+    With a `batcher`, telemetry goes out in batches; a pending batch is
+    published before any other message, so the order is kept. Delta
+    telemetry is not spooled while the broker is unreachable.
+    """
+
+    def __init__(
+        self,
+        publisher: MqttPublisher,
+        wire_format: str = "json",
+        delta: bool = False,
+        full_telemetry: bool = True,
+        batcher: Optional[Batcher] = None,
+    ):
+        self.publisher = publisher
+        self.wire_format = wire_format
+        self.delta = delta
+        # With topic groups, the full message can be left out
+        self.full_telemetry = full_telemetry
+        self.batcher = batcher
+
+    def accepts(self, kind: str) -> bool:
+        return kind != "telemetry" or self.full_telemetry
+
+    def send(self, kind: str, payload: bytes, stamp: Optional[Stamp] = None) -> None:
+        if kind == "telemetry" and self.batcher is not None:
+            batch = self.batcher.add(payload, stamp)
+            if batch is not None:
+                self.publisher.publish_telemetry(batch, spooled=not self.delta)
+            return
+        self.flush()
+
+        if kind == "event":
+            self.publisher.publish_event(payload)
+        elif kind == "telemetry":
+            self.publisher.publish_telemetry(payload, spooled=not self.delta)
+        elif kind == "session":
+            self.publisher.publish_session(payload)
+        else:
+            self.publisher.publish_group(kind.partition("/")[2], payload)
+
+    def flush_timeout(self) -> Optional[float]:
+        return self.batcher.timeout() if self.batcher is not None else None
+
+    def flush(self) -> None:
+        if self.batcher is not None:
+            batch = self.batcher.flush()
+            if batch is not None:
+                self.publisher.publish_telemetry(batch, spooled=not self.delta)
+
+    def close(self) -> None:
+        self.flush()
+
+
+class Fanout:
+    """
+    Encodes a message once per wire format in use and hands the same
+    bytes to every sink. Sinks with `delta` set get `delta_message`
+    instead, when one is given.
+    """
+
+    def __init__(self, sinks: List[Sink], metrics: Optional[Metrics] = None):
+        self.sinks = sinks
+        for sink in sinks:
+            if sink.wire_format not in ENCODERS:
+                raise ValueError(f"Unknown wire format: {sink.wire_format}")
+        # Encoding time per wire format
+        self.encode_times = {}
+        if metrics is not None:
+            self.encode_times = {
+                sink.wire_format: metrics.stage(f"encode_{sink.wire_format}")
+                for sink in sinks
+            }
+
+    def encode(
+        self, kind: str, message: dict, delta_message: Optional[dict] = None
+    ) -> List[Optional[bytes]]:
+        """
+        Returns the payload of every sink, in sink order (None for sinks
+        that do not take this kind of message).
+        """
+        encoded = {}
+        payloads = []
+        for sink in self.sinks:
+            if not sink.accepts(kind):
+                payloads.append(None)
+                continue
+            delta = sink.delta and delta_message is not None
+            key = (sink.wire_format, delta)
+            payload = encoded.get(key)
+            if payload is None:
+                start = time.perf_counter()
+                payload = encoded[key] = ENCODERS[sink.wire_format](
+                    delta_message if delta else message
+                )
+                encode_time = self.encode_times.get(sink.wire_format)
+                if encode_time is not None:
+                    encode_time.observe(time.perf_counter() - start)
+            payloads.append(payload)
+        return payloads
+
+    def publish(
+        self, kind: str, message: dict, delta_message: Optional[dict] = None
+    ) -> None:
+        payloads = self.encode(kind, message, delta_message)
+        for sink, payload in zip(self.sinks, payloads):
+            if payload is None:
+                continue
+            try:
+                sink.send(kind, payload)
+            except OSError as e:
+                logging.info(f"[{type(sink).__name__}] Send failed: {e}")
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,609 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+import yaml
+
+from src.broker import StandInBroker
+from src.codec import FrameReconstructor, batch_messages, decode_message
+from src.metrics import Histogram
+from src.pyacsharedmemory import PACKET_ID_STRUCT
+from src.recorder import PAGE_NAMES
+from src.replay import DUMP_PAGE_SIZES, dump_frames, recording_frames
+from src.sources import FileSource
+from src.synthetic import SyntheticSim
+from src.utils import Config
+
+logging.getLogger().setLevel(logging.INFO)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 10% wide latency buckets, 10us to about 10s
+SOAK_BUCKETS = tuple(1e-5 * 1.1**i for i in range(146))
+
+
+class Receiver:
+    """
+    Counts the telemetry frames a sink delivers and their end-to-end
+    latency: from writing the physics page (by packet ID, see `written`)
+    to receiving the message.
+    """
+
+    def __init__(self, name: str, written: Dict[int, float]):
+        self.name = name
+        self.written = written
+        self.reconstructor = FrameReconstructor()
+        self.messages = 0
+        self.frames = 0
+        self.latency = Histogram(SOAK_BUCKETS)
+        self.stage_latency = Histogram(SOAK_BUCKETS)
+        self.max_latency = 0.0
+        # Latencies since the last report
+        self.recent: List[float] = []
+
+    def receive(self, payload: bytes) -> None:
+        now = time.monotonic()
+        self.messages += 1
+        for message in batch_messages(decode_message(payload)):
+            message = self.reconstructor.apply(message)
+            if message is None or message.get("message_type") != "telemetry":
+                continue
+            self.frames += 1
+            written = self.written.get(message["physics_info"].get("packed_id"))
+            if written is not None:
+                latency = now - written
+                self.latency.observe(latency)
+                self.max_latency = max(self.max_latency, latency)
+                self.recent.append(latency)
+
+    def take_recent(self) -> List[float]:
+        recent, self.recent = self.recent, []
+        return sorted(recent)
+
+
+class UdpReceiver(Receiver):
+    def __init__(self, written: Dict[int, float]):
+        super().__init__("udp", written)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.5)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self.run, name="udp", daemon=True).start()
+
+    def run(self) -> None:
+        while self.running:
+            try:
+                self.receive(self.sock.recv(65535))
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+
+    def close(self) -> None:
+        self.running = False
+        self.sock.close()
+
+
+class MqttReceiver(Receiver):
+    """
+    Subscribes to the telemetry topic over websockets, like a dashboard.
+    """
+
+    def __init__(self, written: Dict[int, float], port: int, topic: str):
+        super().__init__("mqtt", written)
+        self.topic = topic
+        self.client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2, transport="websockets"
+        )
+        self.client.on_connect = self.on_connect
+        self.client.on_message = lambda client, userdata, msg: self.receive(msg.payload)
+        self.client.connect("127.0.0.1", port)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties=None):
+        client.subscribe(self.topic)
+
+    def close(self) -> None:
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class Writer:
+    """
+    Writes frames into file-backed pages on a background thread, as the
+    game does, and notes when every physics packet ID was written.
+    `rate` (synthetic frames per second, or the replay speed) can change
+    while running.
+    """
+
+    def __init__(self, directory: str, rate: float, frames=None):
+        self.source = FileSource(directory)
+        self.rate = rate
+        # Recorded frames for a replay, synthetic frames without
+        self.frames = frames
+        self.written: Dict[int, float] = {}
+        self._order = collections.deque()
+        self.count = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="writer", daemon=True)
+
+    def note(self, packet_id: int) -> None:
+        now = time.monotonic()
+        if packet_id not in self.written:
+            self._order.append(packet_id)
+        self.written[packet_id] = now
+        self.count += 1
+        # Only recent frames are still in flight
+        while len(self._order) > 100000:
+            self.written.pop(self._order.popleft(), None)
+
+    def run(self) -> None:
+        if self.frames is None:
+            self.run_synthetic()
+        else:
+            self.run_replay()
+
+    def run_synthetic(self) -> None:
+        sim = SyntheticSim(self.source)
+        start = deadline = time.monotonic()
+        while self.running:
+            period = 1.0 / self.rate
+            packet_id = sim.packet_id
+            sim.step(deadline - start, period)
+            if sim.packet_id != packet_id:
+                self.note(sim.packet_id)
+            deadline += period
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        sim.close()
+
+    def run_replay(self) -> None:
+        paths, dump_rate = self.frames
+        pages = [
+            self.source.open_page(name, size)
+            for name, size in zip(PAGE_NAMES, DUMP_PAGE_SIZES)
+        ]
+        while self.running:
+            if os.path.splitext(paths[0])[1] == ".acrec":
+                frames = recording_frames(paths)
+            else:
+                frames = dump_frames(paths[0], dump_rate)
+            start = time.monotonic()
+            first = None
+            for timestamp, records in frames:
+                if not self.running:
+                    break
+                if first is None:
+                    first = timestamp
+                remaining = start + (timestamp - first) / self.rate - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+                for page, data in records:
+                    pages[page][: len(data)] = data
+                    if page == 0:
+                        self.note(PACKET_ID_STRUCT.unpack_from(data)[0])
+        for page in pages:
+            page.close()
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        self.thread.join()
+
+
+def scrape(port: int) -> Dict[str, float]:
+    """
+    The forwarder's metrics, by name with labels, e.g.
+    'forwarder_dropped_total{queue="encoder"}'.
+    """
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as r:
+            text = r.read().decode("utf-8")
+    except OSError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            values[name] = float(value)
+    return values
+
+
+def _sum(metrics: Dict[str, float], prefix: str) -> float:
+    return sum(value for name, value in metrics.items() if name.startswith(prefix))
+
+
+class ProcessStats:
+    """
+    RSS and CPU time of a process, from /proc.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+
+    def rss(self) -> float:
+        """
+        Resident set size in MiB.
+        """
+        with open(f"/proc/{self.pid}/status") as fp:
+            for line in fp:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+        return 0.0
+
+    def cpu(self) -> float:
+        """
+        User and system CPU seconds.
+        """
+        with open(f"/proc/{self.pid}/stat") as fp:
+            # The command name may hold spaces, the fields after it do not
+            fields = fp.read().rpartition(")")[2].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentiles(values: List[float]) -> str:
+    if not values:
+        return "-"
+    p50 = values[len(values) // 2]
+    p99 = values[int(0.99 * (len(values) - 1))]
+    return f"p50 {1e3 * p50:.1f}ms p99 {1e3 * p99:.1f}ms"
+
+
+def _slope(points: List[tuple]) -> float:
+    """
+    Least-squares slope of (x, y) points.
+    """
+    if len(points) < 2:
+        return 0.0
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+class Soak:
+    """
+    End-to-end load run on one machine: a Writer fills the pages, the
+    forwarder runs as a child process with its sinks pointed at a
+    StandInBroker (websockets) and a UDP receiver here, and its metrics
+    endpoint on. Every stage runs at one rate for `duration` seconds;
+    each `interval` a line with throughput, latency, drops, RSS and CPU
+    is logged.
+    """
+
+    def __init__(
+        self,
+        rates: List[float],
+        duration: float,
+        interval: float = 10.0,
+        replay: Optional[tuple] = None,
+        settings: Optional[dict] = None,
+        log_path: str = "soak-forwarder.log",
+        csv_path: Optional[str] = None,
+    ):
+        self.rates = rates
+        self.duration = duration
+        self.interval = interval
+        self.replay = replay
+        self.settings = settings or {}
+        self.log_path = log_path
+        self.csv_path = csv_path
+        self.samples: List[dict] = []
+        self.stages: List[List[str]] = []
+        self.totals: List[str] = []
+
+    def child_settings(self, directory: str, broker_port: int, udp_port: int) -> dict:
+        settings = {
+            "shared_memory.source": "file",
+            "shared_memory.path": directory,
+            "mqtt.enabled": True,
+            "mqtt.host": "127.0.0.1",
+            "mqtt.port": broker_port,
+            "mqtt.spool.path": os.path.join(directory, "spool.bin"),
+            "udp.enabled": True,
+            "udp.host": "127.0.0.1",
+            "udp.port": udp_port,
+            "metrics.host": "127.0.0.1",
+            "metrics.port": _free_port(),
+            "metrics.log": False,
+            "output.save": False,
+        }
+        settings.update(self.settings)
+        return settings
+
+    def run(self) -> None:
+        directory = tempfile.mkdtemp(prefix="soak-")
+        writer = Writer(directory, self.rates[0], self.replay)
+        broker = StandInBroker("127.0.0.1", 0)
+        broker.start()
+        udp = UdpReceiver(writer.written)
+        mqtt_receiver = MqttReceiver(
+            writer.written,
+            broker.port,
+            Config().get("mqtt.telemetry_topic", "ac/telemetry"),
+        )
+        receivers = [udp, mqtt_receiver]
+        settings = self.child_settings(directory, broker.port, udp.port)
+        metrics_port = settings["metrics.port"]
+
+        writer.start()
+        with open(self.log_path, "w") as log:
+            child = subprocess.Popen(
+                [sys.executable, "-m", "src.soak", "--child", json.dumps(settings)],
+                cwd=ROOT,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+        process = ProcessStats(child.pid)
+        start = time.monotonic()
+        try:
+            for rate in self.rates:
+                writer.rate = rate
+                self.run_stage(rate, start, writer, receivers, process, metrics_port)
+                if child.poll() is not None:
+                    logging.info(f"[Soak] Forwarder exited ({child.returncode})")
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            writer.stop()
+            # In-flight messages
+            time.sleep(1.0)
+            self.totals = self.total_lines(scrape(metrics_port), writer, receivers)
+            if child.poll() is None:
+                child.send_signal(signal.SIGINT)
+                try:
+                    child.wait(15)
+                except subprocess.TimeoutExpired:
+                    child.kill()
+            for receiver in receivers:
+                receiver.close()
+            broker.stop()
+        self.report(start)
+
+    def run_stage(self, rate, start, writer, receivers, process, metrics_port) -> None:
+        metrics = scrape(metrics_port)
+        stage_start = time.monotonic()
+        base = {
+            "written": writer.count,
+            "read": metrics.get("forwarder_frames_read_total", 0.0),
+            "submitted": metrics.get("forwarder_frames_submitted_total", 0.0),
+            "dropped": _sum(metrics, "forwarder_dropped_total"),
+            "cpu": process.cpu(),
+        }
+        for receiver in receivers:
+            base[receiver.name] = receiver.frames
+            receiver.stage_latency = Histogram(SOAK_BUCKETS)
+            receiver.take_recent()
+        logging.info(f"[Soak] Stage: {rate:g} {'x' if self.replay else 'Hz'}")
+
+        last = dict(base, time=stage_start)
+        end = stage_start + self.duration
+        while time.monotonic() < end:
+            time.sleep(min(self.interval, max(0.0, end - time.monotonic())))
+            now = time.monotonic()
+            metrics = scrape(metrics_port) or metrics
+            sample = {
+                "time": now,
+                "written": writer.count,
+                "read": metrics.get("forwarder_frames_read_total", 0.0),
+                "submitted": metrics.get("forwarder_frames_submitted_total", 0.0),
+                "dropped": _sum(metrics, "forwarder_dropped_total"),
+                "cpu": process.cpu(),
+            }
+            elapsed = now - last["time"]
+            parts = [
+                f"{now - start:.0f}s",
+                f"written {(sample['written'] - last['written']) / elapsed:.0f}/s",
+                f"read {(sample['read'] - last['read']) / elapsed:.0f}/s",
+            ]
+            row = {
+                "elapsed": round(now - start, 1),
+                "rate": rate,
+                "rss_mib": round(process.rss(), 2),
+                "cpu_percent": round(100 * (sample["cpu"] - last["cpu"]) / elapsed, 1),
+                "dropped": sample["dropped"],
+                "queue_depth": _sum(metrics, "forwarder_queue_depth"),
+            }
+            for receiver in receivers:
+                sample[receiver.name] = receiver.frames
+                recent = receiver.take_recent()
+                for latency in recent:
+                    receiver.stage_latency.observe(latency)
+                parts.append(
+                    f"{receiver.name} "
+                    f"{(sample[receiver.name] - last[receiver.name]) / elapsed:.0f}/s "
+                    f"{_percentiles(recent)}"
+                )
+                row[f"{receiver.name}_per_s"] = round(
+                    (sample[receiver.name] - last[receiver.name]) / elapsed, 1
+                )
+                row[f"{receiver.name}_p99_ms"] = (
+                    round(1e3 * recent[int(0.99 * (len(recent) - 1))], 2)
+                    if recent
+                    else None
+                )
+            parts += [
+                f"dropped {sample['dropped'] - base['dropped']:.0f}",
+                f"rss {row['rss_mib']:.1f} MiB",
+                f"cpu {row['cpu_percent']:.0f}%",
+            ]
+            logging.info("[Soak] " + ", ".join(parts))
+            self.samples.append(row)
+            last = sample
+
+        self.stages.append(self.stage_summary(rate, base, last, receivers))
+
+    def stage_summary(self, rate, base, last, receivers) -> List[str]:
+        unit = "x" if self.replay else "Hz"
+        submitted = last["submitted"] - base["submitted"]
+        dropped = last["dropped"] - base["dropped"]
+        lines = [
+            f"[Soak] {rate:g} {unit}: written {last['written'] - base['written']}, "
+            f"read {last['read'] - base['read']:.0f}, submitted {submitted:.0f}, "
+            f"dropped {dropped:.0f}"
+        ]
+        saturated = dropped > 0
+        for receiver in receivers:
+            received = last[receiver.name] - base[receiver.name]
+            # Frames in flight at the stage edges count in the next stage
+            loss = max(0.0, 1.0 - received / submitted) if submitted else 0.0
+            saturated = saturated or loss > 0.005
+            histogram = receiver.stage_latency
+            lines.append(
+                f"[Soak]   {receiver.name}: {received} frames, loss {100 * loss:.2f}%, "
+                f"latency p50 {1e3 * histogram.quantile(0.5):.1f}ms "
+                f"p90 {1e3 * histogram.quantile(0.9):.1f}ms "
+                f"p99 {1e3 * histogram.quantile(0.99):.1f}ms"
+            )
+        lines.append(f"[Soak]   {'saturated' if saturated else 'kept up'}")
+        return lines
+
+    def total_lines(self, metrics: Dict[str, float], writer, receivers) -> List[str]:
+        """
+        Totals of the whole run, once nothing is in flight anymore.
+        """
+        if not metrics:
+            return ["[Soak] Total: forwarder metrics unavailable"]
+        submitted = metrics.get("forwarder_frames_submitted_total", 0.0)
+        lines = [
+            f"[Soak] Total: written {writer.count}, "
+            f"read {metrics.get('forwarder_frames_read_total', 0.0):.0f}, "
+            f"submitted {submitted:.0f}, "
+            f"dropped {_sum(metrics, 'forwarder_dropped_total'):.0f}"
+        ]
+        for receiver in receivers:
+            loss = 1.0 - receiver.frames / submitted if submitted else 0.0
+            latency = receiver.latency
+            lines.append(
+                f"[Soak]   {receiver.name}: {receiver.frames} frames, "
+                f"loss {100 * loss:.3f}%, latency p50 {1e3 * latency.quantile(0.5):.1f}ms "
+                f"p99 {1e3 * latency.quantile(0.99):.1f}ms "
+                f"max {1e3 * receiver.max_latency:.1f}ms"
+            )
+        return lines
+
+    def report(self, start: float) -> None:
+        logging.info(f"[Soak] Done after {time.monotonic() - start:.0f}s")
+        for lines in self.stages + [self.totals]:
+            for line in lines:
+                logging.info(line)
+        if self.samples:
+            # Leave out the first minute (imports, caches, first allocations)
+            settled = [
+                (row["elapsed"] / 3600.0, row["rss_mib"])
+                for row in self.samples
+                if row["elapsed"] >= 60
+            ] or [(row["elapsed"] / 3600.0, row["rss_mib"]) for row in self.samples]
+            rss = [row["rss_mib"] for row in self.samples]
+            cpu = [row["cpu_percent"] for row in self.samples]
+            logging.info(
+                f"[Soak] RSS {rss[0]:.1f} -> {rss[-1]:.1f} MiB (max {max(rss):.1f}), "
+                f"trend {_slope(settled):+.2f} MiB/h; "
+                f"CPU mean {sum(cpu) / len(cpu):.0f}% max {max(cpu):.0f}%"
+            )
+        if self.csv_path and self.samples:
+            with open(self.csv_path, "w") as fp:
+                fp.write(",".join(self.samples[0]) + "\n")
+                for row in self.samples:
+                    fp.write(
+                        ",".join("" if v is None else str(v) for v in row.values())
+                    )
+                    fp.write("\n")
+            logging.info(f"[Soak] Wrote {self.csv_path}")
+
+
+def run_forwarder(settings: dict) -> None:
+    """
+    The forwarder side of a soak: config.yaml with `settings` (dotted
+    keys) on top.
+    """
+    config = Config()
+    for key, value in settings.items():
+        config.set(key, value)
+
+    # The forwarder lives in server.py, at the top of the repo
+    from server import AcUdpMqttForwarder
+
+    AcUdpMqttForwarder().run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end soak test")
+    parser.add_argument(
+        "--rate", default="333", help="synthetic frames/s, comma-separated stages"
+    )
+    parser.add_argument(
+        "--replay", nargs="+", help="recordings (.acrec) or a page dump instead"
+    )
+    parser.add_argument(
+        "--speed", default="1", help="replay speeds, comma-separated stages"
+    )
+    parser.add_argument("--dump-rate", type=float, default=333.0)
+    parser.add_argument(
+        "--duration", type=float, default=600.0, help="seconds per stage"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=10.0, help="seconds between reports"
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="forwarder config override, e.g. mqtt.batch.enabled=true",
+    )
+    parser.add_argument("--log", default="soak-forwarder.log", help="forwarder log")
+    parser.add_argument("--csv", help="write the time series here")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_forwarder(json.loads(args.child))
+        return
+
+    settings = {}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        settings[key] = yaml.safe_load(value)
+    replay = (args.replay, args.dump_rate) if args.replay else None
+    rates = [float(rate) for rate in (args.speed if replay else args.rate).split(",")]
+    Soak(
+        rates,
+        args.duration,
+        args.interval,
+        replay,
+        settings,
+        args.log,
+        args.csv,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
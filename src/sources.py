@@ -0,0 +1,76 @@
+import mmap
+import os
+import logging
+
+
+class FrameSource:
+    """
+    Opens the shared memory pages (physics, graphics, static) that the
+    readers decode. Backends only differ in where the pages live.
+    """
+
+    def open_page(self, name: str, size: int, map_class=mmap.mmap) -> mmap.mmap:
+        raise NotImplementedError
+
+
+class TagnameSource(FrameSource):
+    """
+    Windows named shared memory, as created by the game (Local\\acpmf_*).
+    """
+
+    def open_page(self, name: str, size: int, map_class=mmap.mmap) -> mmap.mmap:
+        return map_class(
+            -1, size, tagname=f"Local\\acpmf_{name}", access=mmap.ACCESS_WRITE
+        )
+
+
+class FileSource(FrameSource):
+    """
+    File-backed pages, e.g. /dev/shm/acpmf_physics. Files are created and
+    sized when missing, so reader and producer can start in any order.
+    """
+
+    def __init__(self, directory: str = "/dev/shm"):
+        self.directory = directory
+
+    def page_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"acpmf_{name}")
+
+    def open_page(self, name: str, size: int, map_class=mmap.mmap) -> mmap.mmap:
+        path = self.page_path(name)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            # mmap keeps its own handle on the file
+            return map_class(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+
+class MemorySource(FrameSource):
+    """
+    Anonymous in-process pages, written by a replay. `pages` keeps them
+    by name.
+    """
+
+    def __init__(self):
+        self.pages = {}
+
+    def open_page(self, name: str, size: int, map_class=mmap.mmap) -> mmap.mmap:
+        page = self.pages.get(name)
+        if page is None:
+            page = self.pages[name] = map_class(-1, size)
+        return page
+
+
+def create_source(kind: str = "tagname", path: str = "/dev/shm") -> FrameSource:
+    """
+    Creates a frame source from its config name.
+    """
+    if kind == "tagname":
+        return TagnameSource()
+    if kind == "file":
+        logging.info(f"Reading shared memory pages from {path}")
+        return FileSource(path)
+    raise ValueError(f"Unknown shared memory source: {kind}")
@@ -0,0 +1,109 @@
+import logging
+import os
+import struct
+import threading
+from typing import Optional, Tuple
+
+# Record: topic length (uint16), payload length (uint32), topic, payload
+RECORD = struct.Struct("<HI")
+
+
+class Spool:
+    """
+    Append-only store-and-forward file for MQTT messages published while
+    the broker is unreachable. Events are always kept; telemetry is
+    downsampled to one in `telemetry_every` messages (0: none) and
+    refused once the file reaches max_bytes. Records are read back in
+    order with peek()/commit(), and the file is truncated once drained.
+    Records left over from a previous run are sent first.
+    """
+
+    def __init__(
+        self,
+        path: str = "mqtt_spool.bin",
+        max_bytes: int = 64 * 1024 * 1024,
+        telemetry_every: int = 10,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.telemetry_every = telemetry_every
+        self.lock = threading.Lock()
+
+        self.file = open(path, "a+b")
+        self.size = self.file.tell()
+        self.read_offset = 0
+        self._next_offset = 0
+        self._telemetry_seen = 0
+
+        self.spooled = 0
+        self.dropped = 0
+        if self.size:
+            logging.info(f"[Spool] {self.size} bytes left to send in {path}")
+
+    @property
+    def pending(self) -> bool:
+        return self.read_offset < self.size
+
+    def append(self, topic: str, payload: bytes, critical: bool = False) -> bool:
+        """
+        Stores a message, returns False when it was left out.
+        """
+        with self.lock:
+            if not critical:
+                self._telemetry_seen += 1
+                if (
+                    not self.telemetry_every
+                    or self._telemetry_seen % self.telemetry_every
+                    or self.size + len(payload) > self.max_bytes
+                ):
+                    self.dropped += 1
+                    return False
+
+            raw_topic = topic.encode("utf-8")
+            self.file.write(RECORD.pack(len(raw_topic), len(payload)))
+            self.file.write(raw_topic)
+            self.file.write(payload)
+            self.file.flush()
+            self.size += RECORD.size + len(raw_topic) + len(payload)
+            self.spooled += 1
+            return True
+
+    def peek(self) -> Optional[Tuple[str, bytes]]:
+        """
+        Returns the oldest unsent message, without consuming it.
+        """
+        with self.lock:
+            if not self.pending:
+                return None
+            fd = self.file.fileno()
+            header = os.pread(fd, RECORD.size, self.read_offset)
+            if len(header) == RECORD.size:
+                topic_length, payload_length = RECORD.unpack(header)
+                length = topic_length + payload_length
+                body = os.pread(fd, length, self.read_offset + RECORD.size)
+                if len(body) == length:
+                    self._next_offset = self.read_offset + RECORD.size + length
+                    return body[:topic_length].decode("utf-8"), body[topic_length:]
+
+            # Partial record, cut off by a crash while writing
+            logging.info(f"[Spool] Dropping a partial record in {self.path}")
+            self._truncate()
+            return None
+
+    def commit(self) -> None:
+        """
+        Consumes the message returned by the last peek().
+        """
+        with self.lock:
+            self.read_offset = self._next_offset
+            if self.read_offset >= self.size:
+                self._truncate()
+
+    def _truncate(self) -> None:
+        self.file.truncate(0)
+        self.size = 0
+        self.read_offset = 0
+        self._next_offset = 0
+
+    def close(self) -> None:
+        self.file.close()
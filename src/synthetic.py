@@ -0,0 +1,271 @@
+import argparse
+import logging
+import math
+import time
+from typing import Optional
+
+from src.pyacsharedmemory import (
+    PHYSICS_LAYOUT,
+    GRAPHICS_LAYOUT,
+    STATIC_LAYOUT,
+    PHYSICS_STRUCT,
+    GRAPHICS_STRUCT,
+    STATIC_STRUCT,
+    PHYSICS_PAGE_SIZE,
+    GRAPHICS_PAGE_SIZE,
+    STATIC_PAGE_SIZE,
+    field_count,
+)
+from src.schemas import AC_STATUS, AC_SESSION_TYPE, AC_FLAG_TYPE
+from src.sources import FrameSource, FileSource
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Repeating status script: (status, seconds)
+STATUS_CYCLE = (
+    (AC_STATUS.AC_OFF, 2.0),
+    (AC_STATUS.AC_LIVE, 60.0),
+    (AC_STATUS.AC_PAUSE, 3.0),
+    (AC_STATUS.AC_LIVE, 60.0),
+    (AC_STATUS.AC_REPLAY, 5.0),
+)
+
+
+def pack_layout(layout: tuple, fields: dict) -> list:
+    """
+    Flattens named field values into the order expected by the layout's
+    struct. Missing fields are zero, strings are UTF-16 encoded.
+    """
+    values = []
+    for name, value_type, shape in layout:
+        count = field_count(shape)
+        value = fields.get(name)
+        if value_type == "x":
+            continue
+        if value_type == "s":
+            raw = (value or "").encode("utf-16-le")[: 2 * count]
+            values.append(raw)
+        elif not shape:
+            values.append(value if value is not None else 0)
+        else:
+            flat = list(_flatten(value)) if value is not None else []
+            flat += [0] * (count - len(flat))
+            values.extend(flat)
+    return values
+
+
+def _flatten(value):
+    for item in value:
+        if isinstance(item, (list, tuple)):
+            yield from _flatten(item)
+        else:
+            yield item
+
+
+def time_str(ms: int) -> str:
+    return f"{ms // 60000}:{(ms // 1000) % 60:02d}:{ms % 1000:03d}"
+
+
+class SyntheticSim:
+    """
+    Writes plausible physics/graphics/static pages into a frame source:
+    a car lapping an elliptic track, a rising packet ID and a repeating
+    off/live/pause/replay status script.
+    """
+
+    def __init__(
+        self,
+        source: FrameSource,
+        rate: float = 333.0,
+        lap_time: float = 90.0,
+        track_length: float = 5000.0,
+    ):
+        self.rate = rate
+        self.lap_time = lap_time
+        self.track_length = track_length
+
+        self.physicSM = source.open_page("physics", PHYSICS_PAGE_SIZE)
+        self.graphicSM = source.open_page("graphics", GRAPHICS_PAGE_SIZE)
+        self.staticSM = source.open_page("static", STATIC_PAGE_SIZE)
+
+        self.packet_id = 0
+        self.race_time = 0.0
+        self.best_lap_ms = 0
+        self.last_lap_ms = 0
+        self.write_static()
+
+    def write_static(self) -> None:
+        fields = {
+            "smVersion": "1.7",
+            "acVersion": "1.16.4",
+            "numberOfSessions": 1,
+            "numCars": 1,
+            "carModel": "synthetic_car",
+            "track": "synthetic_ring",
+            "playerName": "synthetic",
+            "playerSurname": "driver",
+            "playerNick": "SYN",
+            "sectorCount": 3,
+            "maxTorque": 261.0,
+            "maxPower": 306365.28125,
+            "maxRpm": 12100,
+            "maxFuel": 100.0,
+            "suspensionMaxTravel": (0.09, 0.09, 0.105, 0.105),
+            "tyreRadius": (0.254, 0.254, 0.33, 0.33),
+            "penaltiesEnabled": 1,
+            "aidTireRate": 1.0,
+            "trackSplineLength": self.track_length,
+            "carSkin": "default",
+        }
+        STATIC_STRUCT.pack_into(self.staticSM, 0, *pack_layout(STATIC_LAYOUT, fields))
+
+    def status_at(self, t: float) -> AC_STATUS:
+        period = sum(duration for _, duration in STATUS_CYCLE)
+        t = t % period
+        for status, duration in STATUS_CYCLE:
+            if t < duration:
+                return status
+            t -= duration
+        return AC_STATUS.AC_OFF
+
+    def step(self, t: float, dt: float) -> None:
+        """
+        Advances the simulation by dt seconds and writes the pages for
+        wall time t (seconds since start).
+        """
+        status = self.status_at(t)
+        if status == AC_STATUS.AC_LIVE:
+            self.race_time += dt
+            self.packet_id += 1
+
+        laps, lap_elapsed = divmod(self.race_time, self.lap_time)
+        position = lap_elapsed / self.lap_time
+        angle = 2.0 * math.pi * position
+        # Speed varies along the lap, slower in the "corners"
+        speed = 180.0 + 90.0 * math.cos(4.0 * angle)
+        radius_x = self.track_length / (2.0 * math.pi)
+        radius_z = radius_x * 0.6
+        wobble = math.sin(self.race_time * 17.0)
+
+        if lap_elapsed < dt and laps > 0:
+            self.last_lap_ms = int(self.lap_time * 1000)
+            if self.best_lap_ms == 0 or self.last_lap_ms < self.best_lap_ms:
+                self.best_lap_ms = self.last_lap_ms
+
+        physics = {
+            "packetID": self.packet_id,
+            "gas": 0.5 + 0.5 * math.cos(4.0 * angle),
+            "brake": max(0.0, -math.cos(4.0 * angle)),
+            "fuel": max(0.0, 100.0 - self.race_time * 0.02),
+            "gear": 3 + int(2.0 * math.cos(4.0 * angle)),
+            "rpm": int(7000 + 4000 * math.cos(4.0 * angle)),
+            "steerAngle": 0.2 * math.sin(4.0 * angle),
+            "speedKmh": speed,
+            "velocity": (
+                speed / 3.6 * -math.sin(angle),
+                0.0,
+                speed / 3.6 * math.cos(angle),
+            ),
+            "accG": (0.8 * math.sin(4.0 * angle), 0.0, 0.5 * math.cos(4.0 * angle)),
+            "wheelSlip": [0.05 + 0.01 * wobble] * 4,
+            "wheelLoad": [3500.0 + 200.0 * wobble] * 4,
+            "wheelsPressure": [27.5 + 0.1 * wobble] * 4,
+            "wheelAngularSpeed": [speed / 3.6 / 0.3] * 4,
+            "tyreCoreTemperature": [80.0 + 5.0 * math.sin(angle)] * 4,
+            "suspensionTravel": [0.05 + 0.005 * wobble] * 4,
+            "heading": angle,
+            "airTemp": 26.0,
+            "roadTemp": 32.0,
+            "brakeTemp": [300.0 + 100.0 * max(0.0, -math.cos(4.0 * angle))] * 4,
+            "tyreContactPoint": [
+                (radius_x * math.cos(angle), 0.0, radius_z * math.sin(angle))
+            ]
+            * 4,
+            "tyreContactNormal": [(0.0, 1.0, 0.0)] * 4,
+            "tyreContactHeading": [(-math.sin(angle), 0.0, math.cos(angle))] * 4,
+            "brakeBias": 0.58,
+            "localVelocity": (0.0, 0.0, speed / 3.6),
+        }
+        PHYSICS_STRUCT.pack_into(
+            self.physicSM, 0, *pack_layout(PHYSICS_LAYOUT, physics)
+        )
+
+        current_ms = int(lap_elapsed * 1000)
+        graphics = {
+            "packetID": self.packet_id,
+            "status": status.value,
+            "session": AC_SESSION_TYPE.AC_PRACTICE.value,
+            "currentTime": time_str(current_ms),
+            "lastTime": time_str(self.last_lap_ms),
+            "bestTime": time_str(self.best_lap_ms),
+            "split": time_str(current_ms),
+            "completedLaps": int(laps),
+            "position": 1,
+            "iCurrentTime": current_ms,
+            "iLastTime": self.last_lap_ms,
+            "iBestTime": self.best_lap_ms,
+            "sessionTimeLeft": -1.0,
+            "distanceTraveled": self.race_time * 50.0,
+            "currentSectorIndex": min(2, int(position * 3)),
+            "tyreCompound": "Semislicks (SM)",
+            "replayTimeMultiplier": 1.0,
+            "normalizedCarPosition": position,
+            "carCoordinates": (
+                radius_x * math.cos(angle),
+                0.0,
+                radius_z * math.sin(angle),
+            ),
+            "flag": AC_FLAG_TYPE.AC_NO_FLAG.value,
+            "idealLineOn": 1,
+            "surfaceGrip": 0.98,
+        }
+        GRAPHICS_STRUCT.pack_into(
+            self.graphicSM, 0, *pack_layout(GRAPHICS_LAYOUT, graphics)
+        )
+
+    def run(self, duration: Optional[float] = None) -> None:
+        """
+        Writes pages at `rate` Hz on absolute deadlines, until `duration`
+        seconds have passed (or forever).
+        """
+        period = 1.0 / self.rate
+        start = time.monotonic()
+        deadline = start
+        frames = 0
+        while duration is None or deadline - start < duration:
+            self.step(deadline - start, period)
+            frames += 1
+            deadline += period
+            remaining = deadline - time.monotonic()
+            if remaining > 0.002:
+                time.sleep(remaining - 0.001)
+            while time.monotonic() < deadline:
+                pass
+        logging.info(f"[Synthetic] Wrote {frames} frames in {duration}s")
+
+    def close(self) -> None:
+        self.physicSM.close()
+        self.graphicSM.close()
+        self.staticSM.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic sim page producer")
+    parser.add_argument("--path", default="/dev/shm", help="page directory")
+    parser.add_argument("--rate", type=float, default=333.0, help="frames per second")
+    parser.add_argument("--duration", type=float, default=None, help="seconds")
+    parser.add_argument("--lap-time", type=float, default=90.0, help="seconds")
+    args = parser.parse_args()
+
+    sim = SyntheticSim(FileSource(args.path), rate=args.rate, lap_time=args.lap_time)
+    logging.info(f"[Synthetic] Writing pages to {args.path} at {args.rate} Hz")
+    try:
+        sim.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import time
+from typing import Callable, Dict, List, Tuple
+
+from src.codec import TELEMETRY_SCHEMA
+
+
+class TopicGroup:
+    """
+    One telemetry subtopic: a channel subset published at `rate` Hz.
+    """
+
+    def __init__(self, name: str, rate: float, physics: list, graphics: list):
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            raise ValueError(f"Rate of topic group {name} must be positive: {rate}")
+        self.name = name
+        self.period = 1.0 / rate
+        self.physics = physics
+        self.graphics = graphics
+        self.deadline = 0.0
+
+
+class TopicGroups:
+    """
+    Splits telemetry messages into per-group messages (e.g. the wheels
+    channels on telemetry/physics/wheels), each at its own rate. Groups
+    come from config: name -> {"rate": Hz, "physics": [...], "graphics": [...]}.
+    """
+
+    def __init__(
+        self, groups: Dict[str, dict], clock: Callable[[], float] = time.monotonic
+    ):
+        self.clock = clock
+        channels = {
+            group: {
+                path[1] for path, _, _ in TELEMETRY_SCHEMA.leaves if path[0] == group
+            }
+            for group in ("physics_info", "graphics_info")
+        }
+        self.groups: List[TopicGroup] = []
+        for name, group in groups.items():
+            physics = group.get("physics") or []
+            graphics = group.get("graphics") or []
+            unknown = [c for c in physics if c not in channels["physics_info"]] + [
+                c for c in graphics if c not in channels["graphics_info"]
+            ]
+            if unknown:
+                raise ValueError(f"Unknown channels in topic group {name}: {unknown}")
+            self.groups.append(
+                TopicGroup(name, group.get("rate", 10), physics, graphics)
+            )
+
+    def split(self, message: dict) -> List[Tuple[str, dict]]:
+        """
+        Returns (group name, partial telemetry message) for the groups
+        that are due.
+        """
+        now = self.clock()
+        physics_info = message.get("physics_info", {})
+        graphics_info = message.get("graphics_info", {})
+        result = []
+        for group in self.groups:
+            if now < group.deadline:
+                continue
+            # Stay on the group's grid, unless more than a period behind
+            group.deadline += group.period
+            if group.deadline <= now:
+                group.deadline = now + group.period
+            partial = {"message_type": "telemetry"}
+            if "frame_tag" in message:
+                partial["frame_tag"] = message["frame_tag"]
+            if group.physics:
+                partial["physics_info"] = {
+                    c: physics_info[c] for c in group.physics if c in physics_info
+                }
+            if group.graphics:
+                partial["graphics_info"] = {
+                    c: graphics_info[c] for c in group.graphics if c in graphics_info
+                }
+            result.append((group.name, partial))
+        return result
@@ -1,6 +1,9 @@
 from dataclasses import is_dataclass, fields
+import contextlib
+import copy
 import enum
-from typing import Any
+import typing
+from typing import Any, Callable
 import yaml
 import os
 import sys
@@ -10,6 +13,7 @@ import logging
 def strip_nulls_from_dataclass(dc):
     """
     If there are trailing empty bytes defined, this function strips them.
+    The page decoders already strip them while decoding strings.
     """
     if not is_dataclass(dc):
         return dc
@@ -32,22 +36,98 @@ def dataclass_to_dict(obj: Any) -> Any:
     if isinstance(obj, enum.Enum):
         return obj.name
 
+    if is_dataclass(obj):
+        return serializer_for(type(obj))(obj)
+
+    if isinstance(obj, list):
+        return [dataclass_to_dict(item) for item in obj]
+
+    if isinstance(obj, dict):
+        return {k: dataclass_to_dict(v) for k, v in obj.items()}
+
+    return obj
+
+
+def reflective_dataclass_to_dict(obj: Any) -> Any:
+    """
+    Reference implementation of dataclass_to_dict that walks fields() on
+    every call. Used to check and benchmark the generated serializers.
+    """
+    if isinstance(obj, enum.Enum):
+        return obj.name
+
     if is_dataclass(obj):
         result = {}
         for f in fields(obj):
             value = getattr(obj, f.name)
-            result[f.name] = dataclass_to_dict(value)
+            result[f.name] = reflective_dataclass_to_dict(value)
         return result
 
     if isinstance(obj, list):
-        return [dataclass_to_dict(item) for item in obj]
+        return [reflective_dataclass_to_dict(item) for item in obj]
 
     if isinstance(obj, dict):
-        return {k: dataclass_to_dict(v) for k, v in obj.items()}
+        return {k: reflective_dataclass_to_dict(v) for k, v in obj.items()}
 
     return obj
 
 
+_SERIALIZERS = {}
+_PLAIN_TYPES = (int, float, bool, str)
+
+
+def _field_expression(value: str, field_type: Any, lines: list) -> str:
+    """
+    Returns the Python expression that serializes `value`, a field of
+    type field_type. Nested dataclasses are inlined.
+    """
+    if isinstance(field_type, type):
+        if issubclass(field_type, enum.Enum):
+            return f"{value}.name"
+        if field_type in _PLAIN_TYPES:
+            return value
+        if is_dataclass(field_type):
+            local = f"v{len(lines)}"
+            lines.append(f"    {local} = {value}")
+            return _dict_expression(local, field_type, lines)
+    # Anything else (lists, Any, ...) goes through the generic path
+    return f"convert({value})"
+
+
+def _dict_expression(value: str, cls: type, lines: list) -> str:
+    hints = typing.get_type_hints(cls)
+    items = [
+        f"{f.name!r}: {_field_expression(f'{value}.{f.name}', hints[f.name], lines)}"
+        for f in fields(cls)
+    ]
+    return "{" + ", ".join(items) + "}"
+
+
+def compile_serializer(cls: type) -> Callable[[Any], dict]:
+    """
+    Generates a function that converts an instance of the dataclass `cls`
+    to the same dict as dataclass_to_dict, in one pass and without
+    inspecting fields or types per call.
+    """
+    lines = []
+    result = _dict_expression("obj", cls, lines)
+    source = "def to_dict(obj):\n" + "\n".join(lines) + f"\n    return {result}\n"
+
+    namespace = {"convert": dataclass_to_dict}
+    exec(compile(source, f"<serializer {cls.__name__}>", "exec"), namespace)
+    return namespace["to_dict"]
+
+
+def serializer_for(cls: type) -> Callable[[Any], dict]:
+    """
+    Returns the generated serializer of a dataclass, compiled on first use.
+    """
+    serializer = _SERIALIZERS.get(cls)
+    if serializer is None:
+        serializer = _SERIALIZERS[cls] = compile_serializer(cls)
+    return serializer
+
+
 class Config:
     """
     Reads config.yaml
@@ -83,3 +163,28 @@ class Config:
             if data is default:
                 break
         return data
+
+    def set(self, key, value):
+        """
+        Sets a dotted key, creating the sections on the way.
+        """
+        *parents, name = key.split(".")
+        section = self.config_data
+        for parent in parents:
+            if not isinstance(section.get(parent), dict):
+                section[parent] = {}
+            section = section[parent]
+        section[name] = value
+
+    @contextlib.contextmanager
+    def override(self, settings: dict):
+        """
+        Applies `settings` (dotted keys) until the with block exits.
+        """
+        saved = copy.deepcopy(self.config_data)
+        try:
+            for key, value in settings.items():
+                self.set(key, value)
+            yield self
+        finally:
+            self.config_data = saved
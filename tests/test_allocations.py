@@ -0,0 +1,19 @@
+import os
+
+from src.allocations import check_budget, measure_frames, synthetic_frames
+from src.utils import Config
+
+
+def test_allocations_per_frame_within_budget():
+    report = measure_frames(synthetic_frames(350), 300, warmup=50)
+    assert len(report.peaks["decode"]) == 300
+    assert check_budget(report.per_frame(), Config().get("allocations.budget")) == []
+
+
+def test_measurement_sends_and_spools_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mqtt_enabled = Config().get("mqtt.enabled")
+    measure_frames(synthetic_frames(20), 10, warmup=5)
+    assert os.listdir(tmp_path) == []
+    # The measurement settings are only applied while building it
+    assert Config().get("mqtt.enabled") == mqtt_enabled
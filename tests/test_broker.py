@@ -0,0 +1,183 @@
+"""
+MqttPublisher against the local stand-in broker: reconnects with
+backoff, spooling while the broker is down, the drain rate and the
+order of events across an outage.
+"""
+
+import json
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from src.broker import StandInBroker
+from src.codec import DeltaEncoder, FrameReconstructor
+from src.mqtt import MqttPublisher
+from src.sinks import MqttSink
+from src.spool import Spool
+from tests.test_codec import telemetry_message
+
+
+class RecordingBroker(StandInBroker):
+    """
+    Keeps every message it receives, with its arrival time.
+    """
+
+    def __init__(self):
+        super().__init__(port=0)
+        self.received = []
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        self.received.append((time.monotonic(), topic, payload))
+        super().publish(topic, payload, retain)
+
+    def events(self) -> list:
+        return [
+            int(payload) for _, topic, payload in self.received if topic == "ac/events"
+        ]
+
+
+def wait_for(condition, timeout: float = 10.0) -> None:
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            raise AssertionError("Timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def broker():
+    broker = RecordingBroker()
+    broker.start()
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def publisher(broker, tmp_path):
+    publisher = MqttPublisher(
+        broker.host,
+        broker.port,
+        "ac/events",
+        "ac/telemetry",
+        spool=Spool(str(tmp_path / "spool.bin")),
+        backoff_min=0.05,
+        backoff_max=0.2,
+        drain_rate=100,
+    )
+    publisher.start()
+    wait_for(lambda: publisher.is_connected)
+    yield publisher
+    publisher.close()
+
+
+def test_events_arrive_once_and_in_order_across_an_outage(broker, publisher):
+    for number in range(10):
+        publisher.publish_event(b"%d" % number)
+    wait_for(lambda: len(broker.events()) == 10)
+
+    broker.stop()
+    wait_for(lambda: not publisher.is_connected)
+    for number in range(10, 60):
+        publisher.publish_event(b"%d" % number)
+    assert publisher.spool.spooled == 50
+    # Retries back off while the broker is down
+    time.sleep(0.5)
+
+    broker.start()
+    wait_for(lambda: publisher.is_connected)
+    # Published while the spool drains: queued behind the spooled events
+    for number in range(60, 70):
+        publisher.publish_event(b"%d" % number)
+    wait_for(lambda: len(broker.events()) == 70)
+    time.sleep(0.2)
+
+    assert broker.events() == list(range(70))
+    assert publisher.disconnects == 1
+    assert not publisher.spool.pending
+
+
+def test_spool_drains_at_the_drain_rate(broker, publisher):
+    broker.stop()
+    wait_for(lambda: not publisher.is_connected)
+    for number in range(60):
+        publisher.publish_event(b"%d" % number)
+
+    broker.start()
+    wait_for(lambda: len(broker.events()) == 60)
+    times = [t for t, topic, _ in broker.received if topic == "ac/events"]
+    # A burst of drain_rate / 10, then 100 per second
+    assert times[-1] - times[0] >= 0.4
+
+
+def test_telemetry_is_downsampled_while_offline(broker, publisher):
+    broker.stop()
+    wait_for(lambda: not publisher.is_connected)
+    for number in range(100):
+        publisher.publish_telemetry(b"%d" % number)
+    assert publisher.spool.spooled == 10
+
+    def telemetry():
+        return [p for _, topic, p in broker.received if topic == "ac/telemetry"]
+
+    broker.start()
+    wait_for(lambda: len(telemetry()) == 10)
+    assert telemetry() == [b"%d" % number for number in range(9, 100, 10)]
+
+
+def test_delta_telemetry_rebuilds_after_an_outage(broker, publisher):
+    encoder = DeltaEncoder(keyframe_interval=0)
+    publisher.on_keyframe_request = encoder.request_keyframe
+    sink = MqttSink(publisher, delta=True)
+    message = telemetry_message()
+
+    def send(count: int) -> None:
+        for _ in range(count):
+            message["physics_info"]["gas"] += 1.0
+            delta = encoder.encode(message)
+            sink.send("telemetry", json.dumps(delta).encode())
+        sink.send("event", json.dumps({"message_type": "event_change"}).encode())
+
+    send(5)
+    broker.stop()
+    wait_for(lambda: not publisher.is_connected)
+    send(30)
+    # Only the event is spooled
+    assert publisher.spool.spooled == 1
+    broker.start()
+    wait_for(lambda: publisher.is_connected)
+    send(5)
+    wait_for(lambda: len(broker.received) == 13)
+
+    reconstructor = FrameReconstructor()
+    frames = [
+        reconstructor.apply(json.loads(payload))
+        for _, topic, payload in broker.received
+        if topic == "ac/telemetry"
+    ]
+    assert reconstructor.gaps == 0
+    assert None not in frames
+    assert frames[-1]["physics_info"]["gas"] == message["physics_info"]["gas"]
+
+
+def test_subscribers_get_matching_messages(broker):
+    received = []
+    subscribed = threading.Event()
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_subscribe = lambda *args: subscribed.set()
+    client.on_message = lambda c, u, message: received.append(message.topic)
+    client.connect(broker.host, broker.port)
+    client.loop_start()
+    try:
+        client.subscribe("ac/telemetry/+/wheels")
+        assert subscribed.wait(5.0)
+        broker.publish("ac/telemetry/physics/wheels", b"1")
+        broker.publish("ac/telemetry/physics/motion", b"2")
+        broker.publish("ac/events", b"3")
+        wait_for(lambda: received)
+        time.sleep(0.1)
+        assert received == ["ac/telemetry/physics/wheels"]
+    finally:
+        client.loop_stop()
+        client.disconnect()
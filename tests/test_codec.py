@@ -0,0 +1,121 @@
+import copy
+import json
+import math
+import random
+
+import pytest
+
+from benchmarks.bench_hotpath import load_fixtures
+from src.codec import (
+    FLAG_TAGGED,
+    HEADER,
+    TELEMETRY_SCHEMA,
+    DeltaEncoder,
+    FrameReconstructor,
+    _compile_rounding,
+    compile_quantizer,
+    decode_message,
+    encode_message,
+)
+from src.pyacsharedmemory import decode_graphics, decode_physics
+
+
+def telemetry_message() -> dict:
+    pages = load_fixtures()
+    physics = decode_physics(pages["physics"])
+    graphics = decode_graphics(pages["graphics"])
+    return {
+        "message_type": "telemetry",
+        "frame_tag": [physics.packed_id, graphics.packet_id],
+        "graphics_info": graphics.to_dict(),
+        "physics_info": physics.to_dict(),
+    }
+
+
+def test_frame_tag_round_trip():
+    message = telemetry_message()
+    message["frame_tag"] = [2**31 - 1, 7]
+    payload = encode_message(message)
+    assert payload[4] & FLAG_TAGGED
+    assert decode_message(payload)["frame_tag"] == [2**31 - 1, 7]
+
+
+def test_untagged_messages_decode():
+    message = telemetry_message()
+    del message["frame_tag"]
+    payload = encode_message(message)
+    assert not payload[4] & FLAG_TAGGED
+    assert "frame_tag" not in decode_message(payload)
+
+
+def test_deltas_keep_the_frame_tag():
+    encoder = DeltaEncoder(keyframe_interval=10)
+    reconstructor = FrameReconstructor()
+    message = telemetry_message()
+    for packet_id in range(1, 4):
+        message["frame_tag"] = [packet_id, 1]
+        payload = encode_message(encoder.encode(message))
+        frame = reconstructor.apply(decode_message(payload))
+        assert frame["frame_tag"] == [packet_id, 1]
+
+
+@pytest.mark.parametrize("interval", [0, None])
+def test_keyframes_only_on_request_without_interval(interval):
+    encoder = DeltaEncoder(keyframe_interval=interval)
+    message = telemetry_message()
+    keyframes = [encoder.encode(message)["keyframe"] for _ in range(5)]
+    encoder.request_keyframe()
+    keyframes.append(encoder.encode(message)["keyframe"])
+    assert keyframes == [True, False, False, False, False, True]
+
+
+def test_negative_keyframe_interval_is_rejected():
+    with pytest.raises(ValueError):
+        DeltaEncoder(keyframe_interval=-1)
+
+
+def test_partial_messages_are_tagged():
+    message = {
+        "message_type": "telemetry",
+        "frame_tag": [5, 6],
+        "physics_info": {"gas": 0.5},
+    }
+    payload = encode_message(message)
+    assert HEADER.unpack_from(payload)[5] == 1
+    assert decode_message(payload) == message
+
+
+def test_vectorized_rounding_matches_per_value_rounding():
+    rules = {"wheel_slip": {"significant": 4}, "speed_kmh": {"decimals": 1}}
+    quantize = compile_quantizer({"decimals": 3}, rules)
+    per_value = _compile_rounding(
+        [
+            (path, rules.get(path[1], {"decimals": 3}))
+            for path, kind, _ in TELEMETRY_SCHEMA.leaves
+            if kind == "f"
+        ]
+    )
+
+    rng = random.Random(3)
+    specials = [0.0, -0.0, 0.0005, -2.5e-3, 1e13, -3.4e38, math.inf, math.nan]
+    for _ in range(50):
+        message = telemetry_message()
+        for path, kind, _ in TELEMETRY_SCHEMA.leaves:
+            if kind == "f":
+                node = message
+                for key in path[:-1]:
+                    node = node[key]
+                node[path[-1]] = rng.choice(
+                    specials + [rng.uniform(-500, 500), rng.gauss(0, 1e-3)]
+                )
+        expected = per_value(copy.deepcopy(message))
+        assert json.dumps(quantize(message)) == json.dumps(expected)
+
+
+def test_rounding_skips_missing_channels():
+    quantize = compile_quantizer({"decimals": 2})
+    message = {
+        "message_type": "telemetry",
+        "physics_info": {"speed_kmh": 12.3456, "gear": 3},
+    }
+    assert quantize(message)["physics_info"] == {"speed_kmh": 12.35, "gear": 3}
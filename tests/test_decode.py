@@ -0,0 +1,454 @@
+"""
+The struct-layout decoders against the field-by-field readers they
+replaced (kept here as of the baseline), on the benchmark fixtures and
+on random pages.
+"""
+
+import dataclasses
+import enum
+import random
+import struct
+
+import pytest
+
+from benchmarks.bench_hotpath import load_fixtures
+from src.pyacsharedmemory import (
+    PHYSICS_PAGE_SIZE,
+    GRAPHICS_PAGE_SIZE,
+    STATIC_PAGE_SIZE,
+    GRAPHICS_LAYOUT,
+    PHYSICS_LAYOUT,
+    CarDamage,
+    CompactPhysics,
+    ContactPoint,
+    GraphicsMap,
+    PhysicsMap,
+    StaticsMap,
+    Vector3f,
+    Wheels,
+    acSM,
+    compile_fields,
+    decode_graphics,
+    decode_physics,
+    decode_static,
+    read_graphics_map,
+    read_physic_map,
+    read_static_map,
+)
+import src.pyacsharedmemory as pages
+from src.schemas import AC_FLAG_TYPE, AC_SESSION_TYPE, AC_STATUS
+
+
+def legacy_read_physic_map(physic_map: acSM) -> PhysicsMap:
+    physic_map.seek(0)
+    temp = {
+        "packetID": physic_map.unpack_value("i"),
+        "gas": physic_map.unpack_value("f"),
+        "brake": physic_map.unpack_value("f"),
+        "fuel": physic_map.unpack_value("f"),
+        "gear": physic_map.unpack_value("i"),
+        "rpm": physic_map.unpack_value("i"),
+        "steerAngle": physic_map.unpack_value("f"),
+        "speedKmh": physic_map.unpack_value("f"),
+        "velocity": physic_map.unpack_array("f", 3),
+        "accG": physic_map.unpack_array("f", 3),
+        "wheelSlip": physic_map.unpack_array("f", 4),
+        "wheelLoad": physic_map.unpack_array("f", 4),
+        "wheelsPressure": physic_map.unpack_array("f", 4),
+        "wheelAngularSpeed": physic_map.unpack_array("f", 4),
+        "tyreWear": physic_map.unpack_array("f", 4),
+        "tyreDirtyLevel": physic_map.unpack_array("f", 4),
+        "tyreCoreTemperature": physic_map.unpack_array("f", 4),
+        "camberRAD": physic_map.unpack_array("f", 4),
+        "suspensionTravel": physic_map.unpack_array("f", 4),
+        "drs": physic_map.unpack_value("f"),
+        "tc": physic_map.unpack_value("f"),
+        "heading": physic_map.unpack_value("f"),
+        "pitch": physic_map.unpack_value("f"),
+        "roll": physic_map.unpack_value("f"),
+        "cgHeight": physic_map.unpack_value("f"),
+        "carDamage": physic_map.unpack_array("f", 5),
+        "numberOfTyresOut": physic_map.unpack_value("i"),
+        "pitLimiterOn": physic_map.unpack_value("i"),
+        "abs": physic_map.unpack_value("f"),
+        "kersCharge": physic_map.unpack_value("f"),
+        "kersInput": physic_map.unpack_value("f"),
+        "autoshifterOn": physic_map.unpack_value("i"),
+        "rideHeight": physic_map.unpack_array("f", 2),
+        "turboBoost": physic_map.unpack_value("f"),
+        "ballast": physic_map.unpack_value("f"),
+        "airDensity": physic_map.unpack_value("f"),
+        "airTemp": physic_map.unpack_value("f"),
+        "roadTemp": physic_map.unpack_value("f"),
+        "localAngularVel": physic_map.unpack_array("f", 3),
+        "FinalFF": physic_map.unpack_value("f"),
+        "performanceMeter": physic_map.unpack_value("f"),
+        "engineBrake": physic_map.unpack_value("i"),
+        "ersRecoveryLevel": physic_map.unpack_value("i"),
+        "ersPowerLevel": physic_map.unpack_value("i"),
+        "ersHeatCharging": physic_map.unpack_value("i"),
+        "ersIsCharging": physic_map.unpack_value("i"),
+        "kersCurrentKJ": physic_map.unpack_value("f"),
+        "drsAvailable": physic_map.unpack_value("i"),
+        "drsEnabled": physic_map.unpack_value("i"),
+        "brakeTemp": physic_map.unpack_array("f", 4),
+        "clutch": physic_map.unpack_value("f"),
+        "tyreTempI": physic_map.unpack_array("f", 4),
+        "tyreTempM": physic_map.unpack_array("f", 4),
+        "tyreTempO": physic_map.unpack_array("f", 4),
+        "isAIControlled": physic_map.unpack_value("i"),
+        "tyreContactPoint": physic_map.unpack_array2D("f", 4, 3),
+        "tyreContactNormal": physic_map.unpack_array2D("f", 4, 3),
+        "tyreContactHeading": physic_map.unpack_array2D("f", 4, 3),
+        "brakeBias": physic_map.unpack_value("f"),
+        "localVelocity": physic_map.unpack_array("f", 3),
+    }
+
+    return PhysicsMap(
+        temp["packetID"],
+        temp["gas"],
+        temp["brake"],
+        temp["fuel"],
+        temp["gear"],
+        temp["rpm"],
+        temp["steerAngle"],
+        temp["speedKmh"],
+        Vector3f(*temp["velocity"]),
+        Vector3f(*temp["accG"]),
+        Wheels(*temp["wheelSlip"]),
+        Wheels(*temp["wheelsPressure"]),
+        Wheels(*temp["wheelAngularSpeed"]),
+        Wheels(*temp["tyreCoreTemperature"]),
+        Wheels(*temp["suspensionTravel"]),
+        temp["drs"],
+        temp["tc"],
+        temp["heading"],
+        temp["pitch"],
+        temp["roll"],
+        CarDamage(*temp["carDamage"]),
+        bool(temp["pitLimiterOn"]),
+        temp["abs"],
+        bool(temp["autoshifterOn"]),
+        temp["turboBoost"],
+        temp["airTemp"],
+        temp["roadTemp"],
+        Vector3f(*temp["localAngularVel"]),
+        temp["FinalFF"],
+        Wheels(*temp["brakeTemp"]),
+        temp["clutch"],
+        bool(temp["isAIControlled"]),
+        ContactPoint.from_list(temp["tyreContactPoint"]),
+        ContactPoint.from_list(temp["tyreContactNormal"]),
+        ContactPoint.from_list(temp["tyreContactHeading"]),
+        temp["brakeBias"],
+        Vector3f(*temp["localVelocity"]),
+    )
+
+
+def legacy_read_graphics_map(graphic_map: acSM) -> GraphicsMap:
+    graphic_map.seek(0)
+    temp = {
+        "packetID": graphic_map.unpack_value("i"),
+        "status": AC_STATUS(graphic_map.unpack_value("i")),
+        "session": AC_SESSION_TYPE(graphic_map.unpack_value("i")),
+        "currentTime": graphic_map.unpack_string(15),
+        "lastTime": graphic_map.unpack_string(15),
+        "bestTime": graphic_map.unpack_string(15),
+        "split": graphic_map.unpack_string(15),
+        "completedLaps": graphic_map.unpack_value("i"),
+        "position": graphic_map.unpack_value("i"),
+        "iCurrentTime": graphic_map.unpack_value("i"),
+        "iLastTime": graphic_map.unpack_value("i"),
+        "iBestTime": graphic_map.unpack_value("i"),
+        "sessionTimeLeft": graphic_map.unpack_value("f"),
+        "distanceTraveled": graphic_map.unpack_value("f"),
+        "isInPit": graphic_map.unpack_value("i"),
+        "currentSectorIndex": graphic_map.unpack_value("i"),
+        "lastSectorTime": graphic_map.unpack_value("i"),
+        "numberOfLaps": graphic_map.unpack_value("i"),
+        # TyreCompound (33 chars). Usually need padding=2 if it's UTF-16
+        "tyreCompound": graphic_map.unpack_string(33, padding=2),
+        "replayTimeMultiplier": graphic_map.unpack_value("f"),
+        "normalizedCarPosition": graphic_map.unpack_value("f"),
+        # CarCoordinates (3 floats)
+        "carCoordinates": graphic_map.unpack_array("f", 3),
+        "penaltyTime": graphic_map.unpack_value("f"),
+        "flag": AC_FLAG_TYPE(graphic_map.unpack_value("i")),
+        "idealLineOn": graphic_map.unpack_value("i"),
+        # (since 1.5) IsInPitLane, SurfaceGrip
+        "isInPitLane": graphic_map.unpack_value("i"),
+        "surfaceGrip": graphic_map.unpack_value("f"),
+        # (since 1.13) MandatoryPitDone
+        "mandatoryPitDone": graphic_map.unpack_value("i"),
+    }
+
+    return GraphicsMap(
+        packet_id=temp["packetID"],
+        status=temp["status"],
+        session_type=temp["session"],
+        current_time_str=temp["currentTime"],
+        last_time_str=temp["lastTime"],
+        best_time_str=temp["bestTime"],
+        split_str=temp["split"],
+        completed_laps=temp["completedLaps"],
+        position=temp["position"],
+        i_current_time=temp["iCurrentTime"],
+        i_last_time=temp["iLastTime"],
+        i_best_time=temp["iBestTime"],
+        session_time_left=temp["sessionTimeLeft"],
+        distance_traveled=temp["distanceTraveled"],
+        is_in_pit=bool(temp["isInPit"]),
+        current_sector_index=temp["currentSectorIndex"],
+        last_sector_time=temp["lastSectorTime"],
+        number_of_laps=temp["numberOfLaps"],
+        tyre_compound=temp["tyreCompound"],
+        replay_time_multiplier=temp["replayTimeMultiplier"],
+        normalized_car_position=temp["normalizedCarPosition"],
+        car_coordinates=Vector3f(*temp["carCoordinates"]),
+        penalty_time=temp["penaltyTime"],
+        flag=temp["flag"],
+        ideal_line_on=bool(temp["idealLineOn"]),
+        is_in_pit_lane=bool(temp["isInPitLane"]),
+        surface_grip=temp["surfaceGrip"],
+        mandatory_pit_done=bool(temp["mandatoryPitDone"]),
+    )
+
+
+def legacy_read_static_map(static_map: acSM) -> StaticsMap:
+    static_map.seek(0)
+
+    temp = {
+        "smVersion": static_map.unpack_string(15),
+        "acVersion": static_map.unpack_string(15),
+        "numberOfSessions": static_map.unpack_value("i"),
+        "numCars": static_map.unpack_value("i"),
+        "carModel": static_map.unpack_string(33),
+        "track": static_map.unpack_string(33),
+        "playerName": static_map.unpack_string(33),
+        "playerSurname": static_map.unpack_string(33),
+        "playerNick": static_map.unpack_string(33, 2),
+        "sectorCount": static_map.unpack_value("i"),
+        "maxTorque": static_map.unpack_value("f"),
+        "maxPower": static_map.unpack_value("f"),
+        "maxRpm": static_map.unpack_value("i"),
+        "maxFuel": static_map.unpack_value("f"),
+        "suspensionMaxTravel": static_map.unpack_array("f", 4),
+        "tyreRadius": static_map.unpack_array("f", 4),
+        "maxTurboBoost": static_map.unpack_value("f"),
+        "deprecated_1": static_map.unpack_value("f"),
+        "deprecated_2": static_map.unpack_value("f"),
+        "penaltiesEnabled": static_map.unpack_value("i"),
+        "aidFuelRate": static_map.unpack_value("f"),
+        "aidTireRate": static_map.unpack_value("f"),
+        "aidMechanicalDamage": static_map.unpack_value("f"),
+        "AllowTyreBlankets": static_map.unpack_value("i"),
+        "aidStability": static_map.unpack_value("f"),
+        "aidAutoClutch": static_map.unpack_value("i"),
+        "aidAutoBlip": static_map.unpack_value("i"),
+        "hasDRS": static_map.unpack_value("i"),
+        "hasERS": static_map.unpack_value("i"),
+        "hasKERS": static_map.unpack_value("i"),
+        "kersMaxJ": static_map.unpack_value("f"),
+        "engineBrakeSettingsCount": static_map.unpack_value("i"),
+        "ersPowerControllerCount": static_map.unpack_value("i"),
+        "trackSplineLength": static_map.unpack_value("f"),
+        "trackConfiguration": static_map.unpack_string(15, 2),
+        "ersMaxJ": static_map.unpack_value("f"),
+        "isTimedRace": static_map.unpack_value("i"),
+        "hasExtraLap": static_map.unpack_value("i"),
+        "carSkin": static_map.unpack_string(33, 2),
+        "reversedGridPositions": static_map.unpack_value("i"),
+        "PitWindowStart": static_map.unpack_value("i"),
+        "PitWindowEnd": static_map.unpack_value("i"),
+    }
+    return StaticsMap(
+        sm_version=temp["smVersion"],
+        ac_version=temp["acVersion"],
+        number_of_session=temp["numberOfSessions"],
+        num_cars=temp["numCars"],
+        car_model=temp["carModel"],
+        track=temp["track"],
+        player_name=temp["playerName"],
+        player_surname=temp["playerSurname"],
+        player_nick=temp["playerNick"],
+        sector_count=temp["sectorCount"],
+        max_torque=temp["maxTorque"],
+        max_power=temp["maxPower"],
+        max_rpm=temp["maxRpm"],
+        max_fuel=temp["maxFuel"],
+        suspension_max_travel=temp["suspensionMaxTravel"],
+        tyre_radius=temp["tyreRadius"],
+        max_turbo_boost=temp["maxTurboBoost"],
+        penalty_enabled=bool(temp["penaltiesEnabled"]),
+        aid_fuel_rate=temp["aidFuelRate"],
+        aid_tyre_rate=temp["aidTireRate"],
+        aid_mechanical_damage=temp["aidMechanicalDamage"],
+        allow_tyre_blankets=temp["AllowTyreBlankets"],
+        aid_stability=temp["aidStability"],
+        aid_auto_clutch=bool(temp["aidAutoClutch"]),
+        aid_auto_blip=temp["aidAutoBlip"],
+        has_drs=temp["hasDRS"],
+        has_ers=temp["hasERS"],
+        has_kers=temp["hasKERS"],
+        ker_max_joules=temp["kersMaxJ"],
+        engine_brake_settings_count=temp["engineBrakeSettingsCount"],
+        ers_power_controller_count=temp["ersPowerControllerCount"],
+        track_sp_line_length=temp["trackSplineLength"],
+        track_configuration=temp["trackConfiguration"],
+        ers_max_j=temp["ersMaxJ"],
+        is_timed_race=temp["isTimedRace"],
+        has_extra_lap=temp["hasExtraLap"],
+        car_skin=temp["carSkin"],
+        reversed_grid_positions=temp["reversedGridPositions"],
+        pit_window_start=temp["PitWindowStart"],
+        pit_window_end=temp["PitWindowEnd"],
+    )
+
+
+LEGACY_READERS = {
+    "physics": (legacy_read_physic_map, decode_physics, read_physic_map),
+    "graphics": (legacy_read_graphics_map, decode_graphics, read_graphics_map),
+    "static": (legacy_read_static_map, decode_static, read_static_map),
+}
+PAGE_SIZES = {
+    "physics": PHYSICS_PAGE_SIZE,
+    "graphics": GRAPHICS_PAGE_SIZE,
+    "static": STATIC_PAGE_SIZE,
+}
+GRAPHICS_FIELDS = compile_fields(GRAPHICS_LAYOUT)
+# Graphics enums: random values have to be valid members
+ENUM_FIELDS = (
+    ("status", AC_STATUS),
+    ("session", AC_SESSION_TYPE),
+    ("flag", AC_FLAG_TYPE),
+)
+
+
+def page_map(data: bytes) -> acSM:
+    page = acSM(-1, len(data))
+    page[:] = data
+    return page
+
+
+def strip_nulls(obj):
+    # The legacy readers kept the NULs of strings, the decoders strip them
+    changes = {
+        field.name: getattr(obj, field.name).replace("\x00", "")
+        for field in dataclasses.fields(obj)
+        if isinstance(getattr(obj, field.name), str)
+    }
+    return dataclasses.replace(obj, **changes)
+
+
+def random_page(name: str, rng: random.Random) -> bytes:
+    data = bytearray(rng.randbytes(PAGE_SIZES[name]))
+    if name == "graphics":
+        for field, enum_type in ENUM_FIELDS:
+            value = rng.choice(list(enum_type)).value
+            struct.pack_into("=i", data, GRAPHICS_FIELDS[field][1], value)
+    return bytes(data)
+
+
+def assert_same(name: str, data: bytes) -> None:
+    legacy, decode, read = LEGACY_READERS[name]
+    expected = strip_nulls(legacy(page_map(data)))
+    # repr() compares NaNs from random bytes as equal, and types as well
+    assert repr(decode(data)) == repr(expected)
+    assert repr(read(page_map(data))) == repr(expected)
+
+
+@pytest.mark.parametrize("name", list(LEGACY_READERS))
+def test_fixtures_match_legacy_readers(name):
+    assert_same(name, load_fixtures()[name])
+
+
+@pytest.mark.parametrize("name", list(LEGACY_READERS))
+def test_random_pages_match_legacy_readers(name):
+    rng = random.Random(name)
+    for _ in range(200):
+        assert_same(name, random_page(name, rng))
+
+
+def test_decoders_accept_offsets():
+    physics = load_fixtures()["physics"]
+    assert decode_physics(b"\x00" * 16 + physics, 16) == decode_physics(physics)
+
+
+def test_compact_physics_compares_equal_to_decoded_frames():
+    raw = load_fixtures()["physics"]
+    frame = CompactPhysics.from_buffer(raw)
+    physics = decode_physics(raw)
+    assert frame == physics
+    assert frame.to_dict() == physics.to_dict()
+    assert frame.velocity == physics.velocity
+    assert physics.wheel_slip == frame.wheel_slip
+    assert frame.car_damage == physics.car_damage
+    assert frame.tyre_contact_point == physics.tyre_contact_point
+    assert frame.velocity != physics.wheel_slip
+
+    changed = bytearray(raw)
+    offset = compile_fields(PHYSICS_LAYOUT)["speedKmh"][1]
+    struct.pack_into("=f", changed, offset, physics.speed_kmh + 1)
+    assert CompactPhysics(bytes(changed)) != physics
+    assert CompactPhysics(bytes(changed)) != frame
+
+
+def flat_values(value) -> list:
+    # Decoded value as the flat list of numbers stored in the page
+    if dataclasses.is_dataclass(value):
+        return [
+            item
+            for field in dataclasses.fields(value)
+            for item in flat_values(getattr(value, field.name))
+        ]
+    if isinstance(value, enum.Enum):
+        return [value.value]
+    if isinstance(value, (list, tuple)):
+        return [item for element in value for item in flat_values(element)]
+    return [value]
+
+
+def same_number(a, b) -> bool:
+    return a == b or (a != a and b != b)
+
+
+@pytest.mark.parametrize(
+    "name, dtype_name, fields, size",
+    [
+        ("physics", "PHYSICS_DTYPE", "PHYSICS_FIELDS", 800),
+        ("graphics", "GRAPHICS_DTYPE", "GRAPHICS_FIELDS", 1588),
+        ("static", "STATIC_DTYPE", "STATIC_FIELDS", 784),
+    ],
+)
+def test_structured_views_match_decoders(name, dtype_name, fields, size):
+    np = pytest.importorskip("numpy")
+    dtype = getattr(pages, dtype_name)
+    assert dtype.itemsize == size == PAGE_SIZES[name]
+
+    decode = LEGACY_READERS[name][1]
+    rng = random.Random(dtype_name)
+    for data in [load_fixtures()[name]] + [random_page(name, rng) for _ in range(20)]:
+        view = np.frombuffer(data, dtype=dtype, count=1)[0]
+        decoded = decode(data)
+        for field, page_name, converter in getattr(pages, fields):
+            value = getattr(decoded, field)
+            raw = view[page_name]
+            if isinstance(value, str):
+                expected = value
+                actual = raw.tobytes().decode("utf-16", "ignore").replace("\x00", "")
+                assert actual == expected, field
+            elif converter is bool:
+                assert bool(raw) == value, field
+            else:
+                actual = np.asarray(raw).ravel().tolist()
+                expected = flat_values(value)
+                assert len(actual) == len(expected), field
+                assert all(map(same_number, actual, expected)), field
+
+    view = np.frombuffer(load_fixtures()["physics"], dtype=pages.PHYSICS_DTYPE)[0]
+    physics = decode_physics(load_fixtures()["physics"])
+    assert view["speedKmh"] == np.float32(physics.speed_kmh)
+    assert view["tyreContactPoint"].shape == (4, 3)
+    assert view["tyreContactPoint"][3, 2] == np.float32(
+        physics.tyre_contact_point.rear_right.z
+    )
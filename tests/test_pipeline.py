@@ -0,0 +1,40 @@
+from src.metrics import Metrics
+from src.pipeline import Pipeline
+from src.sinks import Fanout, Sink
+
+
+class FlakySink(Sink):
+    """
+    Raises on every other payload, OSError or a programming error.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, kind, payload, stamp=None):
+        count = len(self.sent)
+        self.sent.append(payload)
+        if count % 4 == 1:
+            raise OSError("network unreachable")
+        if count % 4 == 3:
+            raise KeyError("bug")
+
+
+def test_sink_worker_survives_failing_sends():
+    metrics = Metrics()
+    sink = FlakySink()
+    pipeline = Pipeline(
+        Fanout([sink]),
+        lambda kind, item: [(kind, item, None)],
+        metrics=metrics,
+    )
+    pipeline.start()
+    for index in range(8):
+        pipeline.submit("event", {"message_type": "event_change", "index": index})
+    pipeline.close()
+
+    assert len(sink.sent) == 8
+    worker = pipeline.workers[0]
+    assert worker.failures == 4
+    assert worker.processed == 8
+    assert 'send_failures_total{sink="FlakySink"} 4' in metrics.render()
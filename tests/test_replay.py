@@ -0,0 +1,23 @@
+import os
+
+from src.replay import create_forwarder
+from src.sources import MemorySource
+from src.utils import Config
+
+
+def test_replays_are_not_recorded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = {
+        "output.save": True,
+        "mqtt.enabled": False,
+        "udp.enabled": False,
+        "metrics.port": None,
+    }
+    with Config().override(settings):
+        forwarder = create_forwarder(MemorySource())
+        try:
+            assert forwarder.recorder is None
+        finally:
+            forwarder.cleanup()
+        assert Config().get("output.save") is True
+    assert os.listdir(tmp_path) == []
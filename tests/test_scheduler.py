@@ -0,0 +1,27 @@
+from src.scheduler import JITTER_SAMPLES, TickScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        # Always wakes up 10us late
+        self.now += seconds + 1e-5
+
+
+def test_jitter_stays_bounded_without_stats_reads():
+    clock = FakeClock()
+    scheduler = TickScheduler(spin=0.0, clock=clock, sleep=clock.sleep)
+    scheduler.add("physics", 1000)
+    for _ in range(JITTER_SAMPLES + 500):
+        assert scheduler.wait() == ["physics"]
+    assert len(scheduler.streams["physics"].jitter) == JITTER_SAMPLES
+
+    stats = scheduler.stats()["physics"]
+    assert stats["ticks"] == JITTER_SAMPLES + 500
+    assert round(stats["jitter_max_us"]) == 10
+    assert len(scheduler.streams["physics"].jitter) == 0
@@ -0,0 +1,14 @@
+import pytest
+
+from src.topics import TopicGroups
+
+
+@pytest.mark.parametrize("rate", [0, -5, None, "10"])
+def test_invalid_group_rates_are_rejected(rate):
+    with pytest.raises(ValueError, match="wheels"):
+        TopicGroups({"wheels": {"rate": rate, "physics": ["wheel_slip"]}})
+
+
+def test_rate_defaults_to_10_hz():
+    groups = TopicGroups({"wheels": {"physics": ["wheel_slip"]}})
+    assert groups.groups[0].period == pytest.approx(0.1)